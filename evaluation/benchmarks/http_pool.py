@@ -0,0 +1,90 @@
+"""
+Benchmark the shared HTTP pool: embedding calls against a local OpenAI-compatible server, with a
+new OpenAIEmbeddings (and so a new connection) per call, as before, and with the cached embedding
+model of an LLM on the shared keep-alive pool.
+
+    python evaluation/benchmarks/http_pool.py --calls 400 --threads 16
+
+The server is plain HTTP on localhost, so only the TCP connection setup is saved here; against the
+real API every new connection also pays a TLS handshake.
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_openai import OpenAIEmbeddings
+
+from py_nl2sql.models.llm import LLM
+
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        payload = json.dumps({
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": [0.1, 0.2, 0.3]} for i in range(len(texts))],
+            "model": body["model"],
+            "usage": {"prompt_tokens": 1, "total_tokens": 1},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(embed, calls: int, threads: int) -> dict:
+    def timed(i):
+        start = time.perf_counter()
+        embed(f"question {i}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = sorted(executor.map(timed, range(calls)))
+    return {
+        "wall": time.perf_counter() - start,
+        "mean": statistics.mean(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    kwargs = {"api_key": "sk-bench", "base_url": base_url, "check_embedding_ctx_length": False}
+
+    def fresh_client(text):
+        return OpenAIEmbeddings(**kwargs).embed_query(text)
+
+    llm = LLM(api_key="sk-bench", base_url=base_url, embedding_kwargs={"check_embedding_ctx_length": False})
+
+    def shared_pool(text):
+        return llm.embedding_model.embed_query(text)
+
+    for name, embed in (("client per call", fresh_client), ("shared pool", shared_pool)):
+        embed("warm up")
+        result = measure(embed, args.calls, args.threads)
+        print(f"{name:>16}: wall {result['wall']:.2f}s, mean {result['mean'] * 1000:.1f}ms, "
+              f"p95 {result['p95'] * 1000:.1f}ms per call")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark per-table vs bulk schema reflection of SQLDatabase.get_table_summaries on a synthetic schema.
+
+    python evaluation/benchmarks/schema_reflection.py --tables 3000
+    python evaluation/benchmarks/schema_reflection.py --url "mysql+pymysql://root:@127.0.0.1:3306/bench" --create --tables 3000
+
+SQLite has no native bulk reflection, so it only shows the harness; run it against MySQL or
+PostgreSQL to see the catalog round trips drop from 3 per table to a handful.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, create_engine, event
+
+from py_nl2sql.relational_database.sql_database import SQLDatabase
+
+
+def create_schema(url: str, tables: int, columns: int):
+    engine = create_engine(url)
+    metadata = MetaData()
+    for i in range(tables):
+        table = Table(
+            f"bench_t{i}",
+            metadata,
+            Column("id", Integer, primary_key=True),
+            *[Column(f"c{j}", String(32), comment=f"column {j}") for j in range(columns)],
+            comment=f"synthetic table {i}",
+        )
+        Index(f"bench_t{i}_c0", table.c.c0)
+    metadata.create_all(engine)
+    engine.dispose()
+
+
+def count_statements(db: SQLDatabase):
+    counter = {"statements": 0}
+
+    def before_cursor_execute(*args, **kwargs):
+        counter["statements"] += 1
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    return counter
+
+
+def run(url: str):
+    template = "{table_name}({columns})"
+
+    db = SQLDatabase.from_uri(url, lazy_table_reflection=True)
+    counter = count_statements(db)
+    start = time.perf_counter()
+    per_table = {name: db._parse_table_summary(template, name) for name in db.get_usable_table_names()}
+    print(f"per-table: {len(per_table)} tables, {counter['statements']} statements, {time.perf_counter() - start:.2f}s")
+
+    db = SQLDatabase.from_uri(url, lazy_table_reflection=True)
+    counter = count_statements(db)
+    start = time.perf_counter()
+    bulk = db.get_table_summaries()
+    print(f"bulk:      {len(bulk)} tables, {counter['statements']} statements, {time.perf_counter() - start:.2f}s")
+
+    if bulk != per_table:
+        print("warning: bulk and per-table summaries differ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="database URL, defaults to a temporary SQLite file")
+    parser.add_argument("--create", action="store_true", help="create the synthetic tables in --url first")
+    parser.add_argument("--tables", type=int, default=2000)
+    parser.add_argument("--columns", type=int, default=8)
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+        args.create = True
+    if args.create:
+        create_schema(url, args.tables, args.columns)
+    run(url)
@@ -0,0 +1,113 @@
+"""
+Benchmark NL2SQLWorkflow offline: record the OpenAI traffic of a few questions once, then replay
+it with a synthetic latency and report the stage timings, with no network access.
+
+    OPENAI_API_KEY=... python evaluation/benchmarks/workflow_replay.py --record
+    python evaluation/benchmarks/workflow_replay.py --latency 0.4 --jitter 0.2 --runs 5
+
+Embedding requests send raw texts (no tiktoken), so replaying needs no downloads either.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import text
+
+from py_nl2sql.models.llm import LLM
+from py_nl2sql.models.replay import recording_clients, replaying_clients
+from py_nl2sql.relational_database.sql_database import SQLDatabase
+from py_nl2sql.vector_database.faiss_wrapper import FaissWrapper
+from py_nl2sql.workflow import NL2SQLWorkflow
+
+# same embedding requests when recording and replaying, without tiktoken downloading its encodings
+EMBEDDING_KWARGS = {"check_embedding_ctx_length": False}
+
+QUESTIONS = [
+    "How many customers are there in each country?",
+    "What is the total amount of orders placed in 2024?",
+    "Which product has the highest price?",
+]
+SAMPLE_SQL = [
+    "SELECT country, COUNT(*) FROM customers GROUP BY country",
+    "SELECT SUM(amount) FROM orders WHERE strftime('%Y', ordered_at) = '2024'",
+    "SELECT name FROM products ORDER BY price DESC LIMIT 1",
+]
+
+
+def create_db() -> SQLDatabase:
+    # a file, an in-memory SQLite database is private to the thread that opened it
+    uri = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    db = SQLDatabase.from_uri(uri)
+    with db.engine.begin() as connection:
+        connection.execute(text("CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, country TEXT)"))
+        connection.execute(text("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, price REAL)"))
+        connection.execute(text(
+            "CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER, product_id INTEGER, "
+            "amount REAL, ordered_at TEXT)"
+        ))
+        connection.execute(text("INSERT INTO customers (name, country) VALUES ('a', 'FR'), ('b', 'CN'), ('c', 'FR')"))
+        connection.execute(text("INSERT INTO products (name, price) VALUES ('pen', 1.5), ('book', 12.0)"))
+        connection.execute(text(
+            "INSERT INTO orders (customer_id, product_id, amount, ordered_at) "
+            "VALUES (1, 2, 12.0, '2024-03-01'), (2, 1, 3.0, '2024-05-02')"
+        ))
+    return SQLDatabase.from_uri(uri)
+
+
+def create_instance(llm: LLM):
+    db = create_db()
+    return SimpleNamespace(
+        db=db,
+        summary_index=FaissWrapper(text_chunks=db.get_db_summary(), embedding=llm.embedding_model),
+        sql_example_index=FaissWrapper(text_chunks=SAMPLE_SQL, embedding=llm.embedding_model),
+    )
+
+
+async def run_once(llm: LLM, instance) -> dict:
+    timings = []
+    for question in QUESTIONS:
+        workflow = NL2SQLWorkflow(instance, question, llm, auto_run=False)
+        await workflow.aget_response()
+        timings.append(workflow.stage_timings)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cassette", default=os.path.join(os.path.dirname(__file__), "workflow_replay.jsonl"))
+    parser.add_argument("--record", action="store_true", help="call OpenAI and record the cassette")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every replayed response takes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds per replayed response")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.record:
+        if os.path.exists(args.cassette):
+            os.remove(args.cassette)
+        llm = LLM(embedding_kwargs=EMBEDDING_KWARGS, **recording_clients(args.cassette))
+        asyncio.run(run_once(llm, create_instance(llm)))
+        print(f"recorded {args.cassette}")
+        return
+
+    llm = LLM(api_key="replay", embedding_kwargs=EMBEDDING_KWARGS,
+              **replaying_clients(args.cassette, latency=args.latency, jitter=args.jitter, seed=0))
+    instance = create_instance(llm)
+    walls, stages = [], {}
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        for timing in asyncio.run(run_once(llm, instance)):
+            for name, seconds in timing.items():
+                stages.setdefault(name, []).append(seconds)
+        walls.append(time.perf_counter() - start)
+    print(f"{len(QUESTIONS)} questions x {args.runs} runs, latency {args.latency}s + jitter {args.jitter}s")
+    print(f"run wall time: median {statistics.median(walls):.3f}s")
+    for name, seconds in stages.items():
+        print(f"  {name:<16} median {statistics.median(seconds):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
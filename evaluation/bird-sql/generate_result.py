@@ -1,6 +1,6 @@
 import json
 
-from py_nl2sql.workflow import NL2SQLWorkflow
+from py_nl2sql.batch import NL2SQLBatch
 from py_nl2sql.db_instance import DBInstance
 from py_nl2sql.models.llm import LLM
 
@@ -22,14 +22,13 @@ with open("./mini_dev_mysql.json", "r") as file:
 results = {}
 print()
 
-for index, item in enumerate(data[:30]):
-    question = item["question"]
+items = data[:30]
+batch = NL2SQLBatch(instance, llm, concurrency=8, checkpoint_path="results-all.checkpoint.jsonl")
+for item, batch_result in zip(items, batch.run(item["question"] for item in items)):
     db_id = item["db_id"]
-    service = NL2SQLWorkflow(instance, question, llm)
-    final_sql_query = service.final_sql_query
-    result = f"{final_sql_query}\t----- bird -----\t{db_id}"
+    result = f"{batch_result.sql}\t----- bird -----\t{db_id}"
     print(result)
-    results.update({f"{index}": result})
+    results.update({f"{batch_result.index}": result})
 
 with open("results-all.json", "w") as outfile:
     json.dump(results, outfile, ensure_ascii=False, indent=4)
@@ -1,6 +1,7 @@
-from .models.llm import LLM
+from .models.llm import LLM, AsyncLLM
 from .workflow import NL2SQLWorkflow
 from .db_instance import DBInstance
+from .batch import NL2SQLBatch
 
 
-__all__ = ["NL2SQLWorkflow", "LLM", "DBInstance"]
+__all__ = ["NL2SQLWorkflow", "LLM", "AsyncLLM", "DBInstance", "NL2SQLBatch"]
@@ -0,0 +1,160 @@
+"""
+Author: pillar
+Date: 2026-10-17
+Description: NL2SQLBatch class for answering many questions against one DBInstance with batched retrieval,
+    bounded LLM concurrency and a resumable JSONL checkpoint.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from py_nl2sql.constants.type import BatchResult
+from py_nl2sql.db_instance import DBInstance
+from py_nl2sql.models.llm import LLM, AsyncLLM
+from py_nl2sql.workflow import NL2SQLWorkflow
+
+logger = logging.getLogger(__name__)
+
+
+class NL2SQLBatch:
+    """
+    Run NL2SQLWorkflow over many questions. Questions are processed in chunks: the table
+    summaries and the sample SQL of a whole chunk are retrieved with one embedding request and
+    one vector search each, and the LLM stages of the chunk run concurrently.
+    """
+
+    def __init__(
+            self,
+            db_instance: DBInstance,
+            llm: Union[LLM, AsyncLLM],
+            need_similarity_sql: bool = True,
+            with_answer: bool = False,
+            concurrency: int = 8,
+            chunk_size: int = 64,
+            checkpoint_path: Optional[str] = None,
+            **workflow_kwargs,
+    ):
+        """
+        :param with_answer: also run the SQL and ask the LLM for the answer, otherwise stop at the final SQL.
+        :param concurrency: LLM stages in flight at once, keep it within the rate limit of the account.
+        :param chunk_size: questions retrieved together; results are emitted chunk by chunk, in order.
+        :param checkpoint_path: JSONL file receiving every result. Questions already answered in it
+            are not run again, so a crashed run resumes where it stopped. A result is reused only for
+            the same question at the same index, so editing the question list does not return stale answers.
+        :param workflow_kwargs: passed on to every NL2SQLWorkflow, e.g. result_format.
+        """
+        self.db_instance = db_instance
+        self.llm = llm
+        self.need_similarity_sql = need_similarity_sql and bool(getattr(db_instance, "sql_example_index", None))
+        self.with_answer = with_answer
+        self.concurrency = max(concurrency, 1)
+        self.chunk_size = max(chunk_size, 1)
+        self.checkpoint_path = checkpoint_path
+        self.workflow_kwargs = workflow_kwargs
+
+    def _load_checkpoint(self) -> Dict[Tuple[int, str], BatchResult]:
+        """Successful results already in the checkpoint, by question index and text."""
+        done = {}
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return done
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = BatchResult(**json.loads(line))
+                except (ValueError, TypeError):
+                    continue  # a line cut short by a crash
+                if result.error is None:
+                    done[(result.index, result.question)] = result
+        logger.info(f"resuming from {len(done)} results in {self.checkpoint_path}")
+        return done
+
+    async def _run_chunk(self, chunk: List[tuple], semaphore: asyncio.Semaphore) -> List[BatchResult]:
+        questions = [question for _, question in chunk]
+        related = await asyncio.to_thread(self.db_instance.summary_index.search_many, questions, 8)
+        workflows = [
+            NL2SQLWorkflow(
+                self.db_instance,
+                question,
+                self.llm,
+                need_similarity_sql=self.need_similarity_sql,
+                auto_run=False,
+                precomputed={"related_table_summary": related_tables},
+                **self.workflow_kwargs,
+            )
+            for question, related_tables in zip(questions, related)
+        ]
+        errors: Dict[int, str] = {}
+
+        async def run_stage(i: int, stage: str):
+            if i in errors:
+                return
+            async with semaphore:
+                try:
+                    await workflows[i].arun_stage(stage)
+                except Exception as e:
+                    logger.warning(f"question {chunk[i][0]} failed at {stage}: {e}")
+                    errors[i] = f"{type(e).__name__}: {e}"
+
+        await asyncio.gather(*(run_stage(i, "first_sql") for i in range(len(chunk))))
+
+        if self.need_similarity_sql:
+            ok = [i for i in range(len(chunk)) if i not in errors]
+            similar = await asyncio.to_thread(
+                self.db_instance.sql_example_index.search_many, [workflows[i].first_sql_query for i in ok], 5
+            )
+            for i, similarity_sql in zip(ok, similar):
+                workflows[i].inject({"similarity_sql": similarity_sql})
+
+        await asyncio.gather(*(run_stage(i, "answer" if self.with_answer else "final_sql") for i in range(len(chunk))))
+
+        return [
+            BatchResult(
+                index=index,
+                question=question,
+                sql=workflow.final_sql_query if i not in errors else None,
+                answer=workflow.answer if i not in errors else None,
+                error=errors.get(i),
+                usage=workflow.usage.summary(),
+            )
+            for i, ((index, question), workflow) in enumerate(zip(chunk, workflows))
+        ]
+
+    async def arun(self, questions: Iterable[str]) -> AsyncIterator[BatchResult]:
+        """Yield one result per question, in the order of `questions`."""
+        done = self._load_checkpoint()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        checkpoint = open(self.checkpoint_path, "a", encoding="utf-8") if self.checkpoint_path else None
+        try:
+            numbered = enumerate(questions)
+            while True:
+                chunk = list(itertools.islice(numbered, self.chunk_size))
+                if not chunk:
+                    break
+                todo = [item for item in chunk if item not in done]
+                results = {result.index: result for result in await self._run_chunk(todo, semaphore)} if todo else {}
+                if checkpoint:
+                    for result in results.values():
+                        checkpoint.write(result.model_dump_json() + "\n")
+                    checkpoint.flush()
+                for item in chunk:
+                    yield done[item] if item in done else results[item[0]]
+        finally:
+            if checkpoint:
+                checkpoint.close()
+
+    def run(self, questions: Iterable[str]) -> Iterator[BatchResult]:
+        """Blocking arun, drives a private event loop and yields the results as they come."""
+        loop = asyncio.new_event_loop()
+        results = self.arun(questions)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(results.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(results.aclose())
+            loop.close()
@@ -5,7 +5,7 @@ Description: prompts
 Note: Different languages should use prompts that are appropriate for that language.
 """
 from pydantic import BaseModel
-from typing import List
+from typing import Any, Dict, List, Literal, Optional
 from enum import Enum
 
 
@@ -37,6 +37,32 @@ class GenerateSampleSQLResponse(BaseModel):
     sql_list: List[str]
 
 
+class AnswerMetadata(BaseModel):
+    sql: Optional[str] = None
+    sql_result: Optional[str] = None
+    error: Optional[str] = None
+    row_count: Optional[int] = None
+    execution_time: Optional[float] = None
+    stage_timings: Dict[str, float] = {}
+    usage: Optional[Dict[str, Any]] = None
+
+
+class AnswerEvent(BaseModel):
+    """Event of a streamed answer: one "metadata" event first, then "token" events."""
+    type: Literal["metadata", "token"]
+    metadata: Optional[AnswerMetadata] = None
+    token: Optional[str] = None
+
+
+class BatchResult(BaseModel):
+    index: int
+    question: str
+    sql: Optional[str] = None
+    answer: Optional[str] = None
+    error: Optional[str] = None
+    usage: Optional[Dict[str, Any]] = None
+
+
 class LLMModel(str, Enum):
     Default = "gpt-4o-mini"
     GPT_latest = "chatgpt-4o-latest"
@@ -1,14 +1,17 @@
 import os
 import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from py_nl2sql.constants.prompts import CREATE_SAMPLE_SQL_FROM_TABLE
 from py_nl2sql.constants.type import GenerateSampleSQLResponse
 from py_nl2sql.relational_database.sql_factory import create_rdb
 from py_nl2sql.vector_database.faiss_wrapper import FaissWrapper
+from py_nl2sql.vector_database.embedding_store import EmbeddingStore
 from py_nl2sql.utilities.db_state_machine import NL2SQLStateMachine, NL2SQLState
 from py_nl2sql.utilities.decorators import db_singleton
-from typing import Optional, Dict
+from py_nl2sql.utilities.usage import UsageLedger, usage_scope
+from typing import Optional, Dict, Iterable, List
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -32,7 +35,17 @@ class DBInstance:
             db_user: Optional[str] = None,
             db_password: Optional[str] = None,
             need_sql_sample: bool = False,
+            sample_sql_concurrency: int = 8,
+            embedding_store: Optional[EmbeddingStore] = None,
+            schema_snapshot_path: Optional[str] = None,
     ):
+        """
+        :param sample_sql_concurrency: maximum number of sample SQL requests in flight while building
+            the sample SQL index, keep it within the rate limit of the LLM account.
+        :param embedding_store: shared embedding cache, so restarts only embed new summaries and sample SQL.
+        :param schema_snapshot_path: file caching the reflected schema, restarts skip reflection while
+            the catalog is unchanged.
+        """
         self.db_type = db_type or os.getenv("LOCAL_DB_TYPE")
         self.db_name = db_name or os.getenv("LOCAL_DB_NAME")
         self.db_host = db_host or os.getenv("LOCAL_DB_HOST")
@@ -47,13 +60,22 @@ class DBInstance:
             db_port=self.db_port,
             db_user=self.db_user,
             db_password=self.db_password,
+            snapshot_path=schema_snapshot_path,
         )
 
         self.llm = llm  # init LLM model
-        self.db_summary = self.get_db_summary()
-        self.summary_index = FaissWrapper(text_chunks=self.db_summary, embedding=self.llm.embedding_model)
+        self.usage = UsageLedger()  # tokens and cost of every LLM call made for this database, by stage
+        self.sample_sql_concurrency = sample_sql_concurrency
+        self.embedding_store = embedding_store
+        self.table_summaries = self.db.get_table_summaries()  # table name -> summary
+        self.db_summary = list(self.table_summaries.values())
+        self.sql_example_by_table: Dict[str, List[str]] = {}
+        self.sample_sql_errors: Dict[str, str] = {}  # table -> error of its last failed sample SQL generation
+        self.summary_index = FaissWrapper(text_chunks=self.db_summary, embedding=self.llm.embedding_model,
+                                          embedding_store=self.embedding_store)
         self.sql_example = need_sql_sample and llm and self._get_sql_example_llm()
-        self.sql_example_index = need_sql_sample and llm and FaissWrapper(text_chunks=self.sql_example, embedding=self.llm.embedding_model)
+        self.sql_example_index = need_sql_sample and llm and FaissWrapper(text_chunks=self.sql_example, embedding=self.llm.embedding_model,
+                                                                           embedding_store=self.embedding_store)
 
         # init state machine
         self.db_key = (self.db_type, self.db_name)
@@ -72,17 +94,48 @@ class DBInstance:
 
     def _get_sql_example_llm(self):
         """Get SQL example: ⚠️ Call LLM as many times as there are tables, should collect and organize representative SQL query examples to proxy each LLM generation"""
-
-        table_info = self.db.get_table_info()
-        table_info_list = table_info.split("\n\n\n")
-        sample_sql = []
-
-        for table in table_info_list:
-            response = self.llm.get_structured_response(CREATE_SAMPLE_SQL_FROM_TABLE.format(table_info=table),
-                                                        response_format=GenerateSampleSQLResponse)
-            sample_sql.extend(response["sql_list"])
-
-        return sample_sql
+        self.sql_example_by_table = self._generate_sql_examples(self.db.get_usable_table_names())
+        return [sql for sample_sql in self.sql_example_by_table.values() for sql in sample_sql]
+
+    def _generate_sql_examples(self, table_names: Iterable[str]) -> Dict[str, List[str]]:
+        """Generate sample SQL of each table, keyed by table name in the given order.
+
+        Tables are processed concurrently, with at most `sample_sql_concurrency` requests in flight.
+        A table whose generation fails gets no sample SQL and its error is kept in `sample_sql_errors`
+        until a later generation succeeds.
+        """
+        table_names = list(table_names)
+        total = len(table_names)
+        table_sample_sql = {table_name: [] for table_name in table_names}
+        log_every = max(total // 10, 1)
+
+        with ThreadPoolExecutor(max_workers=max(self.sample_sql_concurrency, 1)) as executor:
+            futures = {executor.submit(self._generate_table_sample_sql, table_name): table_name for table_name in table_names}
+            for done, future in enumerate(as_completed(futures), 1):
+                table_name = futures[future]
+                try:
+                    table_sample_sql[table_name] = future.result()
+                    self.sample_sql_errors.pop(table_name, None)
+                except Exception as e:
+                    self.sample_sql_errors[table_name] = f"{type(e).__name__}: {e}"
+                    logger.error(f"Failed to generate sample SQL for table {table_name}: {e}")
+                if done % log_every == 0 or done == total:
+                    logger.info(f"Generated sample SQL for {done}/{total} tables of {self.db_name}")
+
+        failed = [table_name for table_name in table_names if table_name in self.sample_sql_errors]
+        if failed:
+            logger.warning(f"No sample SQL for {len(failed)}/{total} tables of {self.db_name}: {', '.join(failed)}, "
+                           f"see sample_sql_errors")
+        return table_sample_sql
+
+    def _generate_table_sample_sql(self, table_name: str) -> List[str]:
+        with usage_scope(self.usage, stage="sample_sql"):
+            return self._generate_sample_sql(self.db.get_table_info([table_name]))
+
+    def _generate_sample_sql(self, table_info: str):
+        response = self.llm.get_structured_response(CREATE_SAMPLE_SQL_FROM_TABLE.format(table_info=table_info),
+                                                    response_format=GenerateSampleSQLResponse)
+        return response["sql_list"]
 
     def db_update(self):
         """Notify the state machine of a database update."""
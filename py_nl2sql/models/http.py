@@ -0,0 +1,112 @@
+"""
+Author: pillar
+Date: 2026-10-17
+Description: Process-wide pooled httpx clients shared by every LLM, embedding and pre-retrieval request,
+    so connections are kept alive and TLS handshakes are paid once per host instead of once per client.
+"""
+import asyncio
+import importlib.util
+import logging
+import threading
+import weakref
+from dataclasses import dataclass, replace
+from typing import Callable, Generic, Optional, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class HTTPSettings:
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0  # seconds an idle connection stays in the pool
+    timeout: float = 60.0  # read, write and pool timeout of a request, in seconds
+    connect_timeout: float = 10.0
+    http2: bool = True  # only used when the h2 package is installed
+
+
+class LoopLocal(Generic[T]):
+    """
+    One value per asyncio event loop, built on first use in that loop. Pooled async connections
+    belong to the loop that opened them, so async clients cannot be shared across loops.
+    Code running outside any loop shares a single value.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self.factory = factory
+        self._values: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, T]" = weakref.WeakKeyDictionary()
+        self._default: Optional[T] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            if loop is None:
+                if self._default is None:
+                    self._default = self.factory()
+                return self._default
+            value = self._values.get(loop)
+            if value is None:
+                value = self._values[loop] = self.factory()
+            return value
+
+
+_settings = HTTPSettings()
+_lock = threading.Lock()
+_client: Optional[httpx.Client] = None
+
+
+def _client_kwargs() -> dict:
+    http2 = _settings.http2 and importlib.util.find_spec("h2") is not None
+    return {
+        "limits": httpx.Limits(
+            max_connections=_settings.max_connections,
+            max_keepalive_connections=_settings.max_keepalive_connections,
+            keepalive_expiry=_settings.keepalive_expiry,
+        ),
+        "timeout": httpx.Timeout(_settings.timeout, connect=_settings.connect_timeout),
+        "http2": http2,
+        "follow_redirects": True,
+    }
+
+
+_async_clients: LoopLocal[httpx.AsyncClient] = LoopLocal(lambda: httpx.AsyncClient(**_client_kwargs()))
+
+
+def configure_http(**settings) -> HTTPSettings:
+    """
+    Change the pool settings, e.g. configure_http(max_connections=200, http2=False). Clients handed
+    out before keep their settings, LLMs created afterwards get new clients.
+
+    :param settings: fields of HTTPSettings.
+    """
+    global _settings, _client, _async_clients
+    with _lock:
+        _settings = replace(_settings, **settings)
+        _client = None
+        _async_clients = LoopLocal(lambda: httpx.AsyncClient(**_client_kwargs()))
+    if _settings.http2 and importlib.util.find_spec("h2") is None:
+        logger.info("h2 is not installed, the shared HTTP clients use HTTP/1.1; `pip install httpx[http2]` enables HTTP/2")
+    return _settings
+
+
+def shared_http_client() -> httpx.Client:
+    """The process-wide sync client."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = httpx.Client(**_client_kwargs())
+    return _client
+
+
+def shared_async_http_client() -> httpx.AsyncClient:
+    """The async client of the running event loop."""
+    return _async_clients.get()
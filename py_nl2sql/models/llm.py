@@ -6,39 +6,218 @@ Note: Different languages should use prompts that are appropriate for that langu
 """
 
 import json
+import logging
+import time
 
+import httpx
 from langchain_openai import OpenAIEmbeddings
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
 from py_nl2sql.constants.type import LLMModel
+from py_nl2sql.models.http import LoopLocal, shared_async_http_client, shared_http_client
+from py_nl2sql.models.rate_limit import RETRYABLE_ERRORS, RateLimiter, shared_rate_limiter
+from py_nl2sql.models.router import Endpoint, ModelRouter
+from py_nl2sql.utilities.cache import BaseCache, make_cache_key
 from py_nl2sql.utilities.tools import batch_image_to_base64
+from py_nl2sql.utilities.tracing import get_tracer, traced
+from py_nl2sql.utilities.usage import UsageLedger, current_stage, estimate_tokens, record_usage
+
+logger = logging.getLogger(__name__)
+
+# completion tokens reserved from the tokens-per-minute budget until a response reports its usage
+COMPLETION_TOKENS_ESTIMATE = 256
+
+
+def _request_tokens(prompt: str) -> int:
+    return estimate_tokens(prompt) + COMPLETION_TOKENS_ESTIMATE
+
+
+def _response_cache_key(model: str, query: str, response_format=None) -> str:
+    """Cache key of a chat completion: model, prompt and the JSON schema of the response format."""
+    schema = response_format.model_json_schema() if response_format is not None else None
+    return make_cache_key(str(model), query, schema)
 
 
 class LLM:
-    def __init__(self, api_key: str = None, base_url: str = None):
+    def __init__(
+            self,
+            api_key: str = None,
+            base_url: str = None,
+            cache: Optional[BaseCache] = None,
+            http_client: Optional[httpx.Client] = None,
+            http_async_client: Optional[httpx.AsyncClient] = None,
+            embedding_kwargs: Optional[dict] = None,
+            usage_ledger: Optional[UsageLedger] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            router: Optional[ModelRouter] = None,
+    ):
+        """
+        :param cache: response cache consulted before every text and structured completion,
+            see py_nl2sql.utilities.cache.create_response_cache.
+        :param http_client: httpx client of the chat and embedding requests, e.g. from
+            py_nl2sql.models.replay.replaying_clients to run offline. By default the pooled client
+            shared by the whole process, see py_nl2sql.models.http.configure_http.
+        :param http_async_client: httpx client of the AsyncLLM and of the async embedding requests,
+            by default the shared pooled client of the running event loop.
+        :param embedding_kwargs: extra OpenAIEmbeddings arguments, e.g. check_embedding_ctx_length=False
+            to send texts without tiktoken, which downloads its encodings on first use.
+        :param usage_ledger: records the tokens of every completion of this LLM, besides the ledgers
+            of the current py_nl2sql.utilities.usage.usage_scope.
+        :param rate_limiter: limits, retries and adapts the concurrency of the chat requests; by default
+            the limiter shared by the whole process, see py_nl2sql.models.rate_limit.configure_rate_limit.
+        :param router: picks the model endpoint of each call from its pipeline stage, the stage of
+            the current usage_scope unless given. Without it every call uses LLMModel.Default.
+        """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
-        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)  # temporarily using openai service
+        self.http_client = http_client or shared_http_client()
+        self.http_async_client = http_async_client
+        self.embedding_kwargs = embedding_kwargs or {}
+        self.usage_ledger = usage_ledger
+        self.rate_limiter = rate_limiter or shared_rate_limiter()
+        # retries are left to the rate limiter, which also slows down on 429
+        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url, http_client=self.http_client,
+                             max_retries=0)  # temporarily using openai service
+        self.cache = cache
+        self.router = router
+        self._endpoint_clients: Dict[str, OpenAI] = {}
+        self._async_llm: Optional["AsyncLLM"] = None
+        self._embedding_model: Optional[OpenAIEmbeddings] = None
+
+    def _account(self, model: str, usage, reserved_tokens: int) -> None:
+        """Record the usage of a response and correct the tokens reserved from the rate limiter."""
+        record_usage(model, usage, self.usage_ledger)
+        if usage is not None:
+            self.rate_limiter.settle(reserved_tokens, usage.total_tokens)
+
+    def _cache_model(self, model: Optional[str], stage: Optional[str]) -> str:
+        """Model part of the response cache key; routed calls share the cache of their route."""
+        if model is not None or self.router is None:
+            return model or LLMModel.Default.value
+        return f"route:{self.router.route_name(stage or current_stage())}"
+
+    def _endpoint_client(self, endpoint: Endpoint) -> OpenAI:
+        if endpoint.api_key is None and endpoint.base_url is None:
+            return self.client
+        client = self._endpoint_clients.get(endpoint.key)
+        if client is None:
+            client = self._endpoint_clients[endpoint.key] = OpenAI(
+                api_key=endpoint.api_key or self.api_key, base_url=endpoint.base_url or self.base_url,
+                http_client=self.http_client, max_retries=0,
+            )
+        return client
+
+    def _call(self, create: Callable[[OpenAI, str], Any], tokens: int, model: Optional[str],
+              stage: Optional[str]) -> Tuple[Any, str]:
+        """
+        Run `create(client, model)` through the rate limiter, return the response and the model used.
+        Without an explicit model, the router orders the endpoints of the stage and an endpoint
+        failing with a throttling, server or connection error hands the call over to the next one.
+        Other errors, e.g. a prompt too long, would fail on every endpoint and are raised at once.
+        """
+        endpoints = self.router.candidates(stage or current_stage()) if self.router and model is None else []
+        if not endpoints:
+            model = model or LLMModel.Default.value
+            return self.rate_limiter.call(lambda: create(self.client, model), tokens), model
+        for i, endpoint in enumerate(endpoints):
+            last = i == len(endpoints) - 1
+            client = self._endpoint_client(endpoint)
+            start = time.perf_counter()
+
+            def attempt(client=client, model=endpoint.model):
+                # only the last attempt is timed, not the retries and rate limit waits before it
+                nonlocal start
+                start = time.perf_counter()
+                return create(client, model)
+
+            try:
+                # a failing endpoint is not retried while another one can take the call
+                response = self.rate_limiter.call(attempt, tokens, max_retries=None if last else 0)
+            except RETRYABLE_ERRORS as e:
+                self.router.record(endpoint, time.perf_counter() - start, ok=False)
+                if last:
+                    raise
+                logger.warning(f"{endpoint.key} failed ({type(e).__name__}), falling back to {endpoints[i + 1].key}")
+                continue
+            self.router.record(endpoint, time.perf_counter() - start, ok=True)
+            return response, endpoint.model
+
+    @traced("llm.get_response")
+    def get_response(self, query: str, model: Optional[str] = None, stage: Optional[str] = None):
+        cache_key = _response_cache_key(self._cache_model(model, stage), query) if self.cache is not None else None
+        if cache_key and (cached := self.cache.get(cache_key)) is not None:
+            return cached
 
-    def get_response(self, query: str):
-        completion = self.client.chat.completions.create(
-            model=LLMModel.Default,
+        tokens = _request_tokens(query)
+        completion, model = self._call(lambda client, model: client.chat.completions.create(
+            model=model,
             messages=[
                 {"role": "user", "content": query},
             ],
-        )
-        return completion.choices[0].message.content
+        ), tokens, model, stage)
+        self._account(model, completion.usage, tokens)
+        content = completion.choices[0].message.content
+        if cache_key:
+            self.cache.set(cache_key, content)
+        return content
+
+    def stream_response(self, query: str, model: Optional[str] = None, stage: Optional[str] = None) -> Iterator[str]:
+        """Like get_response, but yield the answer piece by piece as the tokens arrive."""
+        cache_key = _response_cache_key(self._cache_model(model, stage), query) if self.cache is not None else None
+        if cache_key and (cached := self.cache.get(cache_key)) is not None:
+            yield cached
+            return
+
+        start, error = time.perf_counter(), None
+        try:
+            tokens = _request_tokens(query)
+            # only opening the stream is limited and retried, a stream failing midway is not replayed
+            stream, model = self._call(lambda client, model: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": query},
+                ],
+                stream=True,
+                stream_options={"include_usage": True},
+            ), tokens, model, stage)
+            pieces = []
+            for chunk in stream:
+                if chunk.usage is not None:  # the last chunk, without choices
+                    self._account(model, chunk.usage, tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    pieces.append(chunk.choices[0].delta.content)
+                    yield pieces[-1]
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # a generator cannot hold the current span across yields, the span is recorded once it is done
+            get_tracer().record("llm.stream_response", start, error=error)
+        if cache_key:
+            self.cache.set(cache_key, "".join(pieces))
 
-    def get_structured_response(self, query: str, response_format):
-        completion = self.client.beta.chat.completions.parse(
-            model=LLMModel.Default.value,
+    @traced("llm.get_structured_response")
+    def get_structured_response(self, query: str, response_format, model: Optional[str] = None,
+                                stage: Optional[str] = None):
+        cache_key = _response_cache_key(self._cache_model(model, stage), query, response_format) if self.cache is not None else None
+        if cache_key and (cached := self.cache.get(cache_key)) is not None:
+            return cached
+
+        tokens = _request_tokens(query)
+        completion, model = self._call(lambda client, model: client.beta.chat.completions.parse(
+            model=model,
             messages=[{"role": "user", "content": query}],
             response_format=response_format,
-        )
-        print(completion)
-        return json.loads(completion.choices[0].message.content)
+        ), tokens, model, stage)
+        self._account(model, completion.usage, tokens)
+        content = json.loads(completion.choices[0].message.content)
+        if cache_key:
+            self.cache.set(cache_key, content)
+        return content
 
-    def get_multimodal_response(self, query: str, contexts):
+    @traced("llm.get_multimodal_response")
+    def get_multimodal_response(self, query: str, contexts, model: Optional[str] = None):
         texts = contexts.get("texts", "")
         images = contexts.get("images", "")
         encoded_images = batch_image_to_base64(images)
@@ -56,14 +235,209 @@ class LLM:
         for item in encoded_images:
             messages.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{item}"}})
 
-        completion = self.client.chat.completions.create(
-            model=LLMModel.GPT_4o_mini,
+        tokens = _request_tokens(prompts)
+        completion, model = self._call(lambda client, model: client.chat.completions.create(
+            model=model,
             messages=[
                 {"role": "user", "content": messages},
             ],
-        )
+        ), tokens, model or LLMModel.GPT_4o_mini.value, None)
+        self._account(model, completion.usage, tokens)
         return completion.choices[0].message.content
 
     @property
-    def embedding_model(self):
-        return OpenAIEmbeddings(api_key=self.api_key, base_url=self.base_url)
+    def embedding_model(self) -> OpenAIEmbeddings:
+        """OpenAIEmbeddings on this LLM's HTTP clients, created on first access."""
+        if self._embedding_model is None:
+            self._embedding_model = OpenAIEmbeddings(api_key=self.api_key, base_url=self.base_url,
+                                                     http_client=self.http_client,
+                                                     http_async_client=self.http_async_client, **self.embedding_kwargs)
+        return self._embedding_model
+
+    @property
+    def async_llm(self) -> "AsyncLLM":
+        """AsyncLLM sharing this LLM's credentials, created on first access."""
+        if self._async_llm is None:
+            self._async_llm = AsyncLLM(api_key=self.api_key, base_url=self.base_url, cache=self.cache,
+                                       http_client=self.http_async_client, embedding_kwargs=self.embedding_kwargs,
+                                       usage_ledger=self.usage_ledger, rate_limiter=self.rate_limiter,
+                                       router=self.router)
+        return self._async_llm
+
+
+class AsyncLLM:
+    """asyncio-native counterpart of LLM, so one event loop can keep many requests in flight."""
+
+    def __init__(
+            self,
+            api_key: str = None,
+            base_url: str = None,
+            cache: Optional[BaseCache] = None,
+            http_client: Optional[httpx.AsyncClient] = None,
+            embedding_kwargs: Optional[dict] = None,
+            usage_ledger: Optional[UsageLedger] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            router: Optional[ModelRouter] = None,
+    ):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self.http_client = http_client
+        self.embedding_kwargs = embedding_kwargs or {}
+        self.usage_ledger = usage_ledger
+        self.rate_limiter = rate_limiter or shared_rate_limiter()
+        self.cache = cache
+        self.router = router
+        self._endpoint_clients: Dict[str, LoopLocal[AsyncOpenAI]] = {}
+        # pooled async connections belong to one event loop, so clients are made per loop
+        self._clients: LoopLocal[AsyncOpenAI] = LoopLocal(lambda: AsyncOpenAI(
+            api_key=self.api_key, base_url=self.base_url, http_client=self.http_client or shared_async_http_client(),
+            max_retries=0,
+        ))
+        self._embedding_models: LoopLocal[OpenAIEmbeddings] = LoopLocal(lambda: OpenAIEmbeddings(
+            api_key=self.api_key, base_url=self.base_url, http_client=shared_http_client(),
+            http_async_client=self.http_client or shared_async_http_client(), **self.embedding_kwargs
+        ))
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """AsyncOpenAI of the running event loop."""
+        return self._clients.get()
+
+    def _account(self, model: str, usage, reserved_tokens: int) -> None:
+        """Record the usage of a response and correct the tokens reserved from the rate limiter."""
+        record_usage(model, usage, self.usage_ledger)
+        if usage is not None:
+            self.rate_limiter.settle(reserved_tokens, usage.total_tokens)
+
+    def _cache_model(self, model: Optional[str], stage: Optional[str]) -> str:
+        """Model part of the response cache key; routed calls share the cache of their route."""
+        if model is not None or self.router is None:
+            return model or LLMModel.Default.value
+        return f"route:{self.router.route_name(stage or current_stage())}"
+
+    def _endpoint_client(self, endpoint: Endpoint) -> AsyncOpenAI:
+        if endpoint.api_key is None and endpoint.base_url is None:
+            return self.client
+        clients = self._endpoint_clients.get(endpoint.key)
+        if clients is None:
+            clients = self._endpoint_clients[endpoint.key] = LoopLocal(lambda: AsyncOpenAI(
+                api_key=endpoint.api_key or self.api_key, base_url=endpoint.base_url or self.base_url,
+                http_client=self.http_client or shared_async_http_client(), max_retries=0,
+            ))
+        return clients.get()
+
+    async def _acall(self, create: Callable[[AsyncOpenAI, str], Awaitable[Any]], tokens: int, model: Optional[str],
+                     stage: Optional[str]) -> Tuple[Any, str]:
+        """Awaitable LLM._call."""
+        endpoints = self.router.candidates(stage or current_stage()) if self.router and model is None else []
+        if not endpoints:
+            model = model or LLMModel.Default.value
+            return await self.rate_limiter.acall(lambda: create(self.client, model), tokens), model
+        for i, endpoint in enumerate(endpoints):
+            last = i == len(endpoints) - 1
+            client = self._endpoint_client(endpoint)
+            start = time.perf_counter()
+
+            async def attempt(client=client, model=endpoint.model):
+                # only the last attempt is timed, not the retries and rate limit waits before it
+                nonlocal start
+                start = time.perf_counter()
+                return await create(client, model)
+
+            try:
+                # a failing endpoint is not retried while another one can take the call
+                response = await self.rate_limiter.acall(attempt, tokens, max_retries=None if last else 0)
+            except RETRYABLE_ERRORS as e:
+                self.router.record(endpoint, time.perf_counter() - start, ok=False)
+                if last:
+                    raise
+                logger.warning(f"{endpoint.key} failed ({type(e).__name__}), falling back to {endpoints[i + 1].key}")
+                continue
+            self.router.record(endpoint, time.perf_counter() - start, ok=True)
+            return response, endpoint.model
+
+    @traced("llm.get_response")
+    async def get_response(self, query: str, model: Optional[str] = None, stage: Optional[str] = None):
+        cache_key = _response_cache_key(self._cache_model(model, stage), query) if self.cache is not None else None
+        if cache_key and (cached := self.cache.get(cache_key)) is not None:
+            return cached
+
+        tokens = _request_tokens(query)
+        completion, model = await self._acall(lambda client, model: client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "user", "content": query},
+            ],
+        ), tokens, model, stage)
+        self._account(model, completion.usage, tokens)
+        content = completion.choices[0].message.content
+        if cache_key:
+            self.cache.set(cache_key, content)
+        return content
+
+    async def stream_response(self, query: str, model: Optional[str] = None,
+                              stage: Optional[str] = None) -> AsyncIterator[str]:
+        """Like get_response, but yield the answer piece by piece as the tokens arrive."""
+        cache_key = _response_cache_key(self._cache_model(model, stage), query) if self.cache is not None else None
+        if cache_key and (cached := self.cache.get(cache_key)) is not None:
+            yield cached
+            return
+
+        start, error = time.perf_counter(), None
+        try:
+            tokens = _request_tokens(query)
+            # only opening the stream is limited and retried, a stream failing midway is not replayed
+            stream, model = await self._acall(lambda client, model: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": query},
+                ],
+                stream=True,
+                stream_options={"include_usage": True},
+            ), tokens, model, stage)
+            pieces = []
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    self._account(model, chunk.usage, tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    pieces.append(chunk.choices[0].delta.content)
+                    yield pieces[-1]
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            get_tracer().record("llm.stream_response", start, error=error)
+        if cache_key:
+            self.cache.set(cache_key, "".join(pieces))
+
+    @traced("llm.get_structured_response")
+    async def get_structured_response(self, query: str, response_format, model: Optional[str] = None,
+                                      stage: Optional[str] = None):
+        cache_key = _response_cache_key(self._cache_model(model, stage), query, response_format) if self.cache is not None else None
+        if cache_key and (cached := self.cache.get(cache_key)) is not None:
+            return cached
+
+        tokens = _request_tokens(query)
+        completion, model = await self._acall(lambda client, model: client.beta.chat.completions.parse(
+            model=model,
+            messages=[{"role": "user", "content": query}],
+            response_format=response_format,
+        ), tokens, model, stage)
+        self._account(model, completion.usage, tokens)
+        content = json.loads(completion.choices[0].message.content)
+        if cache_key:
+            self.cache.set(cache_key, content)
+        return content
+
+    @traced("embedding.embed_documents")
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embedding_model.aembed_documents(texts)
+
+    @traced("embedding.embed_query")
+    async def embed_query(self, text: str) -> List[float]:
+        return await self.embedding_model.aembed_query(text)
+
+    @property
+    def embedding_model(self) -> OpenAIEmbeddings:
+        """OpenAIEmbeddings of the running event loop."""
+        return self._embedding_models.get()
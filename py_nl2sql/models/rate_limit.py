@@ -0,0 +1,272 @@
+"""
+Author: pillar
+Date: 2026-10-17
+Description: Process-wide rate limiting of LLM requests: token buckets for requests and tokens per minute,
+    an AIMD concurrency limit reacting to throttling, and jittered retries of 429 and 5xx responses.
+    The same limiter serves threads and asyncio tasks.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds requested by the server through the Retry-After header, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Refills `rate_per_minute` units a minute up to `capacity`. A reservation takes its units at
+    once, possibly into debt, and says how long to wait before using them, so callers never wait
+    while holding the lock and later callers queue behind earlier ones.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` units, return the seconds to wait before they are available."""
+        amount = min(amount, self.capacity)  # larger requests would otherwise never fit
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            self._level -= amount
+            return -self._level / self.rate if self._level < 0 else 0.0
+
+    def refund(self, amount: float) -> None:
+        """Give back units reserved but not used; a negative amount takes units used beyond the reservation."""
+        with self._lock:
+            self._level = min(self.capacity, self._level + amount)
+
+
+class AIMDConcurrency:
+    """
+    Concurrency limit adjusted by additive increase, multiplicative decrease: every success adds
+    1/limit, so the limit grows by about one per round of requests; a throttled request multiplies
+    it by `decrease`, at most once per `cooldown` seconds so one burst of 429s counts once.
+    """
+
+    def __init__(self, initial: int = 16, minimum: int = 1, maximum: int = 256, decrease: float = 0.5,
+                 cooldown: float = 1.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._async_waiters: deque = deque()
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def _wake(self) -> None:
+        self._condition.notify_all()
+        while self._async_waiters:
+            loop, future = self._async_waiters.popleft()
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def acquire(self) -> None:
+        with self._condition:
+            while not self._try_acquire():
+                self._condition.wait()
+
+    async def aacquire(self) -> None:
+        while True:
+            with self._lock:
+                if self._try_acquire():
+                    return
+                loop = asyncio.get_running_loop()
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+            await future
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def on_success(self) -> None:
+        with self._lock:
+            before = int(self.limit)
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            if int(self.limit) > before:
+                self._wake()
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                logger.info(f"throttled, LLM concurrency lowered to {int(self.limit)}")
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """
+    Gate of LLM requests: the request and token buckets first, then concurrency, with retries. Waiting
+    for the buckets holds no concurrency slot, and the tokens of a failed attempt are given back.
+    """
+
+    def __init__(
+            self,
+            requests_per_minute: Optional[float] = None,
+            tokens_per_minute: Optional[float] = None,
+            concurrency: Optional[AIMDConcurrency] = None,
+            max_retries: int = 5,
+            base_delay: float = 0.5,
+            max_delay: float = 30.0,
+    ):
+        """
+        :param requests_per_minute: request limit of the account, None for no limit.
+        :param tokens_per_minute: token limit of the account, None for no limit. Each request
+            reserves its estimated prompt plus completion tokens.
+        :param concurrency: requests in flight at once, adapted to throttling. AIMDConcurrency() by default.
+        :param max_retries: retries of a request answered with 429, 5xx or a connection error.
+        :param max_delay: longest wait before a retry, also caps the Retry-After asked by the server.
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = concurrency or AIMDConcurrency()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _reserve(self, tokens: int) -> float:
+        delay = self.requests.reserve(1) if self.requests else 0.0
+        if self.tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        return delay
+
+    def _refund(self, tokens: int) -> None:
+        if self.tokens:
+            self.tokens.refund(tokens)
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Correct the token bucket once the actual usage of a request is known."""
+        if self.tokens and used != reserved:
+            self.tokens.refund(reserved - used)
+
+    def _retry_delay(self, error: Exception, attempt: int, max_retries: int) -> Optional[float]:
+        """Seconds before retrying after `error`, None when it must be raised."""
+        if isinstance(error, openai.RateLimitError):
+            self.concurrency.on_throttle()
+        if attempt >= max_retries:
+            return None
+        delay = min(self.max_delay, _retry_after(error) or self.base_delay * 2 ** attempt * random.uniform(0.5, 1.0))
+        logger.warning(f"LLM request failed ({type(error).__name__}), retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+        return delay
+
+    def call(self, func: Callable[[], T], tokens: int = 0, max_retries: Optional[int] = None) -> T:
+        """
+        Run `func` within the limits, retrying throttled and failed requests.
+
+        :param max_retries: overrides the limiter's, e.g. 0 when another endpoint can take the request.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            time.sleep(self._reserve(tokens))
+            self.concurrency.acquire()
+            try:
+                result = func()
+            except Exception as e:
+                self._refund(tokens)
+                if not isinstance(e, RETRYABLE_ERRORS):
+                    raise
+                error = e
+            else:
+                self.concurrency.on_success()
+                return result
+            finally:
+                self.concurrency.release()
+            delay = self._retry_delay(error, attempt, max_retries)
+            if delay is None:
+                raise error
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, func: Callable[[], Awaitable[T]], tokens: int = 0, max_retries: Optional[int] = None) -> T:
+        """Awaitable call, `func` returns the awaitable to run."""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._reserve(tokens))
+            await self.concurrency.aacquire()
+            try:
+                result = await func()
+            except Exception as e:
+                self._refund(tokens)
+                if not isinstance(e, RETRYABLE_ERRORS):
+                    raise
+                error = e
+            else:
+                self.concurrency.on_success()
+                return result
+            finally:
+                self.concurrency.release()
+            delay = self._retry_delay(error, attempt, max_retries)
+            if delay is None:
+                raise error
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+_limiter: Optional[RateLimiter] = None
+_lock = threading.Lock()
+
+
+def configure_rate_limit(**kwargs) -> RateLimiter:
+    """
+    Replace the process-wide limiter, e.g. configure_rate_limit(requests_per_minute=500,
+    tokens_per_minute=200_000). LLMs created before keep the previous one.
+
+    :param kwargs: RateLimiter arguments.
+    """
+    global _limiter
+    with _lock:
+        _limiter = RateLimiter(**kwargs)
+    return _limiter
+
+
+def shared_rate_limiter() -> RateLimiter:
+    """The process-wide limiter, without request or token limits until configured."""
+    global _limiter
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
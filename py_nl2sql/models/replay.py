@@ -0,0 +1,171 @@
+"""
+Author: pillar
+Date: 2026-10-17
+Description: httpx transports recording OpenAI requests to a cassette file and replaying them offline,
+    with synthetic latency, so the workflow can be benchmarked without network access.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+
+class CassetteMiss(LookupError):
+    """The replayed request was never recorded."""
+
+
+def _request_key(request: httpx.Request) -> str:
+    """Method, path and body of a request, with JSON bodies in canonical form."""
+    body = request.content
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    except ValueError:
+        pass
+    payload = request.method.encode("ascii") + b" " + request.url.raw_path + b"\n" + body
+    return hashlib.sha256(payload).hexdigest()
+
+
+class Cassette:
+    """
+    Recorded interactions in a JSONL file, one {"key", "status", "headers", "body"} object per line.
+    The same request recorded several times is replayed in recording order, the last one repeating.
+    """
+
+    # headers describing the body we store, the rest (dates, request ids, encodings) is dropped
+    KEPT_HEADERS = ("content-type", "retry-after")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._interactions: Dict[str, List[dict]] = defaultdict(list)
+        self._replayed: Dict[str, int] = defaultdict(int)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        interaction = json.loads(line)
+                        self._interactions[interaction["key"]].append(interaction)
+
+    def __len__(self):
+        return sum(len(interactions) for interactions in self._interactions.values())
+
+    def record(self, request: httpx.Request, response: httpx.Response) -> None:
+        interaction = {
+            "key": _request_key(request),
+            "method": request.method,
+            "url": str(request.url),
+            "status": response.status_code,
+            "headers": {name: value for name, value in response.headers.items() if name.lower() in self.KEPT_HEADERS},
+            "body": response.content.decode("utf-8"),
+        }
+        with self._lock:
+            self._interactions[interaction["key"]].append(interaction)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(interaction, ensure_ascii=False) + "\n")
+
+    def replay(self, request: httpx.Request) -> httpx.Response:
+        key = _request_key(request)
+        with self._lock:
+            interactions = self._interactions.get(key)
+            if not interactions:
+                raise CassetteMiss(f"No recorded response for {request.method} {request.url} in {self.path}")
+            interaction = interactions[min(self._replayed[key], len(interactions) - 1)]
+            self._replayed[key] += 1
+        return httpx.Response(
+            interaction["status"],
+            headers=interaction["headers"],
+            content=interaction["body"].encode("utf-8"),
+            request=request,
+        )
+
+
+class RecordTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Send requests over the network and record every response into the cassette."""
+
+    def __init__(
+            self,
+            cassette: Cassette,
+            transport: Optional[httpx.BaseTransport] = None,
+            async_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+        :param transport: transport actually sending the sync requests, httpx.HTTPTransport by default.
+        :param async_transport: transport actually sending the async requests, httpx.AsyncHTTPTransport by default.
+        """
+        self.cassette = cassette
+        self._transport = transport or httpx.HTTPTransport()
+        self._async_transport = async_transport or httpx.AsyncHTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = self._transport.handle_request(request)
+        response.read()
+        self.cassette.record(request, response)
+        return self._buffered(request, response)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self._async_transport.handle_async_request(request)
+        await response.aread()
+        self.cassette.record(request, response)
+        return self._buffered(request, response)
+
+    @staticmethod
+    def _buffered(request: httpx.Request, response: httpx.Response) -> httpx.Response:
+        # the content is already decoded, drop the headers describing the encoded body
+        headers = [(name, value) for name, value in response.headers.items()
+                   if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+        return httpx.Response(response.status_code, headers=headers, content=response.content, request=request)
+
+    def close(self) -> None:
+        self._transport.close()
+
+    async def aclose(self) -> None:
+        await self._async_transport.aclose()
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Answer requests from the cassette after a synthetic latency, without any network access."""
+
+    def __init__(self, cassette: Cassette, latency: float = 0.0, jitter: float = 0.0, seed: Optional[int] = None):
+        """
+        :param latency: seconds every response takes.
+        :param jitter: up to this many seconds are added at random to the latency.
+        :param seed: seed of the jitter, for reproducible runs.
+        """
+        self.cassette = cassette
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    def _delay(self) -> float:
+        return self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        time.sleep(self._delay())
+        return self.cassette.replay(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        await asyncio.sleep(self._delay())
+        return self.cassette.replay(request)
+
+
+def recording_clients(path: str) -> dict:
+    """http_client / http_async_client arguments of LLM that record into the cassette at `path`."""
+    transport = RecordTransport(Cassette(path))
+    return {"http_client": httpx.Client(transport=transport), "http_async_client": httpx.AsyncClient(transport=transport)}
+
+
+def replaying_clients(path: str, latency: float = 0.0, jitter: float = 0.0, seed: Optional[int] = None) -> dict:
+    """http_client / http_async_client arguments of LLM that replay the cassette at `path`."""
+    transport = ReplayTransport(Cassette(path), latency=latency, jitter=jitter, seed=seed)
+    return {"http_client": httpx.Client(transport=transport), "http_async_client": httpx.AsyncClient(transport=transport)}
@@ -0,0 +1,142 @@
+"""
+Author: pillar
+Date: 2026-10-17
+Description: ModelRouter class mapping pipeline stages to lists of model endpoints, sending each call to the
+    fastest healthy endpoint by rolling latency and error rate, with fallback to the next ones.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROUTE = "default"
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    """A model at a provider. api_key and base_url default to those of the LLM using the router."""
+    model: str
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
+    name: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        return self.name or f"{self.base_url or 'openai'}/{self.model}"
+
+
+class EndpointStats:
+    """Latency and outcome of the last `window` calls of an endpoint, and its circuit breaker."""
+
+    def __init__(self, window: int):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    @property
+    def latency(self) -> Optional[float]:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else None
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class ModelRouter:
+    """
+    Stage -> endpoints, e.g. {"final_sql": [Endpoint("gpt-4o")], "default": [Endpoint("gpt-4o-mini"),
+    Endpoint("moonshot-v1-8k", base_url="https://api.moonshot.cn/v1", api_key=...)]}. Stages without a
+    route use "default". The endpoints of a stage are alternatives: a call goes to the healthy one
+    with the lowest rolling latency, endpoints not measured yet first, and falls back to the others
+    in that order when it fails.
+
+    An endpoint is taken out for `cooldown` seconds after `failure_threshold` failures in a row, or
+    once more than `max_error_rate` of its last `window` calls failed; it is tried again afterwards
+    with a clean record. When every endpoint is out, they are still tried, least recently opened first.
+    """
+
+    def __init__(
+            self,
+            routes: Dict[str, List[Union[Endpoint, str, dict]]],
+            window: int = 50,
+            min_samples: int = 10,
+            max_error_rate: float = 0.5,
+            failure_threshold: int = 3,
+            cooldown: float = 30.0,
+    ):
+        """
+        :param routes: endpoints by stage name, given as Endpoint, model name or Endpoint keyword dict.
+        :param min_samples: calls needed before the error rate can take an endpoint out.
+        """
+        self.routes = {stage: [self._endpoint(item) for item in endpoints] for stage, endpoints in routes.items()}
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._stats: Dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _endpoint(item: Union[Endpoint, str, dict]) -> Endpoint:
+        if isinstance(item, Endpoint):
+            return item
+        if isinstance(item, str):
+            return Endpoint(model=item)
+        return Endpoint(**item)
+
+    def _stats_of(self, endpoint: Endpoint) -> EndpointStats:
+        stats = self._stats.get(endpoint.key)
+        if stats is None:
+            stats = self._stats[endpoint.key] = EndpointStats(self.window)
+        return stats
+
+    def route_name(self, stage: Optional[str]) -> str:
+        return stage if stage in self.routes else DEFAULT_ROUTE
+
+    def candidates(self, stage: Optional[str]) -> List[Endpoint]:
+        """Endpoints of the stage in the order to try them, empty when neither the stage nor "default" is routed."""
+        endpoints = self.routes.get(self.route_name(stage), [])
+        now = time.monotonic()
+        with self._lock:
+            stats = {endpoint.key: self._stats_of(endpoint) for endpoint in endpoints}
+        healthy = [endpoint for endpoint in endpoints if stats[endpoint.key].open_until <= now]
+        opened = [endpoint for endpoint in endpoints if stats[endpoint.key].open_until > now]
+
+        def speed(endpoint):
+            latency = stats[endpoint.key].latency
+            return -1.0 if latency is None else latency  # measure new endpoints first
+
+        return sorted(healthy, key=speed) + sorted(opened, key=lambda endpoint: stats[endpoint.key].open_until)
+
+    def record(self, endpoint: Endpoint, latency: float, ok: bool) -> None:
+        """Add the outcome of a call, opening the circuit of an endpoint that keeps failing."""
+        with self._lock:
+            stats = self._stats_of(endpoint)
+            stats.outcomes.append(ok)
+            if ok:
+                stats.latencies.append(latency)
+                stats.consecutive_failures = 0
+                return
+            stats.consecutive_failures += 1
+            too_many_errors = len(stats.outcomes) >= self.min_samples and stats.error_rate > self.max_error_rate
+            if stats.consecutive_failures >= self.failure_threshold or too_many_errors:
+                stats.open_until = time.monotonic() + self.cooldown
+                stats.outcomes.clear()
+                stats.latencies.clear()
+                stats.consecutive_failures = 0
+                logger.warning(f"endpoint {endpoint.key} is failing, taken out for {self.cooldown:.0f}s")
+
+    def report(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """Rolling latency, error rate and health by endpoint."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: {"latency": stats.latency, "error_rate": stats.error_rate, "healthy": stats.open_until <= now}
+                for key, stats in self._stats.items()
+            }
@@ -0,0 +1,212 @@
+"""
+Author: pillar
+Date: 2026-10-17
+Description: ColumnarResult class holding a query result as one array per column, with compact text renderings
+    and a local summary of large results for prompts.
+"""
+import csv
+import io
+from decimal import Decimal
+from typing import Any, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+
+def _to_array(values: Sequence[Any]) -> np.ndarray:
+    """
+    Numeric columns become int64/float64 arrays (NULL as nan), everything else an object array.
+    Integers beyond int64, e.g. unsigned BIGINT or NUMERIC, keep an object array.
+    """
+    non_null = [value for value in values if value is not None]
+    if non_null and all(isinstance(value, (int, float, Decimal)) and not isinstance(value, bool) for value in non_null):
+        if len(non_null) == len(values) and all(isinstance(value, int) for value in non_null):
+            try:
+                return np.array(values, dtype=np.int64)
+            except OverflowError:
+                pass
+        else:
+            return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _is_exact(values: Sequence[Any], array: np.ndarray) -> bool:
+    """Whether array.tolist() gives back `values`: not when NULLs became nan or ints and Decimals became floats."""
+    return array.dtype != np.float64 or all(type(value) is float for value in values)
+
+
+def _truncate(value: Any, length: int) -> str:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    text = str(value)
+    return text if len(text) <= length else text[:length] + "..."
+
+
+def _describe_column(array: np.ndarray, top_k: int, max_string_length: int) -> str:
+    if array.dtype != object:
+        values = array.astype(np.float64)
+        nulls = int(np.isnan(values).sum())
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return f"numeric, all {nulls} values null"
+        stats = (
+            f"min={values.min():.6g}, max={values.max():.6g}, mean={values.mean():.6g}, "
+            f"median={np.median(values):.6g}, std={values.std():.6g}, sum={values.sum():.6g}"
+        )
+        return f"numeric, {stats}, nulls={nulls}"
+
+    null_mask = np.equal(array, None)
+    nulls = int(null_mask.sum())
+    values = array[~null_mask].astype(str)
+    if not len(values):
+        return f"all {nulls} values null"
+    distinct, counts = np.unique(values, return_counts=True)
+    order = np.argsort(-counts, kind="stable")[:top_k]
+    top = ", ".join(f"{_truncate(distinct[i], max_string_length)!r} ({counts[i]})" for i in order)
+    return f"{len(distinct)} distinct, nulls={nulls}, top {len(order)}: {top}"
+
+
+class ColumnarResult:
+    """
+    Query result as column names plus one NumPy array per column, no per-row objects. Numeric
+    columns the arrays cannot hold exactly (NULLs, Decimals, ints mixed with floats) also keep
+    their original values, which the rendered rows use; the arrays serve the statistics.
+    """
+
+    def __init__(self, columns: List[str], arrays: List[np.ndarray], truncated: bool = False,
+                 originals: Optional[List[Optional[Sequence[Any]]]] = None):
+        """
+        :param columns: column names.
+        :param arrays: one array per column, all of the same length.
+        :param truncated: the query returned more rows than were fetched.
+        :param originals: per column, the original values when its array is not exact, else None.
+        """
+        self.columns = columns
+        self.arrays = arrays
+        self.truncated = truncated
+        self.originals = originals or [None] * len(arrays)
+
+    @classmethod
+    def from_batches(cls, columns: List[str], batches: Iterable[Sequence[Sequence[Any]]],
+                     max_rows: Optional[int] = None) -> "ColumnarResult":
+        """Build from row batches, transposing each batch once. Rows past `max_rows` mark the result truncated."""
+        values: List[List[Any]] = [[] for _ in columns]
+        rows = 0
+        truncated = False
+        for batch in batches:
+            if max_rows is not None and rows + len(batch) > max_rows:
+                batch = batch[:max_rows - rows]
+                truncated = True
+            for column_values, batch_values in zip(values, zip(*batch)):
+                column_values.extend(batch_values)
+            rows += len(batch)
+            if truncated:
+                break
+        arrays = [_to_array(column_values) for column_values in values]
+        originals = [None if _is_exact(column_values, array) else column_values
+                     for column_values, array in zip(values, arrays)]
+        return cls(columns, arrays, truncated, originals)
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.arrays[0]) if self.arrays else 0
+
+    def __len__(self):
+        return self.num_rows
+
+    def column(self, name: str) -> np.ndarray:
+        return self.arrays[self.columns.index(name)]
+
+    def to_arrow(self):
+        """The result as a pyarrow Table, requires pyarrow."""
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("pyarrow is required for to_arrow, install it with `pip install pyarrow`.")
+        return pa.table({
+            name: list(original) if original is not None else array.tolist() if array.dtype == object else array
+            for name, array, original in zip(self.columns, self.arrays, self.originals)
+        })
+
+    def _values(self) -> List[Sequence[Any]]:
+        """Per column, the values as the database returned them."""
+        return [array if original is None else original for array, original in zip(self.arrays, self.originals)]
+
+    def _rows(self, max_rows: int, max_columns: int, max_string_length: int):
+        columns = self.columns[:max_columns]
+        values = self._values()[:max_columns]
+        rows = [
+            [_truncate(column_values[i], max_string_length) for column_values in values]
+            for i in range(min(self.num_rows, max_rows))
+        ]
+        return columns, rows
+
+    def _notes(self, max_rows: int, max_columns: int) -> List[str]:
+        notes = []
+        if self.num_rows > max_rows or self.truncated:
+            total = f"{self.num_rows}+" if self.truncated else str(self.num_rows)
+            notes.append(f"showing {min(self.num_rows, max_rows)} of {total} rows")
+        if len(self.columns) > max_columns:
+            notes.append(f"showing {max_columns} of {len(self.columns)} columns")
+        return notes
+
+    def slice(self, start: Optional[int] = None, stop: Optional[int] = None) -> "ColumnarResult":
+        """Rows start:stop as a new result, the arrays are views."""
+        return ColumnarResult(self.columns, [array[start:stop] for array in self.arrays], originals=[
+            None if original is None else original[start:stop] for original in self.originals
+        ])
+
+    def to_tuples(self, max_string_length: int = 300) -> str:
+        """str() of the row tuples, the format `SQLDatabase.run` returns."""
+        values = [
+            [_truncate(value, max_string_length) if isinstance(value, str) else value for value in (
+                column_values.tolist() if isinstance(column_values, np.ndarray) else column_values
+            )]
+            for column_values in self._values()
+        ]
+        return str(list(zip(*values))) if self.num_rows else ""
+
+    def summary(self, top_k: int = 5, sample_rows: int = 5, max_string_length: int = 100) -> str:
+        """
+        Fixed-size description of the result: per-column statistics for numeric columns, distinct
+        and top-k values for the others, plus the first and last rows. Its length depends on the
+        number of columns only, not on the number of rows.
+        """
+        total = f"{self.num_rows}+" if self.truncated else str(self.num_rows)
+        lines = [f"{total} rows x {len(self.columns)} columns, summarized.", "Columns:"]
+        for name, array in zip(self.columns, self.arrays):
+            lines.append(f"- {name}: {_describe_column(array, top_k, max_string_length)}")
+        lines.append(f"First {min(sample_rows, self.num_rows)} rows:")
+        lines.append(self.slice(0, sample_rows).to_csv(max_rows=sample_rows, max_string_length=max_string_length).rstrip())
+        if self.num_rows > sample_rows:
+            tail = self.slice(max(self.num_rows - sample_rows, sample_rows))
+            lines.append(f"Last {tail.num_rows} rows:")
+            lines.append(tail.to_csv(max_rows=sample_rows, max_string_length=max_string_length).rstrip())
+        return "\n".join(lines) + "\n"
+
+    def to_csv(self, max_rows: int = 50, max_columns: int = 20, max_string_length: int = 100) -> str:
+        """CSV with a header line, truncated to the given rows, columns and value length."""
+        columns, rows = self._rows(max_rows, max_columns, max_string_length)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(columns)
+        writer.writerows(rows)
+        notes = self._notes(max_rows, max_columns)
+        if notes:
+            buffer.write(f"... ({', '.join(notes)})\n")
+        return buffer.getvalue()
+
+    def to_markdown(self, max_rows: int = 50, max_columns: int = 20, max_string_length: int = 100) -> str:
+        """Markdown table, truncated to the given rows, columns and value length."""
+        columns, rows = self._rows(max_rows, max_columns, max_string_length)
+
+        def line(cells):
+            return "| " + " | ".join(cell.replace("|", "\\|").replace("\n", " ") for cell in cells) + " |"
+
+        lines = [line(columns), "|" + "---|" * len(columns)]
+        lines.extend(line(row) for row in rows)
+        notes = self._notes(max_rows, max_columns)
+        if notes:
+            lines.append(f"... ({', '.join(notes)})")
+        return "\n".join(lines) + "\n"
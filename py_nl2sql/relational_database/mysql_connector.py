@@ -1 +1 @@
-import loggingfrom py_nl2sql.relational_database.sql_database import SQLDatabaselogger = logging.getLogger(__name__)class MySQLConnector(SQLDatabase):    """MySQL connector."""    db_type: str = "mysql"    driver: str = "mysql+pymysql"    port: int = 3306
\ No newline at end of file
+import loggingfrom collections import defaultdictfrom typing import Dict, List, Optional, Tuplefrom sqlalchemy import textfrom py_nl2sql.relational_database.sql_database import SQLDatabaselogger = logging.getLogger(__name__)class MySQLConnector(SQLDatabase):    """MySQL connector."""    db_type: str = "mysql"    driver: str = "mysql+pymysql"    port: int = 3306    def _reflect_tables_in_bulk(            self, table_names: List[str]    ) -> Tuple[Dict[str, List[Dict]], Dict[str, List[Dict]], Dict[str, Dict]]:        """The MySQL dialect reflects table by table, read information_schema directly instead:        three queries for the whole database.        """        wanted = set(table_names)        params = {"schema": self._schema}        columns, indexes, comments = defaultdict(list), defaultdict(list), {}        with self._engine.connect() as connection:            rows = connection.execute(text(                "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_COMMENT FROM information_schema.COLUMNS "                "WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE()) ORDER BY TABLE_NAME, ORDINAL_POSITION"            ), params)            for table_name, column_name, column_comment in rows:                if table_name in wanted:                    columns[table_name].append({"name": column_name, "comment": column_comment or None})            # the primary key is not an index for SQLAlchemy's get_indexes either            rows = connection.execute(text(                "SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME, NON_UNIQUE FROM information_schema.STATISTICS "                "WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE()) AND INDEX_NAME <> 'PRIMARY' "                "ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX"            ), params)            table_indexes = defaultdict(dict)            for table_name, index_name, column_name, non_unique in rows:                # COLUMN_NAME is NULL for functional key parts                if table_name in wanted and column_name is not None:                    index = table_indexes[table_name].setdefault(                        index_name, {"name": index_name, "column_names": [], "unique": not non_unique}                    )                    index["column_names"].append(column_name)            for table_name, table_index in table_indexes.items():                indexes[table_name] = list(table_index.values())            rows = connection.execute(text(                "SELECT TABLE_NAME, TABLE_COMMENT FROM information_schema.TABLES "                "WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE())"            ), params)            for table_name, table_comment in rows:                if table_name in wanted:                    comments[table_name] = {"text": table_comment or None}        return columns, indexes, comments    def catalog_fingerprint(self) -> Optional[str]:        """Count and XOR of row checksums over the column, index and table catalog, one round trip."""        with self._engine.connect() as connection:            row = connection.execute(text(                "SELECT "                "(SELECT CONCAT(COUNT(*), ':', COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', TABLE_NAME, COLUMN_NAME, "                "ORDINAL_POSITION, COLUMN_TYPE, IS_NULLABLE, COLUMN_COMMENT))), 0)) "                "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE())), "                "(SELECT CONCAT(COUNT(*), ':', COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', TABLE_NAME, INDEX_NAME, "                "SEQ_IN_INDEX, COLUMN_NAME, NON_UNIQUE))), 0)) "                "FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE())), "                "(SELECT CONCAT(COUNT(*), ':', COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', TABLE_NAME, TABLE_TYPE, "                "TABLE_COMMENT))), 0)) "                "FROM information_schema.TABLES WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE()))"            ), {"schema": self._schema}).one()        return "/".join(str(part) for part in row)
\ No newline at end of file
@@ -1,4 +1,8 @@
 import logging
+from typing import Optional
+
+from sqlalchemy import text
+
 from py_nl2sql.relational_database.sql_database import SQLDatabase
 
 logger = logging.getLogger(__name__)
@@ -10,3 +14,21 @@ class PostgreSQLConnector(SQLDatabase):
     driver = "postgresql+psycopg"
     db_type = "postgresql"
     port = 5432
+
+    def catalog_fingerprint(self) -> Optional[str]:
+        """md5 over the column, index and table comment catalog of the schema, one round trip."""
+        with self._engine.connect() as connection:
+            return connection.execute(text(
+                "SELECT md5(concat_ws('/', "
+                "(SELECT string_agg(concat_ws('|', table_name, column_name, ordinal_position, data_type, "
+                "is_nullable, col_description(format('%I.%I', table_schema, table_name)::regclass, ordinal_position)), "
+                "',' ORDER BY table_name, ordinal_position) "
+                "FROM information_schema.columns WHERE table_schema = COALESCE(:schema, current_schema())), "
+                "(SELECT string_agg(concat_ws('|', tablename, indexname, indexdef), ',' ORDER BY tablename, indexname) "
+                "FROM pg_indexes WHERE schemaname = COALESCE(:schema, current_schema())), "
+                "(SELECT string_agg(concat_ws('|', c.relname, c.relkind, obj_description(c.oid, 'pg_class')), "
+                "',' ORDER BY c.relname) "
+                "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = COALESCE(:schema, current_schema()) AND c.relkind IN ('r', 'v', 'm', 'p'))"
+                "))"
+            ), {"schema": self._schema}).scalar()
@@ -0,0 +1,58 @@
+"""
+Author: pillar
+Date: 2026-10-17
+Description: SchemaSnapshot class for persisting reflected schema and table summaries between restarts.
+"""
+import logging
+import os
+import pickle
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import sqlalchemy
+from sqlalchemy import MetaData
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SchemaSnapshot:
+    """Reflected schema of a database, valid as long as the catalog fingerprint matches."""
+    VERSION = 1
+
+    fingerprint: str
+    schema: Optional[str]
+    usable_tables: List[str]
+    metadata: MetaData
+    table_summaries: Dict[str, str] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+
+    def save(self, path: str) -> None:
+        """Write the snapshot atomically, readers never see a partial file."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".schema-snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((self.VERSION, sqlalchemy.__version__, self), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> Optional["SchemaSnapshot"]:
+        """Read a snapshot, None when it is missing, unreadable or written by another version."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                version, sqlalchemy_version, snapshot = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable schema snapshot {path}: {e}")
+            return None
+        if version != cls.VERSION or sqlalchemy_version != sqlalchemy.__version__:
+            return None
+        return snapshot
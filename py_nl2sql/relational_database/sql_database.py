@@ -8,8 +8,14 @@ https://github.com/langchain-ai
 
 from __future__ import annotations
 
+import hashlib
+import logging
 import re
-from typing import Any, Dict, Iterable, List, Literal, Optional, Sequence, Union
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Optional, Sequence, Tuple, Union
 from urllib.parse import quote
 from urllib.parse import quote_plus as urlquote
 import sqlalchemy
@@ -21,13 +27,21 @@ from sqlalchemy import (
     select,
     text,
 )
-from sqlalchemy.engine import URL, Engine, Result
+from sqlalchemy.engine import URL, Engine, Result, Row
+from sqlalchemy.engine.reflection import ObjectKind
 from sqlalchemy.exc import ProgrammingError, SQLAlchemyError
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.schema import CreateTable
 from sqlalchemy.sql.expression import Executable
 from sqlalchemy.types import NullType
 
+from py_nl2sql.relational_database.columnar import ColumnarResult
+from py_nl2sql.relational_database.schema_snapshot import SchemaSnapshot
+from py_nl2sql.utilities.cache import LRUCache
+from py_nl2sql.utilities.tracing import get_tracer, traced
+
+logger = logging.getLogger(__name__)
+
 
 def _format_index(index: sqlalchemy.engine.interfaces.ReflectedIndex) -> str:
     return (
@@ -36,6 +50,11 @@ def _format_index(index: sqlalchemy.engine.interfaces.ReflectedIndex) -> str:
     )
 
 
+def _row_size(row: Sequence[Any]) -> int:
+    """Approximate size of a row in bytes, text and binary values by length, others as 8 bytes."""
+    return sum(len(value) if isinstance(value, (str, bytes)) else 8 for value in row)
+
+
 def truncate_word(content: Any, *, length: int, suffix: str = "...") -> str:
     """
     Truncate a string to a certain number of words, based on the max string
@@ -69,8 +88,27 @@ class SQLDatabase:
             view_support: bool = False,
             max_string_length: int = 300,
             lazy_table_reflection: bool = False,
+            snapshot_path: Optional[str] = None,
+            max_reflected_tables: int = 1024,
+            sample_rows_concurrency: int = 8,
+            sample_rows_timeout: Optional[float] = 10.0,
+            max_result_rows: Optional[int] = None,
     ):
-        """Create engine from database URI."""
+        """Create engine from database URI.
+
+        lazy_table_reflection: reflect a table only the first time it is requested, reflected tables
+            are kept in an LRU of `max_reflected_tables` entries so memory stays flat on large schemas.
+        snapshot_path: local file caching the reflected schema and table summaries. On start the
+            snapshot is used instead of reflecting when the catalog fingerprint still matches.
+        sample_rows_concurrency: sample row queries run at once by get_table_info, keep it within
+            the connection pool size.
+        sample_rows_timeout: seconds a sample row query may run, slower tables are described
+            without rows. The database stops the statement (statement_timeout on PostgreSQL,
+            MAX_EXECUTION_TIME on MySQL, a progress handler on SQLite); on other dialects
+            get_table_info only stops waiting for it.
+        max_result_rows: rows `run` fetches at most, the result is read through a server-side
+            cursor and the rest is never transferred. None fetches everything.
+        """
         self._engine = engine
         self._schema = schema
         if include_tables and ignore_tables:
@@ -79,13 +117,11 @@ class SQLDatabase:
         self._inspector = inspect(self._engine)  # 创建了一个数据库检查器（inspector）对象。用于获取数据库的元数据。
         session_factory = sessionmaker(bind=engine)
         self.Session = scoped_session(session_factory)
+        self._reflect_lock = threading.Lock()
 
         # including view support by adding the views as well as tables to the all
         # tables list if view_support is True
-        self._all_tables = set(
-            self._inspector.get_table_names(schema=schema)
-            + (self._inspector.get_view_names(schema=schema) if view_support else [])
-        )
+        self._all_tables = self._get_all_table_names(view_support)
 
         self._include_tables = set(include_tables) if include_tables else set()
         if self._include_tables:
@@ -109,6 +145,12 @@ class SQLDatabase:
 
         self._sample_rows_in_table_info = sample_rows_in_table_info
         self._indexes_in_table_info = indexes_in_table_info
+        self._sample_rows_concurrency = max(sample_rows_concurrency, 1)
+        self._sample_rows_timeout = sample_rows_timeout
+        self._sample_rows_executor: Optional[ThreadPoolExecutor] = None
+        # rendered blocks of get_table_info by table name, dropped by forget_tables
+        self._table_ddl_cache = LRUCache(maxsize=max_reflected_tables)
+        self._sample_rows_cache = LRUCache(maxsize=max_reflected_tables)
 
         self._custom_table_info = custom_table_info
         if self._custom_table_info:
@@ -126,10 +168,20 @@ class SQLDatabase:
             )
 
         self._max_string_length = max_string_length
+        self._max_result_rows = max_result_rows
         self._view_support = view_support
 
+        self._snapshot_path = snapshot_path
+        self._snapshot_stale = False
+        self._fingerprint: Optional[str] = None
+        self._table_summaries: Optional[Dict[str, str]] = None
         self._metadata = metadata or MetaData()
-        if not lazy_table_reflection:
+        self._reflected_tables = LRUCache(maxsize=max_reflected_tables) if lazy_table_reflection else None
+        snapshot = self._load_snapshot() if snapshot_path and metadata is None else None
+        if snapshot is not None:
+            self._metadata = snapshot.metadata
+            self._table_summaries = dict(snapshot.table_summaries) or None
+        elif not lazy_table_reflection:
             # including view support if view_support = true
             self._metadata.reflect(
                 views=view_support,
@@ -138,6 +190,86 @@ class SQLDatabase:
                 schema=self._schema,
             )
 
+    def _get_all_table_names(self, view_support: bool) -> set:
+        return set(
+            self._inspector.get_table_names(schema=self._schema)
+            + (self._inspector.get_view_names(schema=self._schema) if view_support else [])
+        )
+
+    def catalog_fingerprint(self) -> Optional[str]:
+        """Cheap checksum of the catalog, changes whenever a table, column, index or comment does.
+        None when the dialect has no fingerprint, which disables the schema snapshot.
+        """
+        if self.dialect != "sqlite":
+            return None
+        master = f"{self._schema}.sqlite_master" if self._schema else "sqlite_master"
+        with self._engine.connect() as connection:
+            rows = connection.execute(text(f"SELECT type, name, tbl_name, sql FROM {master} ORDER BY type, name")).all()
+        return hashlib.sha256(repr(rows).encode("utf-8")).hexdigest()
+
+    def _load_snapshot(self) -> Optional[SchemaSnapshot]:
+        """The schema snapshot, if it was taken from the same catalog and the same usable tables."""
+        self._fingerprint = self.catalog_fingerprint()
+        if self._fingerprint is None:
+            return None
+        snapshot = SchemaSnapshot.load(self._snapshot_path)
+        if (
+                snapshot is None
+                or snapshot.fingerprint != self._fingerprint
+                or snapshot.schema != self._schema
+                or set(snapshot.usable_tables) != self._usable_tables
+        ):
+            return None
+        logger.info(f"Loaded schema snapshot of {len(snapshot.usable_tables)} tables from {self._snapshot_path}")
+        return snapshot
+
+    def _save_snapshot(self) -> None:
+        """Persist reflected tables and summaries under the fingerprint taken before they were read."""
+        if not self._snapshot_path or self._fingerprint is None or self._table_summaries is None:
+            return
+        with self._reflect_lock:
+            snapshot = SchemaSnapshot(
+                fingerprint=self._fingerprint,
+                schema=self._schema,
+                usable_tables=sorted(self._usable_tables),
+                metadata=self._metadata,
+                table_summaries=dict(self._table_summaries),
+            )
+            try:
+                snapshot.save(self._snapshot_path)
+            except Exception as e:
+                logger.warning(f"Failed to save schema snapshot to {self._snapshot_path}: {e}")
+
+    def refresh_schema(self) -> None:
+        """Discard the inspector cache and reload the table names, so schema changes become visible.
+        Reflected tables are kept, drop the changed ones with `forget_tables`.
+        """
+        if self._snapshot_path:
+            # taken first, so a snapshot never pairs a newer fingerprint with older schema
+            self._fingerprint = self.catalog_fingerprint()
+            self._snapshot_stale = True
+        self._table_summaries = None
+        self._inspector = inspect(self._engine)
+        self._all_tables = self._get_all_table_names(self._view_support)
+        usable_tables = self.get_usable_table_names()
+        self._usable_tables = set(usable_tables) if usable_tables else self._all_tables
+
+    def forget_tables(self, table_names: Iterable[str]) -> None:
+        """Drop reflected metadata of the given tables, they are reflected again on next use."""
+        table_names = set(table_names)
+        with self._reflect_lock:
+            for table in list(self._metadata.tables.values()):
+                if table.name in table_names:
+                    self._metadata.remove(table)
+            for table_name in table_names:
+                self._table_ddl_cache.delete(table_name)
+                self._sample_rows_cache.delete(table_name)
+                if self._reflected_tables is not None:
+                    self._reflected_tables.delete(table_name)
+        if self._snapshot_stale:
+            self._snapshot_stale = False
+            self._save_snapshot()
+
     @property
     def engine(self) -> Engine:
         """Return the engine."""
@@ -220,13 +352,64 @@ class SQLDatabase:
         🌟Developed by pillar🌟
 
         """
+        return list(self.get_table_summaries().values())
+
+    def get_table_summaries(self) -> Dict[str, str]:
+        """Get the summary of every usable table, keyed by table name.
+
+        Columns, indexes and comments of all tables are reflected in bulk, a handful of catalog
+        queries in total; dialects without bulk reflection fall back to three queries per table.
+        """
+        if self._table_summaries is None:
+            self._table_summaries = self._build_table_summaries()
+            if not self._snapshot_stale:
+                self._save_snapshot()
+        return dict(self._table_summaries)
+
+    def _build_table_summaries(self) -> Dict[str, str]:
         summary_template: str = "{table_name}({columns})"
-        tables = self.get_usable_table_names()
-        db_info_summaries = [
-            self._parse_table_summary(summary_template, table_name)
-            for table_name in tables
-        ]
-        return db_info_summaries
+        table_names = list(self.get_usable_table_names())
+        try:
+            columns, indexes, comments = self._reflect_tables_in_bulk(table_names)
+        except (NotImplementedError, AttributeError):
+            return {
+                table_name: self._parse_table_summary(summary_template, table_name)
+                for table_name in table_names
+            }
+        return {
+            table_name: self._format_table_summary(
+                summary_template,
+                table_name,
+                columns.get(table_name, []),
+                indexes.get(table_name, []),
+                comments.get(table_name) or dict(text=None),
+            )
+            for table_name in table_names
+        }
+
+    def _reflect_tables_in_bulk(
+            self, table_names: List[str]
+    ) -> Tuple[Dict[str, List[Dict]], Dict[str, List[Dict]], Dict[str, Dict]]:
+        """Reflect columns, indexes and table comments of many tables at once, keyed by table name.
+
+        Raises NotImplementedError when the dialect cannot reflect in bulk.
+        """
+        kind = ObjectKind.ANY if self._view_support else ObjectKind.TABLE
+        # no filter when every table is wanted, avoids a huge IN list on large catalogs
+        filter_names = None if set(table_names) == self._all_tables else table_names
+        multi_kw = dict(schema=self._schema, filter_names=filter_names, kind=kind)
+
+        columns = self._inspector.get_multi_columns(**multi_kw)
+        indexes = self._inspector.get_multi_indexes(**multi_kw)
+        try:
+            comments = self._inspector.get_multi_table_comment(**multi_kw)
+        except NotImplementedError:
+            comments = {}
+
+        def by_name(reflected: Dict) -> Dict:
+            return {key[1]: value for key, value in reflected.items()}
+
+        return by_name(columns), by_name(indexes), by_name(comments)
 
     def _parse_table_summary(
             self, summary_template: str, table_name: str
@@ -242,8 +425,21 @@ class SQLDatabase:
             table_name(column1(column1 comment),column2(column2 comment),
             column3(column3 comment) and index keys, and table comment: {table_comment})
         """
+        try:
+            comment = self.get_table_comment(table_name)
+        except Exception:
+            comment = dict(text=None)
+        return self._format_table_summary(
+            summary_template, table_name, self.get_columns(table_name), self.get_indexes(table_name), comment
+        )
+
+    @staticmethod
+    def _format_table_summary(
+            summary_template: str, table_name: str, table_columns: List[Dict], raw_indexes: List, comment: Dict
+    ) -> str:
+        """Format reflected columns, indexes and comment of a table into its summary."""
         columns = []
-        for column in self.get_columns(table_name):
+        for column in table_columns:
             if column.get("comment"):
                 columns.append(f"{column['name']} ({column.get('comment')})")
             else:
@@ -252,7 +448,6 @@ class SQLDatabase:
         column_str = ", ".join(columns)
         # Obtain index information
         index_keys = []
-        raw_indexes = self.get_indexes(table_name)
         for index in raw_indexes:
             if isinstance(index, tuple):  # Process tuple type index information
                 index_name, index_creation_command = index
@@ -268,10 +463,6 @@ class SQLDatabase:
         if len(index_keys) > 0:
             index_key_str = ", ".join(index_keys)
             table_str += f", and index keys: {index_key_str}"
-        try:
-            comment = self.get_table_comment(table_name)
-        except Exception:
-            comment = dict(text=None)
         if comment.get("text"):
             table_str += f", and table comment: {comment.get('text')}"
         return table_str
@@ -312,6 +503,8 @@ class SQLDatabase:
         If `sample_rows_in_table_info`, the specified number of sample rows will be
         appended to each table description. This can increase performance as
         demonstrated in the paper.
+
+        The table descriptions are sorted, so the result does not depend on the order of `table_names`.
         """
         all_table_names = self.get_usable_table_names()
         if table_names is not None:
@@ -320,37 +513,22 @@ class SQLDatabase:
                 raise ValueError(f"table_names {missing_tables} not found in database")
             all_table_names = table_names
 
-        metadata_table_names = [tbl.name for tbl in self._metadata.sorted_tables]
-        to_reflect = set(all_table_names) - set(metadata_table_names)
-        if to_reflect:
-            self._metadata.reflect(
-                views=self._view_support,
-                bind=self._engine,
-                only=list(to_reflect),
-                schema=self._schema,
-            )
-
         meta_tables = [
             tbl
-            for tbl in self._metadata.sorted_tables
-            if tbl.name in set(all_table_names)
-               and not (self.dialect == "sqlite" and tbl.name.startswith("sqlite_"))
+            for tbl in self._get_tables(all_table_names)
+            if not (self.dialect == "sqlite" and tbl.name.startswith("sqlite_"))
         ]
 
-        tables = []
+        if self._custom_table_info:
+            custom_tables = [tbl for tbl in meta_tables if tbl.name in self._custom_table_info]
+            meta_tables = [tbl for tbl in meta_tables if tbl.name not in self._custom_table_info]
+        else:
+            custom_tables = []
+        sample_rows = self._get_sample_rows_blocks(meta_tables) if self._sample_rows_in_table_info else {}
+
+        tables = [self._custom_table_info[table.name] for table in custom_tables]
         for table in meta_tables:
-            if self._custom_table_info and table.name in self._custom_table_info:
-                tables.append(self._custom_table_info[table.name])
-                continue
-
-            # Ignore JSON datatyped columns
-            for k, v in table.columns.items():  # AttributeError: items in sqlalchemy v1
-                if type(v.type) is NullType:
-                    table._columns.remove(v)
-
-            # add create table command
-            create_table = str(CreateTable(table).compile(self._engine))
-            table_info = f"{create_table.rstrip()}"
+            table_info = self._get_table_ddl(table)
             has_extra_info = (
                     self._indexes_in_table_info or self._sample_rows_in_table_info
             )
@@ -359,7 +537,7 @@ class SQLDatabase:
             if self._indexes_in_table_info:
                 table_info += f"\n{self._get_table_indexes(table)}\n"
             if self._sample_rows_in_table_info:
-                table_info += f"\n{self._get_sample_rows(table)}\n"
+                table_info += f"\n{sample_rows[table.name]}\n"
             if has_extra_info:
                 table_info += "*/"
             tables.append(table_info)
@@ -367,21 +545,151 @@ class SQLDatabase:
         final_str = "\n\n".join(tables)
         return final_str
 
+    def _get_tables(self, table_names: Iterable[str]) -> List[Table]:
+        """Reflected tables by name, reflecting the missing ones. Costs time in proportion to
+        the requested tables, not to the size of the schema.
+        """
+        table_names = list(dict.fromkeys(table_names))
+        with self._reflect_lock:
+            tables = {}
+            for name in table_names:
+                table = self._metadata.tables.get(f"{self._schema}.{name}" if self._schema else name)
+                if table is None and self._reflected_tables is not None:
+                    table = self._reflected_tables.get(name)
+                if table is not None:
+                    tables[name] = table
+
+            to_reflect = [name for name in table_names if name not in tables]
+            if to_reflect and self._reflected_tables is None:
+                self._metadata.reflect(
+                    views=self._view_support,
+                    bind=self._engine,
+                    only=to_reflect,
+                    schema=self._schema,
+                )
+                reflected = (self._metadata.tables.get(f"{self._schema}.{name}" if self._schema else name)
+                             for name in table_names)
+                return [table for table in reflected if table is not None]
+
+            for name in to_reflect:
+                # each table gets its own MetaData, so evicting it from the LRU frees it
+                table = Table(name, MetaData(), schema=self._schema, autoload_with=self._engine, resolve_fks=False)
+                self._reflected_tables.set(name, table)
+                tables[name] = table
+        return [tables[name] for name in table_names]
+
     def _get_table_indexes(self, table: Table) -> str:
         indexes = self._inspector.get_indexes(table.name)
         indexes_formatted = "\n".join(map(_format_index, indexes))
         return f"Table Indexes:\n{indexes_formatted}"
 
+    @staticmethod
+    def _described_columns(table: Table) -> list:
+        """Columns shown to the model, JSON-like columns SQLAlchemy cannot type are left out."""
+        return [column for column in table.columns if type(column.type) is not NullType]
+
+    def _get_table_ddl(self, table: Table) -> str:
+        """CREATE TABLE statement of the table, compiled once until the table is forgotten."""
+        create_table = self._table_ddl_cache.get(table.name)
+        if create_table is None:
+            # leave the untyped columns out of the statement instead of removing them from the table
+            statement = CreateTable(table)
+            statement.columns = [column for column in statement.columns if type(column.element.type) is not NullType]
+            create_table = str(statement.compile(self._engine)).rstrip()
+            self._table_ddl_cache.set(table.name, create_table)
+        return create_table
+
+    def _get_sample_rows_blocks(self, tables: List[Table]) -> Dict[str, str]:
+        """Sample rows of the tables by name. Cache misses are fetched concurrently over the
+        connection pool, tables that do not answer within `sample_rows_timeout` get no rows.
+        """
+        blocks = {}
+        missing = []
+        for table in tables:
+            block = self._sample_rows_cache.get(table.name)
+            if block is None:
+                missing.append(table)
+            else:
+                blocks[table.name] = block
+        if not missing:
+            return blocks
+
+        if len(missing) == 1:
+            table = missing[0]
+            try:
+                blocks[table.name] = self._get_sample_rows(table)
+                self._sample_rows_cache.set(table.name, blocks[table.name])
+            except SQLAlchemyError as e:
+                logger.warning(f"Failed to fetch sample rows of {table.name}: {e}")
+                blocks[table.name] = self._format_sample_rows(table, "")
+            return blocks
+
+        with self._reflect_lock:
+            if self._sample_rows_executor is None:
+                self._sample_rows_executor = ThreadPoolExecutor(
+                    max_workers=self._sample_rows_concurrency, thread_name_prefix="sample-rows"
+                )
+        futures = {self._sample_rows_executor.submit(self._get_sample_rows, table): table for table in missing}
+        # the statements are stopped by the database, waiting is the fallback of the other dialects;
+        # tables queued behind a full pool start later, so each round of queries gets the timeout
+        timeout = self._sample_rows_timeout
+        if timeout is not None:
+            timeout *= -(-len(missing) // self._sample_rows_concurrency)
+        done, not_done = wait(futures, timeout=timeout)
+        for future in not_done:
+            future.cancel()
+        for future, table in futures.items():
+            if future in done and future.exception() is None:
+                blocks[table.name] = future.result()
+                self._sample_rows_cache.set(table.name, blocks[table.name])
+            else:
+                if future in done:
+                    logger.warning(f"Failed to fetch sample rows of {table.name}: {future.exception()}")
+                else:
+                    logger.warning(f"Sample rows of {table.name} timed out after {self._sample_rows_timeout}s")
+                blocks[table.name] = self._format_sample_rows(table, "")
+        return blocks
+
+    def _format_sample_rows(self, table: Table, sample_rows_str: str) -> str:
+        columns_str = "\t".join([col.name for col in self._described_columns(table)])
+        return (
+            f"{self._sample_rows_in_table_info} rows from {table.name} table:\n"
+            f"{columns_str}\n"
+            f"{sample_rows_str}"
+        )
+
+    @contextmanager
+    def _statement_timeout(self, connection: Any, command: Executable, timeout: Optional[float]):
+        """Yield `command` set to be stopped by the database after `timeout` seconds, where the dialect allows it."""
+        if timeout is None:
+            yield command
+            return
+        milliseconds = max(int(timeout * 1000), 1)
+        if self.dialect == "postgresql":
+            # scoped to the transaction the connection begins, rolled back when it is returned to the pool
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {milliseconds}")
+            yield command
+        elif self.dialect == "mysql":
+            yield command.prefix_with(f"/*+ MAX_EXECUTION_TIME({milliseconds}) */", dialect="mysql")
+        elif self.dialect == "sqlite":
+            raw_connection = connection.connection.driver_connection
+            deadline = time.monotonic() + timeout
+            raw_connection.set_progress_handler(lambda: int(time.monotonic() > deadline), 1000)
+            try:
+                yield command
+            finally:
+                raw_connection.set_progress_handler(None, 1000)
+        else:
+            yield command
+
     def _get_sample_rows(self, table: Table) -> str:
         # build the select command
-        command = select(table).limit(self._sample_rows_in_table_info)
-
-        # save the columns in string format
-        columns_str = "\t".join([col.name for col in table.columns])
+        command = select(*self._described_columns(table)).limit(self._sample_rows_in_table_info)
 
         try:
             # get the sample rows
-            with self._engine.connect() as connection:
+            with self._engine.connect() as connection, \
+                    self._statement_timeout(connection, command, self._sample_rows_timeout) as command:
                 sample_rows_result = connection.execute(command)  # type: ignore
                 # shorten values in the sample rows
                 sample_rows = list(
@@ -396,12 +704,58 @@ class SQLDatabase:
         except ProgrammingError:
             sample_rows_str = ""
 
-        return (
-            f"{self._sample_rows_in_table_info} rows from {table.name} table:\n"
-            f"{columns_str}\n"
-            f"{sample_rows_str}"
-        )
+        return self._format_sample_rows(table, sample_rows_str)
 
+    def _set_schema(self, connection: Any, execution_options: Dict[str, Any]) -> None:
+        """Point the connection at `self._schema` for dialects that need a session setting."""
+        if self._schema is None:
+            return
+        if self.dialect == "snowflake":
+            connection.exec_driver_sql(
+                "ALTER SESSION SET search_path = %s",
+                (self._schema,),
+                execution_options=execution_options,
+            )
+        elif self.dialect == "bigquery":
+            connection.exec_driver_sql(
+                "SET @@dataset_id=?",
+                (self._schema,),
+                execution_options=execution_options,
+            )
+        elif self.dialect == "mssql":
+            pass
+        elif self.dialect == "trino":
+            connection.exec_driver_sql(
+                "USE ?",
+                (self._schema,),
+                execution_options=execution_options,
+            )
+        elif self.dialect == "duckdb":
+            # Unclear which parameterized argument syntax duckdb supports.
+            # The docs for the duckdb client say they support multiple,
+            # but `duckdb_engine` seemed to struggle with all of them:
+            # https://github.com/Mause/duckdb_engine/issues/796
+            connection.exec_driver_sql(
+                f"SET search_path TO {self._schema}",
+                execution_options=execution_options,
+            )
+        elif self.dialect == "oracle":
+            connection.exec_driver_sql(
+                f"ALTER SESSION SET CURRENT_SCHEMA = {self._schema}",
+                execution_options=execution_options,
+            )
+        elif self.dialect == "sqlany":
+            # If anybody using Sybase SQL anywhere database then it should not
+            # go to else condition. It should be same as mssql.
+            pass
+        elif self.dialect == "postgresql":  # postgresql
+            connection.exec_driver_sql(
+                "SET search_path TO %s",
+                (self._schema,),
+                execution_options=execution_options,
+            )
+
+    @traced("db.execute")
     def _execute(
             self,
             command: Union[str, Executable],
@@ -418,51 +772,9 @@ class SQLDatabase:
         parameters = parameters or {}
         execution_options = execution_options or {}
         with self._engine.begin() as connection:  # type: Connection  # type: ignore[name-defined]
-            if self._schema is not None:
-                if self.dialect == "snowflake":
-                    connection.exec_driver_sql(
-                        "ALTER SESSION SET search_path = %s",
-                        (self._schema,),
-                        execution_options=execution_options,
-                    )
-                elif self.dialect == "bigquery":
-                    connection.exec_driver_sql(
-                        "SET @@dataset_id=?",
-                        (self._schema,),
-                        execution_options=execution_options,
-                    )
-                elif self.dialect == "mssql":
-                    pass
-                elif self.dialect == "trino":
-                    connection.exec_driver_sql(
-                        "USE ?",
-                        (self._schema,),
-                        execution_options=execution_options,
-                    )
-                elif self.dialect == "duckdb":
-                    # Unclear which parameterized argument syntax duckdb supports.
-                    # The docs for the duckdb client say they support multiple,
-                    # but `duckdb_engine` seemed to struggle with all of them:
-                    # https://github.com/Mause/duckdb_engine/issues/796
-                    connection.exec_driver_sql(
-                        f"SET search_path TO {self._schema}",
-                        execution_options=execution_options,
-                    )
-                elif self.dialect == "oracle":
-                    connection.exec_driver_sql(
-                        f"ALTER SESSION SET CURRENT_SCHEMA = {self._schema}",
-                        execution_options=execution_options,
-                    )
-                elif self.dialect == "sqlany":
-                    # If anybody using Sybase SQL anywhere database then it should not
-                    # go to else condition. It should be same as mssql.
-                    pass
-                elif self.dialect == "postgresql":  # postgresql
-                    connection.exec_driver_sql(
-                        "SET search_path TO %s",
-                        (self._schema,),
-                        execution_options=execution_options,
-                    )
+            self._set_schema(connection, execution_options)
+            if fetch == "all" and self._max_result_rows is not None:
+                execution_options = {"stream_results": True, **execution_options}
 
             if isinstance(command, str):
                 command = text(command)
@@ -478,12 +790,20 @@ class SQLDatabase:
 
             if cursor.returns_rows:
                 if fetch == "all":
-                    result = [x._asdict() for x in cursor.fetchall()]
+                    if self._max_result_rows is None:
+                        rows = cursor.fetchall()
+                    else:
+                        rows = cursor.fetchmany(self._max_result_rows + 1)
+                        if len(rows) > self._max_result_rows:
+                            logger.warning(f"Query result truncated to {self._max_result_rows} rows")
+                            rows = rows[:self._max_result_rows]
+                    result = [x._asdict() for x in rows]
                 elif fetch == "one":
                     first_result = cursor.fetchone()
                     result = [] if first_result is None else [first_result._asdict()]
                 elif fetch == "cursor":
-                    return cursor
+                    # buffered copy, the connection is closed once this block exits
+                    return cursor.freeze()()
                 else:
                     raise ValueError(
                         "Fetch parameter must be either 'one', 'all', or 'cursor'"
@@ -491,6 +811,113 @@ class SQLDatabase:
                 return result
         return []
 
+    def stream(
+            self,
+            command: Union[str, Executable],
+            batch_size: int = 1000,
+            max_rows: Optional[int] = None,
+            max_bytes: Optional[int] = None,
+            *,
+            parameters: Optional[Dict[str, Any]] = None,
+            execution_options: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[List[Row]]:
+        """Execute a query and yield its rows in batches of `batch_size`.
+
+        Rows are read through a server-side cursor where the driver supports one, so memory stays
+        bounded by the batch size. Streaming stops once `max_rows` rows or about `max_bytes` bytes
+        of values have been yielded, with a warning if rows were left; the rest is never fetched.
+        The statement is committed like `run` once the stream is consumed; closing the generator
+        early rolls it back and releases the connection.
+        """
+        batches = self._stream(command, batch_size, max_rows, max_bytes, parameters, execution_options)
+        next(batches)  # column names
+        yield from batches
+
+    def _stream(
+            self,
+            command: Union[str, Executable],
+            batch_size: int,
+            max_rows: Optional[int],
+            max_bytes: Optional[int],
+            parameters: Optional[Dict[str, Any]],
+            execution_options: Optional[Dict[str, Any]],
+    ) -> Iterator[Any]:
+        """Generator behind `stream`, yields the column names first and then the row batches."""
+        parameters = parameters or {}
+        execution_options = execution_options or {}
+        if isinstance(command, str):
+            command = text(command)
+        elif not isinstance(command, Executable):
+            raise TypeError(f"Query expression has unknown type: {type(command)}")
+
+        rows_seen = bytes_seen = 0
+        start, error = time.perf_counter(), None
+        try:
+            # committed like `run` once consumed, a stream closed before its end is rolled back
+            with self._engine.begin() as connection:
+                self._set_schema(connection, execution_options)
+                result = connection.execute(
+                    command,
+                    parameters,
+                    execution_options={"stream_results": True, "yield_per": batch_size, **execution_options},
+                )
+                returns_rows = result.returns_rows
+                if returns_rows:
+                    try:
+                        yield list(result.keys())
+                        for partition in result.partitions(batch_size):
+                            size = len(partition)
+                            if max_rows is not None and rows_seen + len(partition) > max_rows:
+                                partition = partition[:max_rows - rows_seen]
+                            if max_bytes is not None:
+                                for i, row in enumerate(partition):
+                                    bytes_seen += _row_size(row)
+                                    if bytes_seen > max_bytes:
+                                        partition = partition[:i + 1]
+                                        break
+                            rows_seen += len(partition)
+                            if partition:
+                                yield partition
+                            if max_rows is not None and rows_seen >= max_rows or max_bytes is not None and bytes_seen > max_bytes:
+                                # a cap reached on the last row cut nothing, one more row tells
+                                if len(partition) < size or result.fetchone() is not None:
+                                    logger.warning(f"Query result stream stopped after {rows_seen} rows, {bytes_seen} bytes")
+                                break
+                    finally:
+                        result.close()
+            if not returns_rows:
+                yield []  # only after the commit, closing the stream here keeps the changes
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            get_tracer().record("db.stream", start, error=error, rows=rows_seen)
+
+    def run_columnar(
+            self,
+            command: Union[str, Executable],
+            max_rows: Optional[int] = None,
+            batch_size: int = 10000,
+            *,
+            parameters: Optional[Dict[str, Any]] = None,
+            execution_options: Optional[Dict[str, Any]] = None,
+    ) -> ColumnarResult:
+        """Execute a query and return its result column by column.
+
+        At most `max_rows` rows are fetched, `truncated` is set on the result when there were more.
+        Render it for a prompt with `to_csv` or `to_markdown`.
+        """
+        max_rows = max_rows if max_rows is not None else self._max_result_rows
+        # one row past the cap tells a truncated result from one that has exactly max_rows rows
+        batches = self._stream(
+            command, batch_size, None if max_rows is None else max_rows + 1, None, parameters, execution_options
+        )
+        try:
+            columns = next(batches)
+            return ColumnarResult.from_batches(columns, batches, max_rows=max_rows)
+        finally:
+            batches.close()
+
     def run(
             self,
             command: Union[str, Executable],
@@ -1,4 +1,4 @@
-from typing import Dict, Type, Optional
+from typing import Any, Dict, Type, Optional
 from py_nl2sql.constants.type import RDBType
 from py_nl2sql.relational_database.mysql_connector import MySQLConnector
 from py_nl2sql.relational_database.postgresql_connector import PostgreSQLConnector
@@ -12,6 +12,7 @@ def create_connector(
         db_user: str,
         db_password: str,
         db_name: str,
+        **kwargs: Any,
 ) -> SQLDatabase:
     """create database connector instance."""
     return connector_class.from_uri_db(
@@ -20,6 +21,7 @@ def create_connector(
         user=db_user,
         password=db_password,
         db_name=db_name,
+        **kwargs,
     )
 
 
@@ -30,6 +32,7 @@ def create_rdb(
         db_port: Optional[str] = None,
         db_user: Optional[str] = None,
         db_password: Optional[str] = None,
+        **kwargs: Any,
 ) -> SQLDatabase:
     """Relational Database Factory. Create a database connector instance based on the database type.
     :param:
@@ -39,6 +42,7 @@ def create_rdb(
         db_user (str, optional)
         db_password (str, optional)
         db_name (str, optional)
+        kwargs: passed on to the connector, e.g. snapshot_path.
     :raises:
         ValueError: If the db_type is not supported.
     """
@@ -48,6 +52,6 @@ def create_rdb(
     }
     connector_class = connector_map.get(db_type)
     if connector_class:
-        return create_connector(connector_class, db_host, db_port, db_user, db_password, db_name)
+        return create_connector(connector_class, db_host, db_port, db_user, db_password, db_name, **kwargs)
     else:
         raise ValueError(f"Unknown db_type: {db_type}. Supported types are: {', '.join(connector_map.keys())}.")
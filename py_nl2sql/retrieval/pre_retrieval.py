@@ -6,7 +6,9 @@ Description: RetrievalService class for searching text chunks.
 
 from py_nl2sql.constants.prompts import DECOMPOSE_QUERY_FOR_SQL
 from py_nl2sql.constants.type import RephraseQueryResponse, HydeResponse, DecomposeQueryResponse
-from py_nl2sql.models.llm import LLM
+from typing import Optional
+
+from py_nl2sql.models.llm import LLM, AsyncLLM
 
 """
 ⚠️⚠️⚠️
@@ -15,8 +17,20 @@ Actual use requires evaluation on the actual dataset to see which combination is
 """
 
 
+class _LazyLLM:
+    """Class attribute holding an LLM built on first access, so importing needs no credentials."""
+
+    def __init__(self):
+        self._llm: Optional[LLM] = None
+
+    def __get__(self, obj, objtype=None) -> LLM:
+        if self._llm is None:
+            self._llm = LLM()
+        return self._llm
+
+
 class PreRetrievalService:
-    llm = LLM()
+    llm = _LazyLLM()
 
     @classmethod
     def rephrase_sub_queries(cls, query: str) -> str:
@@ -32,11 +46,18 @@ class PreRetrievalService:
         return response["hyde"]
 
     @classmethod
-    def decompose_for_sql(cls, query: str) -> DecomposeQueryResponse:
-        response = cls.llm.get_structured_response(DECOMPOSE_QUERY_FOR_SQL.format(question=query), DecomposeQueryResponse)
+    def decompose_for_sql(cls, query: str, llm: LLM = None) -> DecomposeQueryResponse:
+        llm = llm or cls.llm
+        response = llm.get_structured_response(DECOMPOSE_QUERY_FOR_SQL.format(question=query), DecomposeQueryResponse)
         # convert dict to pydantic model
         return DecomposeQueryResponse(**response)
 
+    @classmethod
+    async def adecompose_for_sql(cls, query: str, llm: AsyncLLM = None) -> DecomposeQueryResponse:
+        llm = llm or cls.llm.async_llm
+        response = await llm.get_structured_response(DECOMPOSE_QUERY_FOR_SQL.format(question=query), DecomposeQueryResponse)
+        return DecomposeQueryResponse(**response)
+
 
 if __name__ == "__main__":
     res = PreRetrievalService.rephrase_sub_queries("What is the average salary of employees in each department?")
@@ -7,7 +7,6 @@ Description: RetrievalService class for searching text chunks.
 from enum import Enum, auto
 import logging
 
-from py_nl2sql.vector_database.faiss_wrapper import FaissWrapper
 
 logger = logging.getLogger(__name__)
 
@@ -34,10 +33,42 @@ class NL2SQLStateMachine:
         self.update_db_instance()
 
     def update_db_instance(self):
-        """Update the instance with new database information."""
-        self.db_instance.db_summary = self.db_instance.get_db_summary()
-        self.db_instance.vector_index = FaissWrapper(text_chunks=self.db_instance.db_summary)
-        logger.info(f"Instance for {self.db_instance.db_name} updated.")
+        """Update the instance with new database information.
+
+        Only tables whose summary changed are re-embedded and swapped into the summary index,
+        and only their sample SQL is regenerated, so the cost follows the size of the change.
+        """
+        instance = self.db_instance
+        instance.db.refresh_schema()
+        old_summaries = instance.table_summaries
+        new_summaries = instance.db.get_table_summaries()
+
+        changed = [table for table, summary in new_summaries.items() if old_summaries.get(table) != summary]
+        dropped = [table for table in old_summaries if table not in new_summaries]
+        instance.db.forget_tables(changed + dropped)
+        logger.info(f"{instance.db_name}: {len(changed)} tables added or changed, {len(dropped)} dropped")
+
+        if changed or dropped:
+            instance.summary_index.update_chunks(
+                removed_chunks=[old_summaries[table] for table in changed + dropped if table in old_summaries],
+                added_chunks=[new_summaries[table] for table in changed],
+            )
+        instance.table_summaries = new_summaries
+        instance.db_summary = list(new_summaries.values())
+
+        if instance.sql_example_index and (changed or dropped):
+            old_examples = instance.sql_example_by_table
+            new_examples = instance._generate_sql_examples(changed)
+            instance.sql_example_index.update_chunks(
+                removed_chunks=[sql for table in changed + dropped for sql in old_examples.get(table, [])],
+                added_chunks=[sql for sample_sql in new_examples.values() for sql in sample_sql],
+            )
+            instance.sql_example_by_table = {
+                table: new_examples.get(table, old_examples.get(table, [])) for table in new_summaries
+            }
+            instance.sql_example = [sql for sample_sql in instance.sql_example_by_table.values() for sql in sample_sql]
+
+        logger.info(f"Instance for {instance.db_name} updated.")
         self.state = NL2SQLState.COMPLETED
 
     @property
@@ -0,0 +1,170 @@
+"""
+Author: pillar
+Date: 2026-10-17
+Description: StageScheduler class for running workflow stages as a dependency graph.
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StageTiming:
+    name: str
+    start: float
+    end: float
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class _Stage:
+    name: str
+    func: Callable[[], Any]
+    deps: List[str]
+    afunc: Optional[Callable[[], Awaitable[Any]]] = None
+
+
+class StageScheduler:
+    """
+    Run stages as soon as the stages they depend on have finished, so independent
+    stages overlap and only the critical path adds up.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """
+        :param max_workers: threads used by `run()`, defaults to the number of stages.
+        """
+        self.max_workers = max_workers
+        self._stages: Dict[str, _Stage] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, StageTiming] = {}
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def add_stage(
+            self,
+            name: str,
+            func: Callable[[], Any],
+            deps: Iterable[str] = (),
+            afunc: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> "StageScheduler":
+        """
+        Register a stage.
+
+        :param name: unique stage name.
+        :param func: zero-argument callable used by `run()`, and by `arun()` when afunc is missing.
+        :param deps: names of the stages that must finish first.
+        :param afunc: zero-argument coroutine function used by `arun()`.
+        """
+        if name in self._stages:
+            raise ValueError(f"Stage {name} is already registered")
+        self._stages[name] = _Stage(name=name, func=func, deps=list(deps), afunc=afunc)
+        return self
+
+    def _validate(self):
+        for stage in self._stages.values():
+            missing = set(stage.deps) - set(self._stages)
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages {missing}")
+
+        # Kahn's algorithm, only to reject cycles before any stage starts.
+        pending = {name: set(stage.deps) for name, stage in self._stages.items()}
+        while pending:
+            ready = [name for name, deps in pending.items() if not deps]
+            if not ready:
+                raise ValueError(f"Stages {sorted(pending)} form a dependency cycle")
+            for name in ready:
+                del pending[name]
+            for deps in pending.values():
+                deps.difference_update(ready)
+
+    def _timed(self, stage: _Stage) -> Any:
+        start = time.perf_counter()
+        try:
+            return stage.func()
+        finally:
+            self.timings[stage.name] = StageTiming(stage.name, start, time.perf_counter())
+
+    async def _atimed(self, stage: _Stage) -> Any:
+        start = time.perf_counter()
+        try:
+            if stage.afunc is not None:
+                return await stage.afunc()
+            return await asyncio.to_thread(stage.func)
+        finally:
+            self.timings[stage.name] = StageTiming(stage.name, start, time.perf_counter())
+
+    def run(self) -> Dict[str, Any]:
+        """Run all stages on a thread pool and return their results by name."""
+        self._validate()
+        self._started_at = time.perf_counter()
+        done = set()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers or max(len(self._stages), 1)) as executor:
+            while len(done) < len(self._stages):
+                for name, stage in self._stages.items():
+                    if name not in done and name not in running.values() and set(stage.deps) <= done:
+                        # the caller's context, e.g. its current tracing span, follows the stage into the pool
+                        running[executor.submit(contextvars.copy_context().run, self._timed, stage)] = name
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception:
+                        for pending in running:
+                            pending.cancel()
+                        raise
+                    done.add(name)
+        self._finished_at = time.perf_counter()
+        self._log_report()
+        return self.results
+
+    async def arun(self) -> Dict[str, Any]:
+        """Run all stages as asyncio tasks and return their results by name."""
+        self._validate()
+        self._started_at = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: _Stage):
+            if stage.deps:
+                await asyncio.gather(*(tasks[dep] for dep in stage.deps))
+            self.results[stage.name] = await self._atimed(stage)
+
+        for name, stage in self._stages.items():
+            tasks[name] = asyncio.ensure_future(run_stage(stage))
+        try:
+            await asyncio.gather(*tasks.values())
+        except Exception:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        self._finished_at = time.perf_counter()
+        self._log_report()
+        return self.results
+
+    def report(self) -> Dict[str, float]:
+        """
+        Stage durations in seconds, plus `wall_time` (what the run took), `serial_time`
+        (what running the stages one after another would take) and `saved`.
+        """
+        report = {name: timing.duration for name, timing in self.timings.items()}
+        if self._started_at is not None and self._finished_at is not None:
+            serial_time = sum(report.values())
+            wall_time = self._finished_at - self._started_at
+            report.update(wall_time=wall_time, serial_time=serial_time, saved=max(serial_time - wall_time, 0.0))
+        return report
+
+    def _log_report(self):
+        report = self.report()
+        logger.info("stage timings: " + ", ".join(f"{name}={seconds:.3f}s" for name, seconds in report.items()))
@@ -0,0 +1,317 @@
+"""
+Author: pillar
+Date: 2026-10-17
+Description: Lightweight tracing: spans around pipeline stages, LLM, embedding, vector search and SQL calls,
+    exported to in-process histograms, Prometheus text or OpenTelemetry. Without exporters a span is a no-op.
+"""
+
+import bisect
+import contextvars
+import functools
+import inspect
+import itertools
+import logging
+import threading
+import time
+from abc import ABC
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+_span_ids = itertools.count(1)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("nl2sql_current_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    parent: Optional["Span"] = None
+    start: float = 0.0
+    end: Optional[float] = None
+    error: Optional[str] = None
+    span_id: int = field(default_factory=lambda: next(_span_ids))
+    # per exporter state, e.g. the OpenTelemetry span mirroring this one
+    state: Dict[int, Any] = field(default_factory=dict, repr=False)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+class BaseExporter(ABC):
+    """Receives spans as they start and end, must be thread-safe."""
+
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def on_end(self, span: Span) -> None:
+        pass
+
+
+class Tracer:
+    def __init__(self):
+        self.exporters: List[BaseExporter] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def add_exporter(self, exporter: BaseExporter) -> BaseExporter:
+        self.exporters = self.exporters + [exporter]  # copy on write, readers never lock
+        return exporter
+
+    def remove_exporter(self, exporter: BaseExporter) -> None:
+        self.exporters = [item for item in self.exporters if item is not exporter]
+
+    def _start(self, name: str, attributes: Dict[str, Any], start: Optional[float] = None) -> Span:
+        span = Span(name, attributes, parent=_current_span.get(), start=start or time.perf_counter())
+        for exporter in self.exporters:
+            exporter.on_start(span)
+        return span
+
+    def _end(self, span: Span, error: Optional[BaseException] = None, end: Optional[float] = None) -> None:
+        span.end = end or time.perf_counter()
+        if error is not None:
+            span.error = type(error).__name__
+        for exporter in self.exporters:
+            try:
+                exporter.on_end(span)
+            except Exception as e:
+                logger.warning(f"span exporter {type(exporter).__name__} failed: {e}")
+
+    def span(self, name: str, **attributes):
+        """Context manager timing a block as the current span, a shared no-op when tracing is off."""
+        if not self.exporters:
+            return _NOOP_SPAN
+        return _ActiveSpan(self, name, attributes)
+
+    def record(self, name: str, start: float, end: Optional[float] = None, error: Optional[BaseException] = None,
+               **attributes) -> None:
+        """Export a span timed by the caller, e.g. around a generator that cannot hold a context."""
+        if not self.exporters:
+            return
+        self._end(self._start(name, attributes, start=start), error=error, end=end)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _ActiveSpan:
+    def __init__(self, tracer: Tracer, name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self) -> Span:
+        self.span = self.tracer._start(self.name, self.attributes)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self.token)
+        self.tracer._end(self.span, error=exc)
+        return False
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def span(name: str, **attributes):
+    """`with span("name"):` on the process tracer."""
+    return _tracer.span(name, **attributes)
+
+
+def traced(name: str, **attributes) -> Callable:
+    """Decorator running a function or coroutine function in a span of the process tracer."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _tracer.exporters:
+                    return await func(*args, **kwargs)
+                with _tracer.span(name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _tracer.exporters:
+                return func(*args, **kwargs)
+            with _tracer.span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def enable_tracing(*exporters: BaseExporter) -> None:
+    """Add exporters to the process tracer, spans are recorded from now on."""
+    for exporter in exporters:
+        _tracer.add_exporter(exporter)
+
+
+def disable_tracing() -> None:
+    """Remove every exporter, spans become no-ops again."""
+    _tracer.exporters = []
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@dataclass
+class Histogram:
+    buckets: Sequence[float]
+    counts: List[int]
+    count: int = 0
+    sum: float = 0.0
+    errors: int = 0
+
+    def observe(self, value: float, error: bool = False) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.errors += int(error)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class HistogramExporter(BaseExporter):
+    """Duration histograms by span name, kept in process."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def on_end(self, span: Span) -> None:
+        with self._lock:
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = Histogram(self.buckets, [0] * (len(self.buckets) + 1))
+            histogram.observe(span.duration, span.error is not None)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """count, sum, mean, errors and approximate p50/p95/p99 in seconds by span name."""
+        with self._lock:
+            return {
+                name: {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                    "errors": histogram.errors,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                }
+                for name, histogram in self._histograms.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def prometheus_text(self, metric: str = "nl2sql_span_duration_seconds") -> str:
+        """The histograms in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {metric} Duration of NL2SQL pipeline spans.",
+            f"# TYPE {metric} histogram",
+        ]
+        error_lines = [
+            "# HELP nl2sql_span_errors_total Spans that raised an exception.",
+            "# TYPE nl2sql_span_errors_total counter",
+        ]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                label = name.replace("\\", "\\\\").replace('"', '\\"')
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{span="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{span="{label}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum{{span="{label}"}} {histogram.sum}')
+                lines.append(f'{metric}_count{{span="{label}"}} {histogram.count}')
+                error_lines.append(f'nl2sql_span_errors_total{{span="{label}"}} {histogram.errors}')
+        return "\n".join(lines + error_lines) + "\n"
+
+
+def serve_prometheus(exporter: HistogramExporter, port: int = 9464, host: str = "") -> ThreadingHTTPServer:
+    """Serve `exporter.prometheus_text()` on http://host:port/metrics from a daemon thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = exporter.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="nl2sql-metrics", daemon=True).start()
+    return server
+
+
+class OpenTelemetryExporter(BaseExporter):
+    """Mirror spans, with their nesting, as OpenTelemetry spans. Requires opentelemetry-api."""
+
+    def __init__(self, tracer_provider=None):
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            raise ImportError("opentelemetry-api is required for OpenTelemetryExporter, "
+                              "install it with `pip install opentelemetry-api opentelemetry-sdk`.")
+        self._trace = trace
+        self._tracer = trace.get_tracer("py_nl2sql", tracer_provider=tracer_provider)
+        # perf_counter -> epoch nanoseconds
+        self._offset_ns = time.time_ns() - int(time.perf_counter() * 1e9)
+
+    def on_start(self, span: Span) -> None:
+        parent = span.parent.state.get(id(self)) if span.parent is not None else None
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        span.state[id(self)] = self._tracer.start_span(
+            span.name,
+            context=context,
+            attributes={key: value for key, value in span.attributes.items() if value is not None},
+            start_time=self._offset_ns + int(span.start * 1e9),
+        )
+
+    def on_end(self, span: Span) -> None:
+        otel_span = span.state.pop(id(self), None)
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            if value is not None:
+                otel_span.set_attribute(key, value)
+        if span.error is not None:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=self._offset_ns + int(span.end * 1e9))
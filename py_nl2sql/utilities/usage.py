@@ -0,0 +1,164 @@
+"""
+Author: pillar
+Date: 2026-10-17
+Description: Token usage ledger with estimated cost per stage and model, and budgets limiting what a question may spend.
+"""
+
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# USD per million (prompt, completion) tokens, matched by the longest prefix of the model name
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "chatgpt-4o-latest": (5.00, 15.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "moonshot-v1-8k": (1.70, 1.70),
+}
+
+_scope: contextvars.ContextVar[Tuple[tuple, Optional[str]]] = contextvars.ContextVar("nl2sql_usage_scope", default=((), None))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a prompt, about 4 bytes of UTF-8 per token, without a tokenizer."""
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+@dataclass
+class UsageTotals:
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, prompt_tokens: int, completion_tokens: int, cost: float) -> None:
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost += cost
+
+    def to_dict(self) -> Dict[str, float]:
+        return {**asdict(self), "total_tokens": self.total_tokens}
+
+
+class UsageLedger:
+    """Thread-safe token and cost totals, overall, by stage and by model."""
+
+    def __init__(self, prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        """
+        :param prices: USD per million (prompt, completion) tokens by model name, merged over MODEL_PRICES.
+        """
+        self.prices = {**MODEL_PRICES, **(prices or {})}
+        self.total = UsageTotals()
+        self.by_stage: Dict[str, UsageTotals] = {}
+        self.by_model: Dict[str, UsageTotals] = {}
+        self._lock = threading.Lock()
+
+    def price(self, model: str) -> Optional[Tuple[float, float]]:
+        matches = [name for name in self.prices if model.startswith(name)]
+        return self.prices[max(matches, key=len)] if matches else None
+
+    def estimate_cost(self, model: str, prompt_tokens: int, completion_tokens: int = 0) -> float:
+        price = self.price(model)
+        if price is None:
+            logger.debug(f"no price for model {model}, its usage is counted at no cost")
+            return 0.0
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, stage: Optional[str] = None) -> float:
+        """Add one call and return its estimated cost."""
+        cost = self.estimate_cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            self.total.add(prompt_tokens, completion_tokens, cost)
+            self.by_model.setdefault(model, UsageTotals()).add(prompt_tokens, completion_tokens, cost)
+            self.by_stage.setdefault(stage or "other", UsageTotals()).add(prompt_tokens, completion_tokens, cost)
+        return cost
+
+    @property
+    def total_tokens(self) -> int:
+        return self.total.total_tokens
+
+    @property
+    def cost(self) -> float:
+        return self.total.cost
+
+    def summary(self) -> Dict[str, object]:
+        """Totals as plain dicts, e.g. for logging or JSON."""
+        with self._lock:
+            return {
+                **self.total.to_dict(),
+                "by_stage": {stage: totals.to_dict() for stage, totals in self.by_stage.items()},
+                "by_model": {model: totals.to_dict() for model, totals in self.by_model.items()},
+            }
+
+
+@dataclass
+class UsageBudget:
+    """
+    Spend limits of one question. A question about to exceed `max_tokens` or `max_cost` skips its
+    optional stages (the similarity SQL pass), and prompts longer than `max_prompt_tokens` are sent
+    with fewer related tables.
+    """
+    max_tokens: Optional[int] = None
+    max_cost: Optional[float] = None
+    max_prompt_tokens: Optional[int] = None
+
+    def allows(self, ledger: UsageLedger, model: str, prompt_tokens: int, completion_tokens: int = 0) -> bool:
+        """
+        Whether calls of about this size still fit once added to what the ledger has spent. Count the
+        expected completion tokens too, and sum the tokens of several calls to the same model.
+        """
+        return self.allows_calls(ledger, [(model, prompt_tokens, completion_tokens)])
+
+    def allows_calls(self, ledger: UsageLedger, calls: Iterable[Tuple[str, int, int]]) -> bool:
+        """allows for calls to different models, given as (model, prompt tokens, completion tokens)."""
+        calls = list(calls)
+        tokens = sum(prompt_tokens + completion_tokens for _, prompt_tokens, completion_tokens in calls)
+        if self.max_tokens is not None and ledger.total_tokens + tokens > self.max_tokens:
+            return False
+        cost = sum(ledger.estimate_cost(*call) for call in calls)
+        if self.max_cost is not None and ledger.cost + cost > self.max_cost:
+            return False
+        return True
+
+
+@contextmanager
+def usage_scope(*ledgers: UsageLedger, stage: Optional[str] = None):
+    """LLM calls made in this block are recorded in `ledgers`, and in those of the enclosing scopes, under `stage`."""
+    current_ledgers, current_stage = _scope.get()
+    token = _scope.set((current_ledgers + tuple(ledger for ledger in ledgers if ledger is not None), stage or current_stage))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_stage() -> Optional[str]:
+    """Stage of the enclosing usage_scope, None outside of any."""
+    return _scope.get()[1]
+
+
+def record_usage(model: str, usage, ledger: Optional[UsageLedger] = None) -> None:
+    """
+    Record the `usage` of an OpenAI response in the ledgers of the current scope and in `ledger`.
+    Responses without usage, e.g. from the response cache, cost nothing.
+    """
+    ledgers, stage = _scope.get()
+    if ledger is not None and ledger not in ledgers:
+        ledgers = ledgers + (ledger,)
+    if usage is None or not ledgers:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or 0
+    for item in ledgers:
+        item.record(str(model), prompt_tokens, completion_tokens, stage)
@@ -1,4 +1,5 @@
 from .pgvector_wrapper import PGVectorWrapper, PGVectorBase
 from .faiss_wrapper import FaissWrapper
+from .embedding_store import EmbeddingStore, CachedEmbeddings
 
-__all__ = ["PGVectorWrapper", "FaissWrapper", "PGVectorBase"]
+__all__ = ["PGVectorWrapper", "FaissWrapper", "PGVectorBase", "EmbeddingStore", "CachedEmbeddings"]
@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import List, Tuple, Any
 import numpy as np
@@ -49,6 +50,41 @@ class BaseVectorDB(ABC):
         """
         pass
 
+    async def asearch_for_chunks(self, query: str, top_k: int = 3) -> List[str]:
+        """
+        search_for_chunks 的异步版本，默认在线程池中执行，子类可覆盖为原生异步实现
+
+        :param query: 查询文本
+        :param top_k: 返回最相似的 top_k 个文本块
+        :return: 排好序的文本块列表
+        """
+        return await asyncio.to_thread(self.search_for_chunks, query, top_k)
+
+    def search_many(self, queries: List[str], top_k: int = 3) -> List[List[str]]:
+        """
+        批量搜索：一次请求嵌入所有查询文本，并在一次向量化检索中完成搜索。
+        默认实现在子类提供 search_vectors 时一次嵌入全部查询，否则逐个调用 search_for_chunks
+
+        :param queries: 查询文本列表
+        :param top_k: 每个查询返回最相似的 top_k 个文本块
+        :return: 与 queries 一一对应的排好序的文本块列表
+        """
+        if not queries:
+            return []
+        if type(self).search_vectors is not BaseVectorDB.search_vectors:
+            return self.search_vectors(self.get_chunks_embedding(list(queries)), top_k)
+        return [self.search_for_chunks(query, top_k) for query in queries]
+
+    def search_vectors(self, vectors: np.ndarray, top_k: int = 3) -> List[List[str]]:
+        """
+        按查询向量矩阵批量搜索，需要按向量检索的子类覆盖
+
+        :param vectors: 查询向量矩阵，每行一个查询
+        :param top_k: 每个查询返回最相似的 top_k 个文本块
+        :return: 与矩阵各行一一对应的排好序的文本块列表
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support searching by vector")
+
     @abstractmethod
     def search_for_scores(self, query: str, top_k: int) -> List[float]:
         """
@@ -0,0 +1,211 @@
+"""
+Author: pillar
+Date: 2026-10-17
+Description: Content-addressed embedding store and an embedding model wrapper that consults it first.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStore:
+    """
+    Embeddings keyed by sha256(model + text), kept in a directory:
+
+    - vectors.f32: float32 rows, memory-mapped read-only;
+    - keys.txt: one hex key per line, line i is row i;
+    - meta.json: the dimension.
+
+    Both files are append-only and appends hold an exclusive file lock, so several
+    processes can share one store. Rows without a complete key line, left by an append
+    interrupted between the two files, are cut off before the next append.
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    KEYS_FILE = "keys.txt"
+    META_FILE = "meta.json"
+
+    def __init__(self, path: str):
+        """
+        :param path: directory of the store, created if missing.
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, self.VECTORS_FILE)
+        self._keys_path = os.path.join(path, self.KEYS_FILE)
+        self._meta_path = os.path.join(path, self.META_FILE)
+        self._lock = threading.RLock()
+        self._index: Dict[str, int] = {}
+        self._keys_offset = 0  # bytes of keys.txt already loaded into _index
+        self._rows = 0  # key lines already loaded, row i of vectors.f32 belongs to line i
+        self._mmap: Optional[np.memmap] = None
+        self.dim: Optional[int] = None
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r") as f:
+                self.dim = json.load(f)["dim"]
+        with self._lock:
+            self._load_new_keys()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self._index)
+
+    def _load_new_keys(self):
+        """Index key lines appended since the last call, by this or another process."""
+        if not os.path.exists(self._keys_path):
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            data = f.read()
+        # ignore a trailing partial line, it is picked up once complete
+        complete = data[: data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            self._index.setdefault(line.decode("ascii"), self._rows)
+            self._rows += 1
+        self._keys_offset += len(complete)
+
+    def _drop_torn_rows(self):
+        """Cut a partial key line and the vector rows without a key line; the file lock must be held."""
+        if os.path.getsize(self._keys_path) > self._keys_offset:
+            logger.warning(f"embedding store {self.path}: dropping a partial key line")
+            os.truncate(self._keys_path, self._keys_offset)
+        size = self._rows * 4 * self.dim
+        if os.path.exists(self._vectors_path) and os.path.getsize(self._vectors_path) > size:
+            logger.warning(f"embedding store {self.path}: dropping vector rows without a key")
+            self._mmap = None
+            os.truncate(self._vectors_path, size)
+
+    def _vectors(self, rows: int) -> np.ndarray:
+        """Memory map covering at least `rows` rows, remapped when the file has grown."""
+        if self._mmap is None or self._mmap.shape[0] < rows:
+            available = os.path.getsize(self._vectors_path) // (4 * self.dim)
+            self._mmap = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(available, self.dim))
+        return self._mmap
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Return the vector of each key, None for the keys not in the store."""
+        with self._lock:
+            if any(key not in self._index for key in keys):
+                self._load_new_keys()
+            rows = [self._index.get(key) for key in keys]
+            found = [row for row in rows if row is not None]
+            if not found:
+                return [None] * len(keys)
+            vectors = self._vectors(max(found) + 1)
+            return [None if row is None else np.array(vectors[row]) for row in rows]
+
+    def put_many(self, keys: Sequence[str], vectors: np.ndarray) -> None:
+        """Append vectors for keys that are not stored yet."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(keys) != len(vectors):
+            raise ValueError("The number of keys must match the number of vectors.")
+        if not len(keys):
+            return
+        with self._lock, open(self._keys_path, "ab") as keys_file:
+            if fcntl is not None:
+                fcntl.flock(keys_file, fcntl.LOCK_EX)
+            try:
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                    with open(self._meta_path, "w") as f:
+                        json.dump({"dim": self.dim}, f)
+                elif vectors.shape[1] != self.dim:
+                    raise ValueError(f"Vector dimension {vectors.shape[1]} does not match the store dimension {self.dim}.")
+
+                self._load_new_keys()
+                self._drop_torn_rows()
+                new_rows = {}
+                for key, vector in zip(keys, vectors):
+                    if key not in self._index and key not in new_rows:
+                        new_rows[key] = vector
+                if not new_rows:
+                    return
+
+                # vectors first, so a key line never points at a row that is not written yet;
+                # rows written without their keys are dropped by the next append
+                with open(self._vectors_path, "ab") as vectors_file:
+                    vectors_file.write(np.stack(list(new_rows.values())).tobytes())
+                keys_file.write("".join(f"{key}\n" for key in new_rows).encode("ascii"))
+                keys_file.flush()
+                self._load_new_keys()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(keys_file, fcntl.LOCK_UN)
+
+
+class CachedEmbeddings:
+    """
+    Embedding model wrapper: texts are looked up in an EmbeddingStore first and only
+    the misses are sent to the wrapped model, in one batch.
+    """
+
+    def __init__(self, embedding: Any, store: EmbeddingStore, model_name: Optional[str] = None):
+        """
+        :param embedding: embedding model with embed_documents / embed_query, e.g. OpenAIEmbeddings.
+        :param store: the embedding store.
+        :param model_name: part of every key, defaults to the model name and dimensions of `embedding`.
+        """
+        self.embedding = embedding
+        self.store = store
+        if model_name is None:
+            model_name = str(getattr(embedding, "model", None) or type(embedding).__name__)
+            dimensions = getattr(embedding, "dimensions", None)
+            if dimensions:
+                model_name = f"{model_name}:{dimensions}"
+        self.model_name = model_name
+
+    def __getattr__(self, name):
+        if name in ("embedding", "store"):
+            raise AttributeError(name)
+        return getattr(self.embedding, name)
+
+    def _lookup(self, texts: List[str]):
+        vectors = self.store.get_many([self.store.make_key(self.model_name, text) for text in texts])
+        misses = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        return vectors, misses
+
+    def _merge(self, texts, vectors, misses, miss_vectors) -> List[List[float]]:
+        if misses:
+            miss_vectors = np.asarray(miss_vectors, dtype=np.float32)
+            self.store.put_many([self.store.make_key(self.model_name, text) for text in misses], miss_vectors)
+            by_text = dict(zip(misses, miss_vectors))
+            vectors = [by_text[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+            logger.debug(f"embedding store: {len(texts) - len(misses)} hits, {len(misses)} misses")
+        return [vector.tolist() for vector in vectors]
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        texts = list(texts)
+        vectors, misses = self._lookup(texts)
+        miss_vectors = self.embedding.embed_documents(misses, **kwargs) if misses else []
+        return self._merge(texts, vectors, misses, miss_vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        vectors, misses = self._lookup([text])
+        miss_vectors = [self.embedding.embed_query(text)] if misses else []
+        return self._merge([text], vectors, misses, miss_vectors)[0]
+
+    async def aembed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        texts = list(texts)
+        vectors, misses = self._lookup(texts)
+        miss_vectors = await self.embedding.aembed_documents(misses, **kwargs) if misses else []
+        return self._merge(texts, vectors, misses, miss_vectors)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vectors, misses = self._lookup([text])
+        miss_vectors = [await self.embedding.aembed_query(text)] if misses else []
+        return self._merge([text], vectors, misses, miss_vectors)[0]
@@ -3,14 +3,33 @@ Author: pillar
 Date: 2024-08-22
 Description: FaissWrapper class for building and searching Faiss index.
 """
-from typing import List, Tuple
+import asyncio
+import hashlib
+import json
+import os
+from collections import Counter
+from typing import Any, List, NamedTuple, Optional, Tuple
 import faiss
 import numpy as np
 
+from py_nl2sql.utilities.cache import CacheStats, LRUCache
+from py_nl2sql.utilities.tracing import span
 from py_nl2sql.vector_database.base_vectordb import BaseVectorDB
+from py_nl2sql.vector_database.embedding_store import CachedEmbeddings, EmbeddingStore
+
+
+class _IndexState(NamedTuple):
+    """索引与其文本 chunk 作为一个整体替换，检索始终使用同一版本的两者。"""
+    index: Any
+    text_chunks: List[str]
+    version: int
 
 
 class FaissWrapper(BaseVectorDB):
+    INDEX_FILE = "index.faiss"
+    CHUNKS_FILE = "chunks.json"
+    CONFIG_FILE = "config.json"
+
     def __init__(
             self,
             text_chunks,
@@ -18,7 +37,10 @@ class FaissWrapper(BaseVectorDB):
             index_type="Flat",
             similarity_measure=faiss.METRIC_L2,
             nlist=100,
-            hnsw_m=32
+            hnsw_m=32,
+            embedding_store: Optional[EmbeddingStore] = None,
+            cache_size: int = 1024,
+            cache_ttl: Optional[float] = None,
     ):
         """
         init FaissWrapper class.
@@ -29,9 +51,12 @@ class FaissWrapper(BaseVectorDB):
         :param metric: the method to measure similarity, can be faiss.METRIC_L2 (default) or faiss.METRIC_INNER_PRODUCT.
         :param nlist: the number of clusters (only for IVFFlat index).
         :param hnsw_m: the parameter for HNSW index, representing the number of neighbors for each node.
+        :param embedding_store: consulted before the embedding model, only missing chunks and queries are embedded.
+        :param cache_size: maximum number of cached search results, least recently used are evicted first.
+        :param cache_ttl: seconds a cached search result stays valid, None keeps it until evicted.
         """
         self.text_chunks = text_chunks
-        self.embedding = embedding
+        self.embedding = CachedEmbeddings(embedding, embedding_store) if embedding_store is not None else embedding
         self.index_type = index_type
         self.metric = similarity_measure
         self.nlist = nlist
@@ -43,22 +68,66 @@ class FaissWrapper(BaseVectorDB):
 
         self.index = self._create_index()
         self.trained = False
-        self.cache = {}  # cache distances and indices
+        self.read_only = False
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)  # cache distances and indices
 
         # add embeddings to index
         self.add(embeddings)
 
+    @property
+    def index(self):
+        return self._state.index
+
+    @index.setter
+    def index(self, index):
+        self._swap(index=index)
+
+    @property
+    def text_chunks(self) -> List[str]:
+        return self._state.text_chunks
+
+    @text_chunks.setter
+    def text_chunks(self, text_chunks: List[str]):
+        self._swap(text_chunks=text_chunks)
+
+    def _swap(self, **changes):
+        """
+        以一次赋值替换索引状态，并升级版本号，使旧版本的缓存结果不再命中。
+
+        :param changes: 要替换的 index 和/或 text_chunks。
+        """
+        state = getattr(self, "_state", None) or _IndexState(None, [], 0)
+        self._state = state._replace(version=state.version + 1, **changes)
+
     def get_chunks_embedding(self, text_chunks: List[str]):
         """
         get the embedding of text chunks.
         """
-        return np.array(self.embedding.embed_documents(text_chunks)).astype("float32")
+        with span("embedding.embed_documents", texts=len(text_chunks)):
+            return np.array(self.embedding.embed_documents(text_chunks)).astype("float32")
 
     def get_query_embedding(self, query: str):
         """
         get the embedding of query text.
         """
-        return np.array(self.embedding.embed_query(query)).astype("float32").reshape(1, -1)
+        with span("embedding.embed_query"):
+            return np.array(self.embedding.embed_query(query)).astype("float32").reshape(1, -1)
+
+    def get_queries_embedding(self, queries: List[str]):
+        """
+        get the embeddings of several query texts in one request.
+        """
+        return self.get_chunks_embedding(queries).reshape(len(queries), -1)
+
+    async def aget_query_embedding(self, query: str):
+        """
+        get the embedding of query text without blocking the event loop.
+        """
+        if hasattr(self.embedding, "aembed_query"):
+            with span("embedding.embed_query"):
+                embedding = await self.embedding.aembed_query(query)
+            return np.array(embedding).astype("float32").reshape(1, -1)
+        return await asyncio.to_thread(self.get_query_embedding, query)
 
     def _create_index(self):
         """
@@ -116,39 +185,177 @@ class FaissWrapper(BaseVectorDB):
 
         :param vectors: 要添加到索引的向量。
         """
+        if self.read_only:
+            raise ValueError("Index is memory-mapped read-only, open the bundle with mmap=False to add vectors")
         if self.index_type == "IVFFlat" and not self.trained:
             self.train(vectors)
         self.index.add(vectors)
+        self.clear_cache()
 
-    def search(self, query_vectors, k) -> Tuple[np.ndarray, np.ndarray]:
+    def _reconstruct_all(self) -> np.ndarray:
         """
-        搜索与查询向量最相似的 k 个向量。
+        取回索引中的全部向量。
+        """
+        if self.index.ntotal == 0:
+            return np.empty((0, self.d), dtype="float32")
+        if self.index_type == "IVFFlat":
+            faiss.extract_index_ivf(self.index).make_direct_map()
+        return self.index.reconstruct_n(0, self.index.ntotal)
 
-        :param query_vectors: 查询向量。
-        :param k: 返回最相似的 k 个向量。
-        :return: 返回距离和索引。
+    def update_chunks(self, removed_chunks: List[str] = (), added_chunks: List[str] = ()):
         """
-        cache_key = (tuple(map(tuple, query_vectors)), k)
-        if cache_key not in self.cache:
-            distances, indices = self.index.search(query_vectors, k)
-            self.cache[cache_key] = (distances, indices)
-        return self.cache[cache_key]
+        增量更新：删除 removed_chunks（每项删除一次出现），只对 added_chunks 做 embedding。
+        新索引在旁路构建，完成后整体替换，原索引在替换前仍可正常检索。
 
-    def save(self, file_path):
+        :param removed_chunks: 要删除的文本 chunk。
+        :param added_chunks: 要新增的文本 chunk。
         """
-        保存索引到文件。
+        if self.read_only:
+            raise ValueError("Index is memory-mapped read-only, open the bundle with mmap=False to update it")
+        remaining = Counter(removed_chunks)
+        keep = []
+        for i, chunk in enumerate(self.text_chunks):
+            if remaining[chunk] > 0:
+                remaining[chunk] -= 1
+            else:
+                keep.append(i)
+
+        vectors = self._reconstruct_all()[keep]
+        text_chunks = [self.text_chunks[i] for i in keep]
+        if added_chunks:
+            vectors = np.vstack([vectors, self.get_chunks_embedding(list(added_chunks))])
+            text_chunks.extend(added_chunks)
 
-        :param file_path: 索引文件的路径。
+        index = self._create_index()
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+
+        self._swap(index=index, text_chunks=text_chunks)
+        self.trained = index.is_trained
+        self.clear_cache()
+
+    def search(self, query_vectors, k) -> Tuple[np.ndarray, np.ndarray]:
         """
-        faiss.write_index(self.index, file_path)
+        搜索与查询向量最相似的 k 个向量。
 
-    def load(self, file_path):
+        :param query_vectors: 查询向量。
+        :param k: 返回最相似的 k 个向量。
+        :return: 返回距离和索引。
+        """
+        return self._search(self._state, query_vectors, k)
+
+    def _search(self, state: _IndexState, query_vectors, k) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        在给定版本的索引上检索，调用方用同一 state 的 text_chunks 解析返回的下标。
+        """
+        query_vectors = np.ascontiguousarray(query_vectors, dtype="float32")
+        digest = hashlib.blake2b(query_vectors.tobytes(), digest_size=16)
+        digest.update(f"{query_vectors.shape}:{k}:{state.version}".encode())
+        cache_key = digest.hexdigest()
+        with span("faiss.search", queries=len(query_vectors), k=k) as current:
+            result = self.cache.get(cache_key)
+            if current is not None:
+                current.set_attribute("cache_hit", result is not None)
+            if result is None:
+                result = state.index.search(query_vectors, k)
+                self.cache.set(cache_key, result)
+        return result
+
+    @property
+    def cache_stats(self) -> CacheStats:
+        """
+        search 缓存的命中、未命中及淘汰次数，hit_rate 为命中率。
+        """
+        return self.cache.stats
+
+    def save(self, path):
+        """
+        保存索引、文本 chunk 及配置到目录 (bundle)，可通过 FaissWrapper.open 直接加载而无需重新 embedding。
+
+        :param path: bundle 目录，不存在时自动创建。
+        """
+        os.makedirs(path, exist_ok=True)
+        faiss.write_index(self.index, os.path.join(path, self.INDEX_FILE))
+        with open(os.path.join(path, self.CHUNKS_FILE), "w", encoding="utf-8") as f:
+            json.dump(list(self.text_chunks), f, ensure_ascii=False)
+        with open(os.path.join(path, self.CONFIG_FILE), "w") as f:
+            json.dump(
+                {
+                    "index_type": self.index_type,
+                    "metric": int(self.metric),
+                    "d": self.d,
+                    "nlist": self.nlist,
+                    "hnsw_m": self.hnsw_m,
+                    "ntotal": self.index.ntotal,
+                },
+                f,
+            )
+
+    def load(self, path, mmap=False):
+        """
+        从 bundle 目录加载索引、文本 chunk 及配置；若 path 是单个索引文件，则只替换索引。
+
+        :param path: bundle 目录或索引文件的路径。
+        :param mmap: 以只读 mmap 方式加载索引，同一主机上的多个进程共享索引内存页。
+        """
+        if not os.path.isdir(path):
+            self.index = self._read_index(path, mmap)
+            self.clear_cache()
+            return
+
+        with open(os.path.join(path, self.CONFIG_FILE), "r") as f:
+            config = json.load(f)
+        with open(os.path.join(path, self.CHUNKS_FILE), "r", encoding="utf-8") as f:
+            text_chunks = json.load(f)
+        index = self._read_index(os.path.join(path, self.INDEX_FILE), mmap)
+        if index.ntotal != len(text_chunks):
+            raise ValueError(f"Index holds {index.ntotal} vectors but the bundle has {len(text_chunks)} chunks")
+
+        self.index_type = config["index_type"]
+        self.metric = config["metric"]
+        self.d = config["d"]
+        self.nlist = config["nlist"]
+        self.hnsw_m = config["hnsw_m"]
+        self._swap(index=index, text_chunks=text_chunks)
+        self.trained = index.is_trained
+        self.clear_cache()
+
+    def _read_index(self, file_path, mmap):
+        if not mmap:
+            self.read_only = False
+            return faiss.read_index(file_path)
+        self.read_only = True
+        flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+        return faiss.read_index(file_path, flags)
+
+    @classmethod
+    def open(
+            cls,
+            path,
+            embedding=None,
+            mmap=False,
+            embedding_store: Optional[EmbeddingStore] = None,
+            cache_size: int = 1024,
+            cache_ttl: Optional[float] = None,
+    ):
         """
-        从文件加载索引。
+        Build a FaissWrapper from a bundle written by `save`, without embedding any chunk.
 
-        :param file_path: 索引文件的路径。
+        :param path: bundle directory.
+        :param embedding: embedding model, only needed to embed query text.
+        :param mmap: load the index read-only through mmap, so worker processes share its pages.
+        :param embedding_store: consulted before the embedding model for query embeddings.
+        :param cache_size: maximum number of cached search results.
+        :param cache_ttl: seconds a cached search result stays valid.
         """
-        self.index = faiss.read_index(file_path)
+        wrapper = cls.__new__(cls)
+        if embedding is not None and embedding_store is not None:
+            embedding = CachedEmbeddings(embedding, embedding_store)
+        wrapper.embedding = embedding
+        wrapper.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        wrapper.load(path, mmap=mmap)
+        return wrapper
 
     def get_sorted_chunks(self, indices, chunks) -> List[str]:
         """
@@ -187,9 +394,49 @@ class FaissWrapper(BaseVectorDB):
         :param top_k: 返回最相似的 top_k 个文本 chunk。
         :return: 排好序的文本 chunk 列表。
         """
+        state = self._state
         query_vectors = self.get_query_embedding(query)
-        distances, indices = self.search(query_vectors, top_k)
-        return self.get_sorted_chunks(indices, self.text_chunks)
+        distances, indices = self._search(state, query_vectors, top_k)
+        return self.get_sorted_chunks(indices, state.text_chunks)
+
+    def search_many(self, queries: List[str], top_k: int = 3) -> List[List[str]]:
+        """
+        批量搜索：一次请求嵌入所有查询，一次 faiss 检索完成所有查询。
+
+        :param queries: 查询文本列表。
+        :param top_k: 每个查询返回最相似的 top_k 个文本 chunk。
+        :return: 与 queries 一一对应的排好序的文本 chunk 列表。
+        """
+        if not queries:
+            return []
+        return self.search_vectors(self.get_queries_embedding(queries), top_k)
+
+    def search_vectors(self, vectors, top_k: int = 3) -> List[List[str]]:
+        """
+        按查询向量矩阵批量检索。
+
+        :param vectors: 查询向量矩阵，每行一个查询。
+        :param top_k: 每个查询返回最相似的 top_k 个文本 chunk。
+        :return: 与矩阵各行一一对应的排好序的文本 chunk 列表。
+        """
+        state = self._state
+        vectors = np.asarray(vectors, dtype="float32").reshape(-1, self.d)
+        distances, indices = self._search(state, vectors, top_k)
+        # faiss pads with -1 when the index holds fewer than top_k vectors
+        return [[state.text_chunks[idx] for idx in idx_list if idx >= 0] for idx_list in indices]
+
+    async def asearch_for_chunks(self, query, top_k=3):
+        """
+        search_for_chunks 的异步版本：异步获取查询向量，索引检索在本地完成。
+
+        :param query: 查询文本。
+        :param top_k: 返回最相似的 top_k 个文本 chunk。
+        :return: 排好序的文本 chunk 列表。
+        """
+        state = self._state
+        query_vectors = await self.aget_query_embedding(query)
+        distances, indices = self._search(state, query_vectors, top_k)
+        return self.get_sorted_chunks(indices, state.text_chunks)
 
     def search_for_scores(self, query: str, top_k: int):
         """
@@ -199,10 +446,10 @@ class FaissWrapper(BaseVectorDB):
         :param top_k: 返回最相似的 top_k 个文本 chunk 的分数。
         :return: 原始 chunk 对应的分数列表。
         """
+        state = self._state
         query_vectors = self.get_query_embedding(query)
-        num_chunks = len(self.text_chunks)
-        distances, indices = self.search(query_vectors, top_k)
-        return self.get_scores(distances, indices, num_chunks)
+        distances, indices = self._search(state, query_vectors, top_k)
+        return self.get_scores(distances, indices, len(state.text_chunks))
 
     def search_for_chunks_with_scores(self, query: str, top_k: int):
         """
@@ -212,12 +459,13 @@ class FaissWrapper(BaseVectorDB):
         :param top_k: 返回最相似的 top_k 个文本 chunk 及其分数。
         :return: 一个包含排好序的文本 chunk 及其对应分数的列表。
         """
+        state = self._state
         query_vectors = self.get_query_embedding(query)
-        distances, indices = self.search(query_vectors, top_k)
+        distances, indices = self._search(state, query_vectors, top_k)
         sorted_chunks_with_scores = []
         for i in range(len(indices)):
             sorted_chunks_with_scores.append(
-                [(self.text_chunks[idx], distances[i][j]) for j, idx in enumerate(indices[i])])
+                [(state.text_chunks[idx], distances[i][j]) for j, idx in enumerate(indices[i])])
 
         return sorted_chunks_with_scores
 
@@ -231,5 +479,4 @@ class FaissWrapper(BaseVectorDB):
         """
         释放索引以释放内存。
         """
-        del self.index
         self.index = None
@@ -4,7 +4,7 @@ Date: 2024-08-22
 Description: SQLAlchemyVectorDB class for building and searching vector index using PostgreSQL and pgvector.
 """
 from langchain_openai import OpenAIEmbeddings
-from sqlalchemy import select, text, JSON, Text
+from sqlalchemy import select, text, literal, union_all, JSON, Text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import mapped_column, Mapped, declarative_base
 from pgvector.sqlalchemy import Vector
@@ -16,7 +16,9 @@ import os
 from py_nl2sql.constants.type import RDBType
 from py_nl2sql.relational_database.sql_database import SQLDatabase
 from py_nl2sql.relational_database.sql_factory import create_rdb
+from py_nl2sql.utilities.tracing import span
 from py_nl2sql.vector_database.base_vectordb import BaseVectorDB
+from py_nl2sql.vector_database.embedding_store import CachedEmbeddings, EmbeddingStore
 
 
 logger = logging.getLogger(__name__)
@@ -36,6 +38,7 @@ class PGVectorWrapper(BaseVectorDB):
             dict_data: Optional[dict] = None,
             index_type: Optional[str] = None,
             similarity_measure: Optional[str] = None,
+            embedding_store: Optional[EmbeddingStore] = None,
     ):
         # TODO：增加检测 embedding 不能作为 dict_data 的键。
         """
@@ -47,11 +50,12 @@ class PGVectorWrapper(BaseVectorDB):
         :param db_instance: 数据库实例
         :param index_type: 要使用的索引类型
         :param similarity_measure: 相似度度量方法
+        :param embedding_store: 嵌入缓存，仅对未命中的文本调用嵌入模型
         """
         self.text_chunks = text_chunks
         self.dict_data = dict_data
         self.table_cls = table_cls
-        self.embedding_model = embedding
+        self.embedding_model = CachedEmbeddings(embedding, embedding_store) if embedding_store is not None else embedding
         self.index_type = index_type
         self.similarity_measure = similarity_measure or "vector_l2_ops"
         self.vector_index = None
@@ -121,8 +125,9 @@ class PGVectorWrapper(BaseVectorDB):
         else:
             original_data = self.dict_data["original_data"]
             embedding_col = self.dict_data["embedding_col"]
-            for data in original_data:
-                embedding = self.embedding_model.embed_query(data[embedding_col])
+            # 一次批量嵌入所有行，而不是逐行请求
+            embeddings = self.get_chunks_embedding([data[embedding_col] for data in original_data])
+            for data, embedding in zip(original_data, embeddings):
                 data["embedding"] = embedding
 
             self.add_multiple_content(original_data)
@@ -135,7 +140,8 @@ class PGVectorWrapper(BaseVectorDB):
         :param chunk_size: 每次处理的文本块数量，0 表示一次处理所有。
         :return: 嵌入向量列表。
         """
-        return self.embedding_model.embed_documents(chunks, chunk_size=chunk_size)
+        with span("embedding.embed_documents", texts=len(chunks)):
+            return self.embedding_model.embed_documents(chunks, chunk_size=chunk_size)
 
     def get_query_embedding(self, query: str) -> List[float]:
         # TODO： query 在这儿表示不准确。
@@ -145,7 +151,8 @@ class PGVectorWrapper(BaseVectorDB):
         :param query: 查询文本。
         :return: 查询文本的嵌入向量。
         """
-        return self.embedding_model.embed_query(query)
+        with span("embedding.embed_query"):
+            return self.embedding_model.embed_query(query)
 
     def add_one_content_to_embedding(self, vectors: List[List[float]]) -> None:
         """
@@ -210,6 +217,48 @@ class PGVectorWrapper(BaseVectorDB):
             ).all()
         return results
 
+    def search_many(self, queries: List[str], top_k: int = 3) -> List[List[str]]:
+        """
+        批量搜索：一次请求嵌入所有查询，一条 SQL 完成所有查询。
+
+        :param queries: 查询文本列表。
+        :param top_k: 每个查询返回最相似的 top_k 个文本块。
+        :return: 与 queries 一一对应的排好序的文本块列表。
+        """
+        if not queries:
+            return []
+        return self.search_vectors(self.get_chunks_embedding(queries), top_k)
+
+    def search_vectors(self, vectors, top_k: int = 3) -> List[List[str]]:
+        """
+        按查询向量矩阵批量检索，每个查询的 top_k 子查询通过 UNION ALL 合并为一条 SQL。
+
+        :param vectors: 查询向量矩阵，每行一个查询。
+        :param top_k: 每个查询返回最相似的 top_k 个文本块。
+        :return: 与矩阵各行一一对应的排好序的文本块列表。
+        """
+        vectors = [[float(value) for value in vector] for vector in vectors]
+        if not vectors:
+            return []
+        subqueries = []
+        for i, vector in enumerate(vectors):
+            distance = self.table_cls.embedding.cosine_distance(vector)
+            subquery = (
+                select(literal(i).label("query_idx"), self.table_cls.content, distance.label("distance"))
+                .order_by(distance)
+                .limit(top_k)
+                .subquery()
+            )
+            subqueries.append(select(subquery.c.query_idx, subquery.c.content, subquery.c.distance))
+
+        with self.db.Session() as session:
+            rows = session.execute(union_all(*subqueries)).all()
+
+        results = [[] for _ in vectors]
+        for query_idx, content, distance in sorted(rows, key=lambda row: (row.query_idx, row.distance)):
+            results[query_idx].append(content)
+        return results
+
     def search_for_row(self, query: str, top_k: int = 3) -> List[Any]:
         """
         搜索并返回排好序的文本块。
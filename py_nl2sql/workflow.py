@@ -1,53 +1,394 @@
+import asyncio
 import logging
-from typing import Optional, List
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Literal, Optional, List, Tuple, Union
+
+from sqlalchemy.exc import SQLAlchemyError
 
 from py_nl2sql.constants.prompts import NL2SQLPrompts
-from py_nl2sql.constants.type import GenerateSQLResponse
+from py_nl2sql.constants.type import AnswerEvent, AnswerMetadata, GenerateSQLResponse, LLMModel
 from py_nl2sql.retrieval.pre_retrieval import PreRetrievalService
-from py_nl2sql.models.llm import LLM
+from py_nl2sql.models.llm import COMPLETION_TOKENS_ESTIMATE, LLM, AsyncLLM
 from py_nl2sql.db_instance import DBInstance
+from py_nl2sql.relational_database.columnar import ColumnarResult
+from py_nl2sql.utilities.scheduler import StageScheduler
+from py_nl2sql.utilities.tracing import span
+from py_nl2sql.utilities.usage import UsageBudget, UsageLedger, estimate_tokens, usage_scope
 
 
 logger = logging.getLogger(__name__)
 
 
+class _StageOutput:
+    """Workflow attribute produced by a stage. In lazy mode, reading it runs the stage first."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __set_name__(self, owner, name):
+        self.attr = f"_{name}"
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        value = obj.__dict__.get(self.attr)
+        if value is None and obj.lazy:
+            # run_stage holds the lock while computing, so another thread waits here for the value
+            # and only the computing thread, reading its own stage's output, sees the stage active
+            with obj._stage_lock:
+                if self.stage not in obj._done_stages and self.stage not in obj._active_stages:
+                    obj.run_stage(self.stage)
+                value = obj.__dict__.get(self.attr)
+        return value
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.attr] = value
+
+
 class NL2SQLWorkflow:
-    def __init__(self, db_instance: DBInstance, query: str, llm: LLM, need_similarity_sql: bool = True):
+    # stage -> stages it depends on
+    STAGES: Dict[str, Tuple[str, ...]] = {
+        "related_tables": (),
+        "decomposition": (),
+        "first_sql": ("related_tables", "decomposition"),
+        "similarity_sql": ("first_sql",),
+        "final_sql": ("first_sql", "similarity_sql"),
+        "sql_result": ("final_sql",),
+        "answer": ("sql_result",),
+    }
+    # stage -> attributes it produces, the names accepted by `precomputed`
+    STAGE_OUTPUTS: Dict[str, Tuple[str, ...]] = {
+        "related_tables": ("related_table_summary",),
+        "decomposition": ("text_to_sql_query", "interpretation_query"),
+        "first_sql": ("first_sql_query",),
+        "similarity_sql": ("similarity_sql",),
+        "final_sql": ("final_sql_query",),
+        "sql_result": ("sql_result",),
+        "answer": ("answer",),
+    }
+    SQL_STAGES = ("related_tables", "decomposition", "first_sql", "similarity_sql", "final_sql")
+    # skipped decomposition uses the original query, skipped similarity_sql makes the first SQL final
+    SKIPPABLE_STAGES = ("decomposition", "similarity_sql")
+
+    text_to_sql_query = _StageOutput("decomposition")  # used for sql generation
+    interpretation_query = _StageOutput("decomposition")  # used for final response generation
+    related_table_summary = _StageOutput("related_tables")  # Table information related to the query
+    first_sql_query = _StageOutput("first_sql")  # SQL query generated from the query for the first time
+    similarity_sql = _StageOutput("similarity_sql")
+    final_sql_query = _StageOutput("final_sql")  # SQL query generated from the query using the similarity SQL
+
+    def __init__(
+            self,
+            db_instance: DBInstance,
+            query: str,
+            llm: Union[LLM, AsyncLLM],
+            need_similarity_sql: bool = True,
+            auto_run: bool = True,
+            result_format: Literal["tuples", "csv", "markdown"] = "tuples",
+            result_max_rows: int = 50,
+            summarize_above: Optional[int] = None,
+            summary_fetch_limit: int = 100_000,
+            lazy: bool = False,
+            skip_stages: Iterable[str] = (),
+            precomputed: Optional[Dict[str, Any]] = None,
+            budget: Optional[UsageBudget] = None,
+    ):
+        """
+        :param auto_run: run every stage in the constructor. Set it to False and await `arun()` to
+            drive the workflow from an event loop instead, which an AsyncLLM requires.
+        :param lazy: run nothing in the constructor; each stage runs, after its dependencies, the
+            first time one of its outputs is read, e.g. `final_sql_query` never pays for the answer.
+        :param skip_stages: stages in SKIPPABLE_STAGES that are never run.
+        :param precomputed: stage outputs by attribute name (see STAGE_OUTPUTS), a stage whose
+            outputs are all given is not run.
+        :param result_format: how the SQL result is written into the answer prompt, "tuples" is
+            str() of the row tuples, "csv" and "markdown" are compact tables built from a columnar
+            result of at most `result_max_rows` rows.
+        :param summarize_above: results with more rows are replaced in the answer prompt by a local
+            summary (column statistics, top values, first and last rows), so the answer costs about
+            the same whatever the result size. None always sends the result itself.
+        :param summary_fetch_limit: rows fetched at most to compute the summary.
+        :param budget: spend limits of this question. Over budget, the similarity SQL pass is skipped
+            and the SQL prompts keep only the most related tables that fit `max_prompt_tokens`.
+        """
+        if isinstance(llm, AsyncLLM) and (auto_run or lazy):
+            raise ValueError("An AsyncLLM cannot run the stages synchronously, pass auto_run=False and lazy=False "
+                             "and await arun() or aget_response(), or pass an LLM")
+        self.lazy = lazy
+        self._done_stages = set()
+        self._active_stages = set()
+        self._stage_lock = threading.RLock()
+        self._timings: Dict[str, float] = {}
         self.db_instance = db_instance
         self.llm = llm  # init LLM model
         self.origin_query = query
-        self.text_to_sql_query: Optional[str] = None  # used for sql generation
-        self.interpretation_query: Optional[str] = None  # used for final response generation
-        self.related_table_summary: Optional[str] = None  # Table information related to the query
-        self.first_sql_query: Optional[str] = None  # SQL query generated from the query for the first time
-        self.final_sql_query: Optional[str] = None  # SQL query generated from the query using the similarity SQL
-        self.similarity_sql: Optional[List[str]] = None  #
         self.need_similarity_sql = need_similarity_sql
+        self.result_format = result_format
+        self.result_max_rows = result_max_rows
+        self.summarize_above = summarize_above
+        self.summary_fetch_limit = summary_fetch_limit
+        self.sql_result_table: Optional[ColumnarResult] = None  # columnar result, unless result_format is "tuples"
         self._sql_result: Optional[str] = None
-        self.__init_basic_info()
+        self.sql_execution_time: Optional[float] = None  # seconds spent executing the final SQL
+        self.answer: Optional[str] = None
+        self._scheduler: Optional[StageScheduler] = None
+        self.budget = budget
+        self.usage = UsageLedger()  # tokens and cost of this question, by stage
+
+        self.skip_stages = set(skip_stages)
+        if not need_similarity_sql:
+            self.skip_stages.add("similarity_sql")
+        unknown = self.skip_stages - set(self.SKIPPABLE_STAGES)
+        if unknown:
+            raise ValueError(f"Stages {unknown} cannot be skipped, skippable stages are {self.SKIPPABLE_STAGES}")
+        if "decomposition" in self.skip_stages:
+            self.text_to_sql_query = self.interpretation_query = self.origin_query
+        self._done_stages.update(self.skip_stages)
+        self.inject(precomputed or {})
+
+        if auto_run and not lazy:
+            self.__init_basic_info()
 
     def __init_basic_info(self):
+        self._build_scheduler().run()
+
+    def inject(self, precomputed: Dict[str, Any]):
+        """Set stage outputs computed elsewhere, by attribute name; stages whose outputs are all given are done."""
+        outputs = {name for names in self.STAGE_OUTPUTS.values() for name in names}
+        unknown = set(precomputed) - outputs
+        if unknown:
+            raise ValueError(f"Unknown stage outputs {unknown}, expected some of {sorted(outputs)}")
+        for name, value in precomputed.items():
+            setattr(self, "_sql_result" if name == "sql_result" else name, value)
+        for stage, names in self.STAGE_OUTPUTS.items():
+            if all(name in precomputed for name in names):
+                self._done_stages.add(stage)
+
+    def _stage_funcs(self, name: str):
+        """(sync, async) callables of a stage."""
+        return {
+            "related_tables": (self._related_tables_stage, self._arelated_tables_stage),
+            "decomposition": (self._decomposition_stage, self._adecomposition_stage),
+            "first_sql": (self._get_first_sql_query, self._aget_first_sql_query),
+            "similarity_sql": (self._similarity_sql_stage, self._asimilarity_sql_stage),
+            "final_sql": (self._get_final_sql_query, self._aget_final_sql_query),
+            "sql_result": (lambda: self.sql_result, self.aget_sql_result),
+            "answer": (self._answer_stage, self._aanswer_stage),
+        }[name]
+
+    def _tracked(self, name: str, func):
+        """
+        Wrap a stage callable so the stage is marked active, traced and its LLM usage recorded
+        while it runs, and done after.
+        """
+        def run():
+            self._active_stages.add(name)
+            try:
+                with span(f"stage.{name}"), self._usage_scope(name):
+                    result = func()
+            finally:
+                self._active_stages.discard(name)
+            self._done_stages.add(name)
+            return result
+
+        async def arun():
+            self._active_stages.add(name)
+            try:
+                with span(f"stage.{name}"), self._usage_scope(name):
+                    result = await func()
+            finally:
+                self._active_stages.discard(name)
+            self._done_stages.add(name)
+            return result
+
+        return arun if asyncio.iscoroutinefunction(func) else run
+
+    def _usage_scope(self, stage: str):
+        """Record LLM calls under `stage` in this question's ledger and in the DBInstance's."""
+        return usage_scope(self.usage, getattr(self.db_instance, "usage", None), stage=stage)
+
+    def run_stage(self, name: str) -> None:
+        """Run a stage, after its dependencies, unless it has run, been skipped or been precomputed."""
+        if name not in self.STAGES:
+            raise ValueError(f"Unknown stage {name}, stages are {list(self.STAGES)}")
+        with self._stage_lock:
+            if name in self._done_stages:
+                return
+            for dep in self.STAGES[name]:
+                self.run_stage(dep)
+            start = time.perf_counter()
+            try:
+                self._tracked(name, self._stage_funcs(name)[0])()
+            finally:
+                self._timings[name] = time.perf_counter() - start
+
+    async def arun_stage(self, name: str) -> None:
+        """Awaitable run_stage."""
+        if name not in self.STAGES:
+            raise ValueError(f"Unknown stage {name}, stages are {list(self.STAGES)}")
+        if name in self._done_stages:
+            return
+        for dep in self.STAGES[name]:
+            await self.arun_stage(dep)
+        if name in self._done_stages:
+            return
+        start = time.perf_counter()
+        try:
+            await self._tracked(name, self._stage_funcs(name)[1])()
+        finally:
+            self._timings[name] = time.perf_counter() - start
+
+    def _build_scheduler(self) -> StageScheduler:
+        """
+        Stage dependency graph. Table retrieval and query decomposition only need the
+        original query, so they overlap; the SQL stages follow the critical path.
+        Stages already done, skipped or precomputed are left out.
+        """
+        scheduler = StageScheduler()
+        needed = set()
+
+        def need(name):
+            if name not in self._done_stages and name not in needed:
+                needed.add(name)
+                for dep in self.STAGES[name]:
+                    need(dep)
+
+        need("final_sql")
+        pending = [name for name in self.SQL_STAGES if name in needed]
+        for name in pending:
+            func, afunc = self._stage_funcs(name)
+            scheduler.add_stage(
+                name,
+                self._tracked(name, func),
+                deps=[dep for dep in self.STAGES[name] if dep in pending],
+                afunc=self._tracked(name, afunc),
+            )
+        self._scheduler = scheduler
+        return scheduler
+
+    @property
+    def stage_timings(self) -> Dict[str, float]:
+        """Seconds spent per stage, with the wall/serial time of the last run."""
+        report = dict(self._timings)
+        if self._scheduler:
+            report.update(self._scheduler.report())
+        return report
+
+    def _related_tables_stage(self):
         self.related_table_summary = self._get_related_table_summary()
-        query_response = PreRetrievalService.decompose_for_sql(self.origin_query)
+        return self.related_table_summary
+
+    async def _arelated_tables_stage(self):
+        self.related_table_summary = await self._aget_related_table_summary()
+        return self.related_table_summary
+
+    def _decomposition_stage(self):
+        query_response = PreRetrievalService.decompose_for_sql(self.origin_query, self.llm)
         self.text_to_sql_query = query_response.text_to_sql_query
         self.interpretation_query = query_response.interpretation_query
-        self.first_sql_query = self._get_first_sql_query()
-        self.similarity_sql = self._get_similarity_query()
-        self.final_sql_query = self._get_final_sql_query()
+        return query_response
+
+    async def _adecomposition_stage(self):
+        query_response = await PreRetrievalService.adecompose_for_sql(self.origin_query, self.async_llm)
+        self.text_to_sql_query = query_response.text_to_sql_query
+        self.interpretation_query = query_response.interpretation_query
+        return query_response
+
+    def _similarity_sql_stage(self):
+        self.similarity_sql = self._get_similarity_query() if self._allow_final_pass(self._first_sql_prompt()) else []
+        return self.similarity_sql
+
+    async def _asimilarity_sql_stage(self):
+        if self._allow_final_pass(self._first_sql_prompt()):
+            self.similarity_sql = await self._aget_similarity_query()
+        else:
+            self.similarity_sql = []
+        return self.similarity_sql
+
+    def _allow_final_pass(self, prompt: str) -> bool:
+        """
+        Whether the similarity SQL pass fits the budget, together with the answer call still to come.
+        If not, it is skipped and the first SQL is final. The final SQL prompt is estimated from the
+        first one, and the answer prompt without the SQL result, which is not known yet. Each call is
+        priced with the model its stage is routed to.
+        """
+        if self.budget is None:
+            return True
+        calls = [(self._stage_model("final_sql"), estimate_tokens(prompt), COMPLETION_TOKENS_ESTIMATE)]
+        if "answer" not in self._done_stages:
+            answer_prompt = NL2SQLPrompts.SQL_QUERY_ANSWER.format(
+                question=self.origin_query, sql_query=self.first_sql_query, sql_result="")
+            calls.append((self._stage_model("answer"), estimate_tokens(answer_prompt), COMPLETION_TOKENS_ESTIMATE))
+        if self.budget.allows_calls(self.usage, calls):
+            return True
+        logger.info(f"usage budget reached after {self.usage.total_tokens} tokens, skipping the similarity SQL pass")
+        self.skip_stages.add("similarity_sql")
+        return False
+
+    def _stage_model(self, stage: str) -> str:
+        """Model the LLM calls of `stage` go to: the router's first candidate, the default model without a router."""
+        router = getattr(self.llm, "router", None)
+        endpoints = router.candidates(stage) if router is not None else []
+        return endpoints[0].model if endpoints else LLMModel.Default.value
+
+    @property
+    def async_llm(self) -> AsyncLLM:
+        """The AsyncLLM used by the awaitable stages."""
+        if isinstance(self.llm, AsyncLLM):
+            return self.llm
+        return self.llm.async_llm
+
+    async def arun(self) -> "NL2SQLWorkflow":
+        """Awaitable counterpart of the constructor pipeline, returns the workflow itself."""
+        await self._build_scheduler().arun()
+        return self
 
     def _get_related_table_summary(self, top_k: int = 8):
         """Get related chunks based on the query."""
         return self.db_instance.summary_index.search_for_chunks(self.origin_query, top_k=top_k)
 
+    async def _aget_related_table_summary(self, top_k: int = 8):
+        return await self.db_instance.summary_index.asearch_for_chunks(self.origin_query, top_k=top_k)
+
+    def _fit_tables(self, build_prompt) -> str:
+        """
+        Prompt built by `build_prompt(tables)` from the related tables. Past the budget's
+        max_prompt_tokens, the least related tables are dropped until it fits, one is always kept.
+        """
+        tables = self.related_table_summary
+        prompt = build_prompt(tables)
+        limit = self.budget.max_prompt_tokens if self.budget else None
+        if limit is None or not isinstance(tables, list):
+            return prompt
+        kept = len(tables)
+        while kept > 1 and estimate_tokens(prompt) > limit:
+            kept -= 1
+            prompt = build_prompt(tables[:kept])
+        if kept < len(tables):
+            logger.info(f"prompt over {limit} tokens, keeping {kept} of {len(tables)} related tables")
+        return prompt
+
+    def _first_sql_prompt(self) -> str:
+        return self._fit_tables(lambda tables: NL2SQLPrompts.GENERATE_SQL.format(
+            table_info=tables, input=self.text_to_sql_query, dialect=self.db_instance.db.dialect))
+
     def _get_first_sql_query(self):
         """Get SQL query from the given query."""
-        if self.text_to_sql_query:
-            return self.text_to_sql_query
+        if self.first_sql_query:
+            return self.first_sql_query
 
-        sql_res = self.llm.get_structured_response(
-            NL2SQLPrompts.GENERATE_SQL.format(table_info=self.related_table_summary, input=self.text_to_sql_query, dialect=self.db_instance.db.dialect),
-            response_format=GenerateSQLResponse,
-        )
+        sql_res = self.llm.get_structured_response(self._first_sql_prompt(), response_format=GenerateSQLResponse)
+
+        self.first_sql_query = sql_res["sql"]
+        logging.info(f"sql_query:{self.first_sql_query}")
+        return self.first_sql_query
+
+    async def _aget_first_sql_query(self):
+        if self.first_sql_query:
+            return self.first_sql_query
+
+        sql_res = await self.async_llm.get_structured_response(self._first_sql_prompt(), response_format=GenerateSQLResponse)
 
         self.first_sql_query = sql_res["sql"]
         logging.info(f"sql_query:{self.first_sql_query}")
@@ -57,30 +398,74 @@ class NL2SQLWorkflow:
         """Get similar SQL query based on the query."""
         return self.db_instance.sql_example_index.search_for_chunks(self.first_sql_query, top_k)
 
+    async def _aget_similarity_query(self, top_k: int = 5) -> List[str]:
+        return await self.db_instance.sql_example_index.asearch_for_chunks(self.first_sql_query, top_k)
+
+    def _final_sql_prompt(self) -> str:
+        return self._fit_tables(lambda tables: NL2SQLPrompts.GENERATE_SQL_WITH_SIMILARITY_SQL.format(
+            dialect=self.db_instance.db.dialect,
+            table_info=tables,
+            input=self.text_to_sql_query,
+            similarity_sql=self.similarity_sql,
+        ))
+
     def _get_final_sql_query(self):
         """Get the final SQL query."""
         if self.final_sql_query:
             return self.final_sql_query
 
-        if not self.need_similarity_sql:
+        prompt = None if "similarity_sql" in self.skip_stages else self._final_sql_prompt()
+        if prompt is None or not self._allow_final_pass(prompt):
             self.final_sql_query = self.first_sql_query
             return self.final_sql_query
 
-        self.final_sql_query = self.llm.get_structured_response(
-            NL2SQLPrompts.GENERATE_SQL_WITH_SIMILARITY_SQL.format(
-                dialect=self.db_instance.db.dialect,
-                table_info=self.related_table_summary,
-                input=self.text_to_sql_query,
-                similarity_sql=self.similarity_sql,
-            ), response_format=GenerateSQLResponse,
-        )["sql"]
+        self.final_sql_query = self.llm.get_structured_response(prompt, response_format=GenerateSQLResponse)["sql"]
+
+        return self.final_sql_query
+
+    async def _aget_final_sql_query(self):
+        if self.final_sql_query:
+            return self.final_sql_query
+
+        prompt = None if "similarity_sql" in self.skip_stages else self._final_sql_prompt()
+        if prompt is None or not self._allow_final_pass(prompt):
+            self.final_sql_query = self.first_sql_query
+            return self.final_sql_query
+
+        response = await self.async_llm.get_structured_response(prompt, response_format=GenerateSQLResponse)
+        self.final_sql_query = response["sql"]
 
         return self.final_sql_query
 
     def _get_sql_result(self):
         """executing the sql query."""
+        start = time.perf_counter()
+        try:
+            return self._execute_sql()
+        finally:
+            self.sql_execution_time = time.perf_counter() - start
+
+    def _execute_sql(self):
         logging.info(f"sql_query:{self.final_sql_query}")
-        return self.db_instance.db.run_no_throw(self.final_sql_query)
+        if self.result_format == "tuples" and self.summarize_above is None:
+            return self.db_instance.db.run_no_throw(self.final_sql_query)
+        max_rows = self.result_max_rows if self.summarize_above is None else self.summary_fetch_limit
+        try:
+            self.sql_result_table = self.db_instance.db.run_columnar(self.final_sql_query, max_rows=max_rows)
+        except SQLAlchemyError as e:
+            return f"Error: {e}"
+        return self._render_sql_result(self.sql_result_table)
+
+    def _render_sql_result(self, result: ColumnarResult) -> str:
+        """Text of the result for the answer prompt, summarized above `summarize_above` rows."""
+        if self.summarize_above is not None and result.num_rows > self.summarize_above:
+            logger.info(f"summarizing a result of {result.num_rows} rows for the answer prompt")
+            return result.summary()
+        if self.result_format == "tuples":
+            return result.to_tuples(max_string_length=self.db_instance.db._max_string_length)
+        if self.result_format == "csv":
+            return result.to_csv(max_rows=self.result_max_rows)
+        return result.to_markdown(max_rows=self.result_max_rows)
 
     @property
     def sql_result(self):
@@ -88,10 +473,85 @@ class NL2SQLWorkflow:
             self._sql_result = self._get_sql_result()
         return self._sql_result
 
+    async def aget_sql_result(self):
+        """Execute the final SQL query in a worker thread so the event loop keeps serving."""
+        if not self._sql_result:
+            self._sql_result = await asyncio.to_thread(self._get_sql_result)
+        return self._sql_result
+
+    def _answer_prompt(self) -> str:
+        return NL2SQLPrompts.SQL_QUERY_ANSWER.format(question=self.origin_query, sql_query=self.final_sql_query, sql_result=self.sql_result)
+
+    def _answer_stage(self):
+        self.answer = self.llm.get_response(query=self._answer_prompt())
+        return self.answer
+
+    async def _aanswer_stage(self):
+        self.answer = await self.async_llm.get_response(query=self._answer_prompt())
+        return self.answer
+
     def get_response(self):
         """Get response based on the query."""
-        llm_res = self.llm.get_response(
-            query=NL2SQLPrompts.SQL_QUERY_ANSWER.format(question=self.origin_query, sql_query=self.final_sql_query, sql_result=self.sql_result))
+        self.run_stage("answer")
+        return self.answer
+
+    async def aget_response(self):
+        """Awaitable get_response, runs the pipeline first if it has not been run yet."""
+        if "final_sql" not in self._done_stages:
+            await self.arun()
+        await self.arun_stage("answer")
+        return self.answer
+
+    def _metadata_event(self) -> AnswerEvent:
+        is_error = self.sql_result.startswith("Error:")
+        metadata = AnswerMetadata(
+            sql=self.final_sql_query,
+            sql_result=None if is_error else self.sql_result,
+            error=self.sql_result if is_error else None,
+            row_count=None if self.sql_result_table is None else self.sql_result_table.num_rows,
+            execution_time=self.sql_execution_time,
+            stage_timings=self.stage_timings,
+            usage=self.usage.summary(),
+        )
+        return AnswerEvent(type="metadata", metadata=metadata)
+
+    def stream_response(self) -> Iterator[AnswerEvent]:
+        """
+        Streamed get_response: first a "metadata" event with the final SQL and its execution,
+        then one "token" event per piece of the answer as the LLM produces it. Runs the pipeline
+        first if it has not been run yet; `answer` is set once the stream is consumed.
+        """
+        self.run_stage("sql_result")
+        yield self._metadata_event()
+        tokens = self.llm.stream_response(query=self._answer_prompt())
+        pieces = []
+        while True:
+            # the scope cannot stay open across yields, it is entered around each read of the stream
+            with self._usage_scope("answer"):
+                token = next(tokens, None)
+            if token is None:
+                break
+            pieces.append(token)
+            yield AnswerEvent(type="token", token=token)
+        self._finish_streamed_answer(pieces)
+
+    def _finish_streamed_answer(self, pieces: List[str]):
+        self.answer = "".join(pieces)
+        self._done_stages.add("answer")
 
-        return llm_res
-    
\ No newline at end of file
+    async def astream_response(self) -> AsyncIterator[AnswerEvent]:
+        """Async stream_response, runs the pipeline first if it has not been run yet."""
+        if "final_sql" not in self._done_stages:
+            await self.arun()
+        await self.arun_stage("sql_result")
+        yield self._metadata_event()
+        tokens = self.async_llm.stream_response(query=self._answer_prompt())
+        pieces = []
+        while True:
+            with self._usage_scope("answer"):
+                token = await anext(tokens, None)
+            if token is None:
+                break
+            pieces.append(token)
+            yield AnswerEvent(type="token", token=token)
+        self._finish_streamed_answer(pieces)
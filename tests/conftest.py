@@ -0,0 +1,168 @@
+"""Fakes shared by the offline tests: LLMs, vector indexes, embeddings, a database instance and an OpenAI server."""
+import hashlib
+import json
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from py_nl2sql.constants.type import DecomposeQueryResponse
+from py_nl2sql.relational_database.sql_database import SQLDatabase
+from py_nl2sql.utilities.usage import record_usage
+
+
+class FakeLLM:
+    """Sync LLM answering every stage of the workflow, optionally reporting `usage` (prompt, completion) tokens per call."""
+
+    def __init__(self, usage=None):
+        self.usage = usage
+        self.calls = []
+        self.prompts = []
+
+    def _record(self, query):
+        self.prompts.append(query)
+        if self.usage:
+            record_usage("gpt-4o-mini", SimpleNamespace(prompt_tokens=self.usage[0], completion_tokens=self.usage[1]))
+
+    def get_structured_response(self, query, response_format):
+        self._record(query)
+        if response_format is DecomposeQueryResponse:
+            self.calls.append("decomposition")
+            return {"text_to_sql_query": "count rows", "interpretation_query": "how many rows"}
+        self.calls.append("sql")
+        return {"sql": "SELECT COUNT(*) FROM a"}
+
+    def get_response(self, query):
+        self._record(query)
+        self.calls.append("answer")
+        return "3"
+
+
+class FakeAsyncLLM:
+    """Async LLM for the batch runner, decomposing a question into itself and failing on queries containing `fail_on`."""
+
+    def __init__(self, fail_on=None):
+        self.calls = 0
+        self.fail_on = fail_on
+
+    @property
+    def async_llm(self):
+        return self
+
+    async def get_structured_response(self, query, response_format):
+        self.calls += 1
+        if response_format is DecomposeQueryResponse:
+            question = query.rsplit("\n", 1)[-1]
+            return {"text_to_sql_query": query, "interpretation_query": question}
+        if self.fail_on and self.fail_on in query:
+            raise RuntimeError("rate limited")
+        return {"sql": "SELECT COUNT(*) FROM a"}
+
+
+class FakeIndex:
+    """Vector index returning the same chunks for every query, counting searches and batch sizes."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.searches = 0
+        self.batches = []
+
+    def search_for_chunks(self, query, top_k=3):
+        self.searches += 1
+        return self.chunks
+
+    async def asearch_for_chunks(self, query, top_k=3):
+        return self.search_for_chunks(query, top_k)
+
+    def search_many(self, queries, top_k=3):
+        self.batches.append(len(queries))
+        return [self.chunks for _ in queries]
+
+
+class FakeEmbeddings:
+    """Deterministic embeddings derived from the text hash, counting embedded texts and model calls."""
+    model = "fake-embedding"
+
+    def __init__(self, dim: int = 8):
+        self.dim = dim
+        self.embedded = 0
+        self.calls = 0
+
+    def _vector(self, text):
+        seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).random(self.dim).tolist()
+
+    def embed_documents(self, texts, **kwargs):
+        self.calls += 1
+        self.embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.embedded += 1
+        return self._vector(text)
+
+
+def fake_openai_handler(request: httpx.Request) -> httpx.Response:
+    """OpenAI API answering chat completions, streamed or not, and embeddings."""
+    body = json.loads(request.content)
+    if request.url.path.endswith("/embeddings"):
+        data = [{"object": "embedding", "index": i, "embedding": [0.1 * i, 0.2]} for i in range(len(body["input"]))]
+        return httpx.Response(200, json={"object": "list", "data": data, "model": body["model"],
+                                         "usage": {"prompt_tokens": 1, "total_tokens": 1}})
+    usage = {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+    if body.get("stream"):
+        chunk = {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 0, "model": body["model"]}
+        events = [{**chunk, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                  for piece in ("hel", "lo")]
+        events.append({**chunk, "choices": [], "usage": usage})
+        content = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=content.encode())
+    content = '{"sql": "SELECT 1"}' if "response_format" in body else "hello"
+    return httpx.Response(200, json={
+        "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": body["model"],
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": usage,
+    })
+
+
+@pytest.fixture
+def fake_openai():
+    return fake_openai_handler
+
+
+@pytest.fixture
+def make_llm():
+    return FakeLLM
+
+
+@pytest.fixture
+def make_async_llm():
+    return FakeAsyncLLM
+
+
+@pytest.fixture
+def make_index():
+    return FakeIndex
+
+
+@pytest.fixture
+def fake_embeddings():
+    return FakeEmbeddings()
+
+
+@pytest.fixture
+def make_instance():
+    """Factory of DBInstance stand-ins on an in-memory SQLite table `a` of three rows."""
+
+    def make():
+        db = SQLDatabase.from_uri("sqlite://")
+        with db.engine.begin() as connection:
+            connection.execute(text("CREATE TABLE a (x INTEGER)"))
+            connection.execute(text("INSERT INTO a VALUES (1), (2), (3)"))
+        return SimpleNamespace(db=db, summary_index=FakeIndex(["a(x)"]),
+                               sql_example_index=FakeIndex(["SELECT x FROM a"]))
+
+    return make
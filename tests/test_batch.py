@@ -0,0 +1,33 @@
+import json
+
+from py_nl2sql.batch import NL2SQLBatch
+
+
+def test_batch_is_ordered_batched_and_resumable(tmp_path, make_async_llm, make_instance):
+    instance = make_instance()
+    questions = [f"question {i}" for i in range(10)]
+    checkpoint = str(tmp_path / "results.jsonl")
+
+    llm = make_async_llm(fail_on="question 7")
+    results = list(NL2SQLBatch(instance, llm, chunk_size=4, checkpoint_path=checkpoint).run(questions))
+    assert [result.index for result in results] == list(range(10))
+    assert instance.summary_index.batches == [4, 4, 2]
+    assert results[0].sql == "SELECT COUNT(*) FROM a"
+    assert results[7].error == "RuntimeError: rate limited" and results[7].sql is None
+    with open(checkpoint) as f:
+        assert len([json.loads(line) for line in f]) == 10
+
+    llm = make_async_llm()
+    resumed = list(NL2SQLBatch(instance, llm, chunk_size=4, checkpoint_path=checkpoint).run(questions))
+    assert [result.sql for result in resumed] == ["SELECT COUNT(*) FROM a"] * 10
+    assert llm.calls == 3  # only question 7: decomposition, first and final SQL
+
+
+def test_resume_ignores_results_of_other_questions(tmp_path, make_async_llm, make_instance):
+    checkpoint = str(tmp_path / "results.jsonl")
+    list(NL2SQLBatch(make_instance(), make_async_llm(), checkpoint_path=checkpoint).run(["q0", "q1", "q2"]))
+
+    llm = make_async_llm()
+    results = list(NL2SQLBatch(make_instance(), llm, checkpoint_path=checkpoint).run(["q0", "q2", "q1"]))
+    assert [(result.index, result.question) for result in results] == [(0, "q0"), (1, "q2"), (2, "q1")]
+    assert llm.calls == 6  # q2 and q1 moved, they are asked again
@@ -0,0 +1,60 @@
+import time
+
+from py_nl2sql.utilities.cache import LRUCache, SQLiteCache, TieredCache, make_cache_key
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats.evictions == 1
+
+
+def test_lru_ttl_expires():
+    cache = LRUCache(ttl=0.05)
+    cache.set("a", 1)
+    time.sleep(0.1)
+
+    assert cache.get("a") is None
+
+
+def test_lru_values_are_not_shared_with_callers():
+    cache = LRUCache()
+    response = {"sql": "SELECT 1", "tables": ["a"]}
+    cache.set("a", response)
+    response["tables"].append("b")
+    cache.get("a")["sql"] = "DROP TABLE a"
+
+    assert cache.get("a") == {"sql": "SELECT 1", "tables": ["a"]}
+
+
+def test_sqlite_cache_survives_reopen(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    key = make_cache_key("gpt-4o-mini", "prompt", {"type": "object"})
+    SQLiteCache(path).set(key, {"sql": "SELECT 1"})
+
+    assert SQLiteCache(path).get(key) == {"sql": "SELECT 1"}
+
+
+def test_sqlite_cache_size_eviction(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), max_entries=10)
+    for i in range(30):
+        cache.set(str(i), i)
+
+    assert cache.get("29") == 29
+    assert cache.get("0") is None
+
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    memory, disk = LRUCache(), SQLiteCache(str(tmp_path / "cache.sqlite"))
+    disk.set("k", "v")
+    cache = TieredCache([memory, disk])
+
+    assert cache.get("k") == "v"
+    assert memory.get("k") == "v"
+    assert cache.stats.hits == 1
@@ -0,0 +1,48 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from py_nl2sql.db_instance import DBInstance
+from py_nl2sql.utilities.usage import UsageLedger
+
+
+def bare_instance(generate):
+    """DBInstance without a database connection, generating sample SQL with `generate(table_info)`."""
+    instance = object.__new__(DBInstance.__wrapped__)
+    instance.db_name = "test"
+    instance.usage = UsageLedger()
+    instance.sample_sql_concurrency = 4
+    instance.sample_sql_errors = {}
+    instance.db = SimpleNamespace(get_table_info=lambda tables: tables[0])
+    instance._generate_sample_sql = generate
+    return instance
+
+
+def test_sample_sql_keeps_table_order_and_reports_failures():
+    in_flight = peak = 0
+    lock = threading.Lock()
+
+    def generate(table):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.05 if table == "t0" else 0.01)  # the first table finishes last
+        with lock:
+            in_flight -= 1
+        if table == "t3":
+            raise RuntimeError("rate limited")
+        return [f"SELECT * FROM {table}"]
+
+    instance = bare_instance(generate)
+    tables = [f"t{i}" for i in range(8)]
+    examples = instance._generate_sql_examples(tables)
+
+    assert list(examples) == tables
+    assert examples["t0"] == ["SELECT * FROM t0"] and examples["t3"] == []
+    assert instance.sample_sql_errors == {"t3": "RuntimeError: rate limited"}
+    assert 1 < peak <= 4
+
+    instance._generate_sample_sql = lambda table: [f"SELECT 1 FROM {table}"]
+    instance._generate_sql_examples(["t3"])
+    assert instance.sample_sql_errors == {}
@@ -0,0 +1,22 @@
+import asyncio
+
+from py_nl2sql.models.http import shared_async_http_client, shared_http_client
+from py_nl2sql.models.llm import LLM, AsyncLLM
+
+
+def test_llms_share_one_pool_and_cache_embeddings():
+    first, second = LLM(api_key="sk-test"), LLM(api_key="sk-test")
+    assert first.http_client is second.http_client is shared_http_client()
+    assert first.embedding_model is first.embedding_model
+
+
+def test_async_clients_are_per_event_loop():
+    llm = AsyncLLM(api_key="sk-test")
+
+    async def clients():
+        return llm.client, llm.client, shared_async_http_client()
+
+    one, same, pool = asyncio.run(clients())
+    other, _, other_pool = asyncio.run(clients())
+    assert one is same
+    assert one is not other and pool is not other_pool
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import time
+
+import httpx
+
+from py_nl2sql.models.llm import AsyncLLM, LLM
+from py_nl2sql.models.rate_limit import AIMDConcurrency, RateLimiter, TokenBucket
+
+
+def test_token_bucket_makes_later_reservations_wait():
+    bucket = TokenBucket(rate_per_minute=60)
+    assert bucket.reserve(60) == 0.0
+    assert 0.9 < bucket.reserve(1) <= 1.0
+    bucket.refund(1)
+    assert bucket.reserve(1) <= 1.0
+
+
+def test_throttled_requests_are_retried_and_lower_concurrency(fake_openai):
+    responses = iter([429, 503])
+
+    def flaky(request):
+        status = next(responses, 200)
+        if status != 200:
+            return httpx.Response(status, json={"error": {"message": "slow down"}})
+        return fake_openai(request)
+
+    limiter = RateLimiter(concurrency=AIMDConcurrency(initial=8), base_delay=0.01)
+    llm = LLM(api_key="sk-test", http_client=httpx.Client(transport=httpx.MockTransport(flaky)), rate_limiter=limiter)
+    assert llm.get_response("hi") == "hello"
+    assert int(limiter.concurrency.limit) == 4
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_concurrency_limit_holds_across_tasks(fake_openai):
+    limiter = RateLimiter(concurrency=AIMDConcurrency(initial=2, maximum=2))
+    peak = in_flight = 0
+
+    async def handler(request):
+        nonlocal peak, in_flight
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return fake_openai(request)
+
+    llm = AsyncLLM(api_key="sk-test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+                   rate_limiter=limiter)
+
+    async def ask():
+        return await asyncio.gather(*(llm.get_response(f"q{i}") for i in range(6)))
+
+    assert asyncio.run(ask()) == ["hello"] * 6
+    assert peak == 2
+
+
+def test_failed_attempts_refund_tokens_and_retry_after_is_capped(fake_openai):
+    responses = iter([429, 429])
+
+    def throttled(request):
+        if next(responses, 200) != 200:
+            return httpx.Response(429, headers={"retry-after": "3600"}, json={"error": {"message": "slow down"}})
+        return fake_openai(request)
+
+    limiter = RateLimiter(tokens_per_minute=10_000, max_delay=0.05)
+    llm = LLM(api_key="sk-test", http_client=httpx.Client(transport=httpx.MockTransport(throttled)), rate_limiter=limiter)
+    start = time.perf_counter()
+    assert llm.get_response("hi") == "hello"
+    assert time.perf_counter() - start < 1
+    # only the successful attempt is charged, settled to the 2 tokens it reported
+    assert limiter.tokens._level > 10_000 - 10
+
+
+def test_waiting_for_tokens_holds_no_concurrency_slot():
+    limiter = RateLimiter(tokens_per_minute=120, concurrency=AIMDConcurrency(initial=1, maximum=1))
+    limiter.tokens.reserve(120)  # empty bucket, the next token arrives in 0.5s
+    caller = threading.Thread(target=limiter.call, args=(lambda: None, 1))
+    caller.start()
+    time.sleep(0.2)
+    assert limiter.concurrency.in_flight == 0
+    limiter.call(lambda: None)  # no tokens needed, not blocked by the waiting caller
+    caller.join()
@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+import httpx
+
+from py_nl2sql.constants.type import GenerateSQLResponse
+from py_nl2sql.models.llm import LLM
+from py_nl2sql.models.replay import Cassette, RecordTransport, replaying_clients
+
+
+def test_record_then_replay_offline(tmp_path, fake_openai):
+    path = str(tmp_path / "cassette.jsonl")
+    transport = RecordTransport(Cassette(path), transport=httpx.MockTransport(fake_openai),
+                                async_transport=httpx.MockTransport(fake_openai))
+    llm = LLM(api_key="sk-test", http_client=httpx.Client(transport=transport),
+              http_async_client=httpx.AsyncClient(transport=transport))
+    assert llm.get_response("hi") == "hello"
+    assert llm.get_structured_response("sql?", GenerateSQLResponse) == {"sql": "SELECT 1"}
+    assert asyncio.run(llm.async_llm.get_response("hi async")) == "hello"
+    assert len(Cassette(path)) == 3
+
+    replay = LLM(api_key="sk-test", **replaying_clients(path, latency=0.05))
+    start = time.perf_counter()
+    assert replay.get_structured_response("sql?", GenerateSQLResponse) == {"sql": "SELECT 1"}
+    assert replay.get_response("hi") == "hello"
+    assert time.perf_counter() - start >= 0.1
+    assert asyncio.run(replay.async_llm.get_response("hi async")) == "hello"
+
+
+def test_record_then_replay_embeddings(tmp_path, fake_openai):
+    path = str(tmp_path / "cassette.jsonl")
+    transport = RecordTransport(Cassette(path), transport=httpx.MockTransport(fake_openai),
+                                async_transport=httpx.MockTransport(fake_openai))
+    kwargs = {"api_key": "sk-test", "embedding_kwargs": {"check_embedding_ctx_length": False}}
+    llm = LLM(http_client=httpx.Client(transport=transport), http_async_client=httpx.AsyncClient(transport=transport),
+              **kwargs)
+    documents = llm.embedding_model.embed_documents(["a", "b"])
+    query = asyncio.run(llm.embedding_model.aembed_query("c"))
+    assert len(Cassette(path)) == 2
+
+    replay = LLM(**replaying_clients(path), **kwargs)
+    assert replay.embedding_model.embed_documents(["a", "b"]) == documents
+    assert asyncio.run(replay.embedding_model.aembed_query("c")) == query
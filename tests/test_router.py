@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import httpx
+import openai
+import pytest
+
+from py_nl2sql.models.llm import AsyncLLM, LLM
+from py_nl2sql.models.rate_limit import RateLimiter
+from py_nl2sql.models.router import Endpoint, ModelRouter
+from py_nl2sql.utilities.usage import usage_scope
+
+
+def failing(fake_openai, *models):
+    seen = []
+
+    def handler(request):
+        model = json.loads(request.content)["model"]
+        seen.append(model)
+        if model in models:
+            return httpx.Response(500, json={"error": {"message": "down"}})
+        return fake_openai(request)
+
+    return handler, seen
+
+
+def test_failed_endpoint_falls_back_and_is_taken_out(fake_openai):
+    handler, seen = failing(fake_openai, "gpt-4o-mini")
+    router = ModelRouter({"default": ["gpt-4o-mini", "moonshot-v1-8k"]}, failure_threshold=2)
+    llm = LLM(api_key="sk-test", http_client=httpx.Client(transport=httpx.MockTransport(handler)),
+              rate_limiter=RateLimiter(base_delay=0.01), router=router)
+    assert llm.get_response("q1") == "hello"
+    assert seen == ["gpt-4o-mini", "moonshot-v1-8k"]
+    assert llm.get_response("q2") == "hello"
+    assert llm.get_response("q3") == "hello"
+    assert seen[-1] == "moonshot-v1-8k" and seen.count("gpt-4o-mini") == 2
+    assert router.report()["openai/gpt-4o-mini"]["healthy"] is False
+
+
+def test_stage_routes_and_fastest_endpoint(fake_openai):
+    handler, seen = failing(fake_openai)
+    router = ModelRouter({"final_sql": [Endpoint("gpt-4o")], "default": ["gpt-4o-mini"]})
+    llm = AsyncLLM(api_key="sk-test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+                   router=router)
+
+    async def ask():
+        with usage_scope(stage="final_sql"):
+            await llm.get_response("sql")
+        await llm.get_response("other", stage="answer")
+
+    asyncio.run(ask())
+    assert seen == ["gpt-4o", "gpt-4o-mini"]
+
+    router = ModelRouter({"default": ["slow", "fast"]})
+    router.record(Endpoint("slow"), 2.0, ok=True)
+    router.record(Endpoint("fast"), 0.5, ok=True)
+    assert [endpoint.model for endpoint in router.candidates("answer")] == ["fast", "slow"]
+
+
+def test_client_errors_do_not_fail_over(fake_openai):
+    seen = []
+
+    def handler(request):
+        seen.append(json.loads(request.content)["model"])
+        return httpx.Response(400, json={"error": {"message": "prompt too long"}})
+
+    router = ModelRouter({"default": ["gpt-4o-mini", "moonshot-v1-8k"]})
+    llm = LLM(api_key="sk-test", http_client=httpx.Client(transport=httpx.MockTransport(handler)), router=router)
+    for _ in range(3):
+        with pytest.raises(openai.BadRequestError):
+            llm.get_response("q" * 10)
+    assert seen == ["gpt-4o-mini"] * 3
+    assert all(stats["healthy"] and stats["error_rate"] == 0 for stats in router.report().values())
+
+
+def test_latency_excludes_retry_waits(fake_openai):
+    responses = iter([429])
+
+    def handler(request):
+        if next(responses, 200) != 200:
+            return httpx.Response(429, headers={"retry-after": "0.3"}, json={"error": {"message": "slow down"}})
+        return fake_openai(request)
+
+    router = ModelRouter({"default": ["gpt-4o-mini"]})
+    llm = LLM(api_key="sk-test", http_client=httpx.Client(transport=httpx.MockTransport(handler)), router=router)
+    assert llm.get_response("q") == "hello"
+    assert router.report()["openai/gpt-4o-mini"]["latency"] < 0.2
@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import pytest
+
+from py_nl2sql.utilities.scheduler import StageScheduler
+
+
+def _sleep(seconds, value):
+    def stage():
+        time.sleep(seconds)
+        return value
+    return stage
+
+
+def test_independent_stages_overlap():
+    scheduler = StageScheduler()
+    scheduler.add_stage("a", _sleep(0.2, 1))
+    scheduler.add_stage("b", _sleep(0.2, 2))
+    scheduler.add_stage("c", lambda: scheduler.results["a"] + scheduler.results["b"], deps=["a", "b"])
+
+    results = scheduler.run()
+    report = scheduler.report()
+
+    assert results["c"] == 3
+    assert report["wall_time"] < report["serial_time"]
+
+
+def test_arun_respects_dependencies():
+    order = []
+    scheduler = StageScheduler()
+
+    async def first():
+        await asyncio.sleep(0.05)
+        order.append("first")
+
+    async def second():
+        order.append("second")
+
+    scheduler.add_stage("second", lambda: None, deps=["first"], afunc=second)
+    scheduler.add_stage("first", lambda: None, afunc=first)
+    asyncio.run(scheduler.arun())
+
+    assert order == ["first", "second"]
+
+
+def test_cycle_is_rejected():
+    scheduler = StageScheduler()
+    scheduler.add_stage("a", lambda: None, deps=["b"])
+    scheduler.add_stage("b", lambda: None, deps=["a"])
+
+    with pytest.raises(ValueError):
+        scheduler.run()
@@ -0,0 +1,188 @@
+import logging
+import time
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from sqlalchemy import event, text
+
+from py_nl2sql.relational_database.columnar import ColumnarResult
+from py_nl2sql.relational_database.sql_database import SQLDatabase
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'test.db'}"
+    db = SQLDatabase.from_uri(uri)
+    with db.engine.begin() as connection:
+        for i in range(5):
+            connection.execute(text(f"CREATE TABLE t{i} (id INTEGER PRIMARY KEY, name TEXT, value_{i} REAL)"))
+            connection.execute(text(f"CREATE INDEX idx_t{i}_name ON t{i} (name)"))
+            connection.execute(text(f"INSERT INTO t{i} (name, value_{i}) VALUES ('a', 1.5), ('b', 2.5)"))
+    return SQLDatabase.from_uri(uri)
+
+
+def test_bulk_summaries_match_per_table(sqlite_db):
+    template = "{table_name}({columns})"
+    per_table = {name: sqlite_db._parse_table_summary(template, name) for name in sqlite_db.get_usable_table_names()}
+
+    assert sqlite_db.get_table_summaries() == per_table
+    assert per_table["t1"] == "t1(id, name, value_1), and index keys: idx_t1_name(`name`) "
+
+
+def test_schema_snapshot_reused_until_catalog_changes(sqlite_db, tmp_path):
+    snapshot_path = str(tmp_path / "schema.pkl")
+    db = SQLDatabase(sqlite_db.engine, snapshot_path=snapshot_path)
+    summaries = db.get_table_summaries()
+
+    restarted = SQLDatabase(sqlite_db.engine, snapshot_path=snapshot_path, lazy_table_reflection=True)
+    assert restarted._table_summaries == summaries
+    assert set(restarted._metadata.tables) == {f"t{i}" for i in range(5)}
+
+    with sqlite_db.engine.begin() as connection:
+        connection.execute(text("ALTER TABLE t0 ADD COLUMN extra TEXT"))
+    changed = SQLDatabase(sqlite_db.engine, snapshot_path=snapshot_path)
+    assert changed._table_summaries is None
+    assert "extra" in changed.get_table_summaries()["t0"]
+
+
+def test_lazy_reflection_is_bounded(sqlite_db):
+    db = SQLDatabase(sqlite_db.engine, lazy_table_reflection=True, max_reflected_tables=2,
+                     sample_rows_in_table_info=0)
+    assert not db._metadata.tables
+
+    info = db.get_table_info(["t3", "t1"])
+    assert "CREATE TABLE t1" in info and "CREATE TABLE t3" in info
+    assert "t0" not in info
+
+    db.get_table_info(["t0"])
+    assert len(db._reflected_tables) == 2
+    assert "t0" in db._reflected_tables
+
+
+def test_table_info_does_not_depend_on_request_order(sqlite_db):
+    lazy = SQLDatabase(sqlite_db.engine, lazy_table_reflection=True)
+    expected = sqlite_db.get_table_info(["t0", "t1", "t2"])
+    assert expected.index("CREATE TABLE t0") < expected.index("CREATE TABLE t1") < expected.index("CREATE TABLE t2")
+    for db in (sqlite_db, lazy):
+        assert db.get_table_info(["t2", "t0", "t1"]) == expected
+
+
+def test_table_info_blocks_are_cached_until_forgotten(sqlite_db):
+    statements = []
+    event.listen(sqlite_db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    info = sqlite_db.get_table_info(["t0", "t1", "t2"])
+    assert "3 rows from t2 table:\nid\tname\tvalue_2\n1\ta\t1.5" in info
+    fetched = len(statements)
+    assert fetched == 3
+
+    assert sqlite_db.get_table_info(["t0", "t1", "t2"]) == info
+    assert len(statements) == fetched
+
+    sqlite_db.forget_tables(["t1"])
+    assert sqlite_db.get_table_info(["t0", "t1", "t2"]) == info
+    assert len(statements) > fetched
+
+
+def test_stream_batches_and_caps(sqlite_db, caplog):
+    with sqlite_db.engine.begin() as connection:
+        connection.execute(text("CREATE TABLE big (id INTEGER PRIMARY KEY, payload TEXT)"))
+        connection.execute(text("INSERT INTO big (payload) VALUES " + ", ".join(["('xxxxxxxxxx')"] * 250)))
+
+    batches = list(sqlite_db.stream("SELECT id, payload FROM big ORDER BY id", batch_size=100))
+    assert [len(batch) for batch in batches] == [100, 100, 50]
+    assert batches[2][-1].id == 250
+
+    with caplog.at_level(logging.WARNING):
+        capped = list(sqlite_db.stream("SELECT id FROM big", batch_size=100, max_rows=200))
+        assert sum(len(batch) for batch in capped) == 200
+        assert "stream stopped after 200 rows" in caplog.text
+        caplog.clear()
+        assert sum(len(batch) for batch in sqlite_db.stream("SELECT id FROM big", batch_size=100, max_rows=250)) == 250
+        assert not caplog.text
+
+    capped = list(sqlite_db.stream("SELECT id FROM big", batch_size=100, max_rows=120))
+    assert sum(len(batch) for batch in capped) == 120
+
+    capped = list(sqlite_db.stream("SELECT payload FROM big", batch_size=100, max_bytes=95))
+    assert sum(len(batch) for batch in capped) == 10
+
+    cursor = sqlite_db.run("SELECT id FROM big ORDER BY id", fetch="cursor")
+    assert len(cursor.fetchall()) == 250
+
+
+def test_statements_run_through_stream_are_committed(sqlite_db):
+    assert list(sqlite_db.stream("INSERT INTO t0 (name) VALUES ('c')")) == []
+    sqlite_db.run_columnar("INSERT INTO t0 (name) VALUES ('d')")
+    assert sqlite_db.run("SELECT name FROM t0 ORDER BY id", fetch="cursor").fetchall() == [("a",), ("b",), ("c",), ("d",)]
+
+
+def test_run_columnar(sqlite_db):
+    result = sqlite_db.run_columnar("SELECT id, name, value_0 FROM t0 ORDER BY id")
+    assert result.columns == ["id", "name", "value_0"]
+    assert result.column("id").dtype == np.int64
+    assert result.column("value_0").tolist() == [1.5, 2.5]
+    assert not result.truncated
+    assert result.to_csv() == "id,name,value_0\n1,a,1.5\n2,b,2.5\n"
+
+    wide = ColumnarResult.from_batches(["n"], [[(2 ** 64 - 1,), (1,)]])
+    assert wide.column("n").dtype == object and wide.to_tuples() == str([(2 ** 64 - 1,), (1,)])
+
+    truncated = sqlite_db.run_columnar("SELECT id, name, value_0 FROM t0 ORDER BY id", max_rows=1)
+    assert truncated.truncated and len(truncated) == 1
+    assert truncated.to_markdown(max_columns=2) == (
+        "| id | name |\n|---|---|\n| 1 | a |\n... (showing 1 of 1+ rows, showing 2 of 3 columns)\n"
+    )
+
+
+def test_summary_size_does_not_grow_with_rows():
+    def make(rows):
+        batch = [(i, float(i % 7), f"city_{i % 3}", None if i % 10 == 0 else "x") for i in range(rows)]
+        return ColumnarResult.from_batches(["id", "amount", "city", "flag"], [batch])
+
+    small, large = make(1_000).summary(), make(100_000).summary()
+    assert abs(len(large) - len(small)) < 100
+    assert "amount: numeric, min=0, max=6" in large
+    assert "city: 3 distinct, nulls=0, top 3: 'city_0' (33334)" in large
+    assert "flag: 1 distinct, nulls=10000" in large
+    assert "Last 5 rows:\nid,amount,city,flag\n99995," in large
+
+
+def test_rendered_rows_keep_database_values(sqlite_db):
+    query = "SELECT id, value_0 FROM t0 UNION ALL SELECT 3, NULL UNION ALL SELECT 4, 7 ORDER BY id"
+    result = sqlite_db.run_columnar(query)
+    assert result.to_tuples() == sqlite_db.run_no_throw(query)
+    assert "value_0: numeric, min=1.5, max=7" in result.summary()
+
+    decimals = ColumnarResult.from_batches(["price"], [[(Decimal("1.10"),), (None,)]])
+    assert decimals.to_tuples() == str([(Decimal("1.10"),), (None,)])
+    assert decimals.slice(1).to_csv() == 'price\n""\n'
+    assert "price: numeric, min=1.1, max=1.1, mean=1.1" in decimals.summary()
+
+
+def test_slow_sample_rows_are_stopped_by_the_database(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'slow.db'}"
+    db = SQLDatabase.from_uri(uri)
+    with db.engine.begin() as connection:
+        connection.execute(text("CREATE TABLE fast (x INTEGER)"))
+        connection.execute(text("INSERT INTO fast WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100) SELECT x FROM c"))
+        # scans 100^5 rows without ever finding one
+        connection.execute(text("CREATE VIEW slow AS SELECT a.x AS x FROM fast a, fast b, fast c, fast d, fast e "
+                                "WHERE a.x + b.x + c.x + d.x + e.x < 0"))
+    db = SQLDatabase.from_uri(uri, view_support=True, sample_rows_timeout=0.2)
+
+    for tables in (["slow"], ["fast", "slow"]):
+        start = time.perf_counter()
+        info = db.get_table_info(tables)
+        assert time.perf_counter() - start < 2
+        assert "3 rows from slow table:\nx\n" in info
+        # the query was interrupted, not abandoned: its connection is back in the pool
+        time.sleep(0.1)
+        assert db.engine.pool.checkedout() == 0
+
+    # queued behind two slow tables, the fast one still gets its own timeout
+    with db.engine.begin() as connection:
+        connection.execute(text("CREATE VIEW slower AS SELECT x FROM slow"))
+    db = SQLDatabase.from_uri(uri, view_support=True, sample_rows_timeout=0.2, sample_rows_concurrency=1)
+    assert "3 rows from fast table:\nx\n1\n2\n3" in db.get_table_info(["slow", "slower", "fast"])
@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+
+from py_nl2sql.models.llm import LLM
+from py_nl2sql.utilities.cache import LRUCache
+from py_nl2sql.workflow import NL2SQLWorkflow
+
+
+def make_llm(fake_openai, cache=None):
+    transport = httpx.MockTransport(fake_openai)
+    return LLM(api_key="sk-test", cache=cache, http_client=httpx.Client(transport=transport),
+               http_async_client=httpx.AsyncClient(transport=transport))
+
+
+def test_workflow_streams_metadata_then_tokens(fake_openai, make_instance):
+    llm = make_llm(fake_openai)
+    workflow = NL2SQLWorkflow(make_instance(), "how many rows?", llm, precomputed={"final_sql_query": "SELECT COUNT(*) FROM a"})
+    events = list(workflow.stream_response())
+    assert [event.type for event in events] == ["metadata", "token", "token"]
+    assert events[0].metadata.sql == "SELECT COUNT(*) FROM a" and events[0].metadata.sql_result == "[(3,)]"
+    assert "".join(event.token for event in events[1:]) == "hello"
+
+    async def collect():
+        return [event async for event in workflow.astream_response()]
+
+    events = asyncio.run(collect())
+    assert [event.type for event in events] == ["metadata", "token", "token"]
+    assert workflow.usage.by_stage["answer"].calls == 2
+
+
+
+def test_stream_runs_the_pipeline_first(fake_openai, make_instance):
+    llm = make_llm(fake_openai)
+    workflow = NL2SQLWorkflow(make_instance(), "one?", llm, auto_run=False, skip_stages=("decomposition",),
+                              need_similarity_sql=False)
+    events = list(workflow.stream_response())
+    assert events[0].metadata.sql == "SELECT 1" and events[0].metadata.sql_result == "[(1,)]"
+    assert workflow.answer == "hello" and workflow.get_response() == "hello"
+
+    workflow = NL2SQLWorkflow(make_instance(), "one?", llm, auto_run=False, skip_stages=("decomposition",),
+                              need_similarity_sql=False)
+
+    async def collect():
+        return [event async for event in workflow.astream_response()]
+
+    assert asyncio.run(collect())[0].metadata.sql == "SELECT 1"
+    assert workflow.answer == "hello"
+
+def test_cache_hit_yields_the_answer_once(fake_openai):
+    cache = LRUCache()
+    llm = make_llm(fake_openai, cache)
+    assert list(llm.stream_response("hi")) == ["hel", "lo"]
+    assert list(llm.stream_response("hi")) == ["hello"]
+
+    async def collect():
+        return [token async for token in llm.async_llm.stream_response("hi")]
+
+    assert asyncio.run(collect()) == ["hello"]
+
+
+def test_stream_closed_early_is_not_cached(fake_openai):
+    cache = LRUCache()
+    llm = make_llm(fake_openai, cache)
+    tokens = llm.stream_response("hi")
+    assert next(tokens) == "hel"
+    tokens.close()
+    assert len(cache) == 0
+
+    async def first_token():
+        tokens = llm.async_llm.stream_response("hi")
+        token = await anext(tokens)
+        await tokens.aclose()
+        return token
+
+    assert asyncio.run(first_token()) == "hel"
+    assert len(cache) == 0
+    assert list(llm.stream_response("hi")) == ["hel", "lo"]
@@ -0,0 +1,52 @@
+import pytest
+
+from py_nl2sql.utilities.tracing import BaseExporter, HistogramExporter, disable_tracing, enable_tracing, span
+from py_nl2sql.workflow import NL2SQLWorkflow
+
+
+class CollectingExporter(BaseExporter):
+    def __init__(self):
+        self.spans = []
+
+    def on_end(self, span):
+        self.spans.append(span)
+
+
+@pytest.fixture
+def exporters():
+    collecting, histograms = CollectingExporter(), HistogramExporter()
+    enable_tracing(collecting, histograms)
+    yield collecting, histograms
+    disable_tracing()
+
+
+def test_span_is_noop_without_exporters():
+    with span("anything") as current:
+        assert current is None
+
+
+def test_workflow_stages_and_db_calls_are_traced(exporters, make_llm, make_instance):
+    collecting, histograms = exporters
+    with span("request"):
+        NL2SQLWorkflow(make_instance(), "how many rows?", make_llm()).get_response()
+
+    names = {item.name for item in collecting.spans}
+    assert {f"stage.{name}" for name in NL2SQLWorkflow.STAGES} <= names
+    assert "db.execute" in names
+    request = next(item for item in collecting.spans if item.name == "request")
+    # stages run on the scheduler's pool still nest under the caller's span
+    assert next(item for item in collecting.spans if item.name == "stage.first_sql").parent is request
+    assert next(item for item in collecting.spans if item.name == "db.execute").parent.name == "stage.sql_result"
+
+    assert histograms.snapshot()["stage.answer"]["count"] == 1
+    text = histograms.prometheus_text()
+    assert 'nl2sql_span_duration_seconds_count{span="stage.answer"} 1' in text
+    assert 'nl2sql_span_duration_seconds_bucket{span="request",le="+Inf"} 1' in text
+
+
+def test_errors_are_counted(exporters):
+    _, histograms = exporters
+    with pytest.raises(ValueError):
+        with span("failing"):
+            raise ValueError("boom")
+    assert histograms.snapshot()["failing"]["errors"] == 1
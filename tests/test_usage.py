@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+from py_nl2sql.models.router import ModelRouter
+from py_nl2sql.utilities.usage import UsageBudget, UsageLedger, record_usage, usage_scope
+from py_nl2sql.workflow import NL2SQLWorkflow
+
+
+def test_ledger_prices_by_model_prefix():
+    ledger = UsageLedger()
+    with usage_scope(ledger, stage="answer"):
+        record_usage("gpt-4o-2024-08-06", SimpleNamespace(prompt_tokens=1_000_000, completion_tokens=0))
+    record_usage("gpt-4o", SimpleNamespace(prompt_tokens=1, completion_tokens=1))  # outside any scope
+    assert ledger.total.calls == 1
+    assert ledger.cost == 2.5
+    assert ledger.summary()["by_stage"]["answer"]["prompt_tokens"] == 1_000_000
+
+
+def test_workflow_usage_by_stage_question_and_instance(make_llm, make_instance):
+    llm, instance = make_llm(usage=(100, 10)), make_instance()
+    instance.usage = UsageLedger()
+    workflow = NL2SQLWorkflow(instance, "how many rows?", llm)
+    workflow.get_response()
+
+    assert set(workflow.usage.by_stage) == {"decomposition", "first_sql", "final_sql", "answer"}
+    assert workflow.usage.total_tokens == 4 * 110
+    assert instance.usage.total_tokens == 4 * 110
+    assert workflow._metadata_event().metadata.usage["total_tokens"] == 440
+
+
+def test_budget_skips_similarity_pass_and_trims_tables(make_llm, make_index, make_instance):
+    llm, instance = make_llm(usage=(100, 10)), make_instance()
+    workflow = NL2SQLWorkflow(instance, "how many rows?", llm, budget=UsageBudget(max_tokens=250))
+    assert "similarity_sql" in workflow.skip_stages
+    assert workflow.final_sql_query == workflow.first_sql_query
+    assert instance.sql_example_index.searches == 0
+    assert llm.calls == ["decomposition", "sql"]
+
+    llm, instance = make_llm(usage=(100, 10)), make_instance()
+    instance.summary_index = make_index(["a(x)", "b(" + "y, " * 2000 + ")"])
+    NL2SQLWorkflow(instance, "how many rows?", llm, budget=UsageBudget(max_prompt_tokens=1000))
+    assert all("y, y" not in prompt for prompt in llm.prompts[1:])
+
+
+def test_budget_counts_completions_and_the_answer_call(make_llm, make_instance):
+    llm = make_llm(usage=(300, 100))
+    workflow = NL2SQLWorkflow(make_instance(), "how many rows?", llm, budget=UsageBudget(max_tokens=1200))
+    assert workflow.get_response() == "3"
+    assert "similarity_sql" in workflow.skip_stages
+    assert workflow.usage.total_tokens <= 1200
+
+
+def test_budget_prices_the_models_the_router_picks(make_llm, make_instance):
+    budget = UsageBudget(max_cost=0.001)  # the remaining calls fit on gpt-4o-mini, not on gpt-4o
+    workflow = NL2SQLWorkflow(make_instance(), "how many rows?", make_llm(), budget=budget)
+    assert "similarity_sql" not in workflow.skip_stages
+
+    for stage in ("final_sql", "answer"):
+        llm = make_llm()
+        llm.router = ModelRouter({stage: ["gpt-4o"], "default": ["gpt-4o-mini"]})
+        workflow = NL2SQLWorkflow(make_instance(), "how many rows?", llm, budget=budget)
+        assert "similarity_sql" in workflow.skip_stages
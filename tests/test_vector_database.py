@@ -0,0 +1,140 @@
+import numpy as np
+
+from py_nl2sql.vector_database.base_vectordb import BaseVectorDB
+from py_nl2sql.vector_database.embedding_store import CachedEmbeddings, EmbeddingStore
+from py_nl2sql.vector_database.faiss_wrapper import FaissWrapper
+
+
+CHUNKS = [f"table_{i}(id, name, value_{i})" for i in range(20)]
+
+
+def test_embedding_store_only_embeds_misses(tmp_path, fake_embeddings):
+    embedding = fake_embeddings
+    FaissWrapper(text_chunks=CHUNKS, embedding=embedding, embedding_store=EmbeddingStore(str(tmp_path)))
+    assert embedding.embedded == len(CHUNKS)
+
+    # a fresh store instance reads the persisted files, as after a restart
+    wrapper = FaissWrapper(text_chunks=CHUNKS + ["new_table(id)"], embedding=embedding,
+                           embedding_store=EmbeddingStore(str(tmp_path)))
+    assert embedding.embedded == len(CHUNKS) + 1
+    assert wrapper.search_for_chunks(CHUNKS[3], top_k=1) == [CHUNKS[3]]
+    assert embedding.embedded == len(CHUNKS) + 1
+
+
+def test_cached_embeddings_match_model(tmp_path, fake_embeddings):
+    embedding = fake_embeddings
+    cached = CachedEmbeddings(embedding, EmbeddingStore(str(tmp_path)))
+    cached.embed_documents(CHUNKS[:5])
+
+    np.testing.assert_allclose(cached.embed_documents(CHUNKS[:5]), embedding.embed_documents(CHUNKS[:5]), rtol=1e-6)
+
+
+def test_torn_append_does_not_shift_rows(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+    store.put_many(["a", "b"], vectors[:2])
+    # an append interrupted after its vectors, and one in the middle of its key line
+    with open(tmp_path / EmbeddingStore.VECTORS_FILE, "ab") as f:
+        f.write(np.ones((2, 4), dtype=np.float32).tobytes())
+    with open(tmp_path / EmbeddingStore.KEYS_FILE, "ab") as f:
+        f.write(b"orph")
+
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many(["c"], vectors[2:])
+    reopened = EmbeddingStore(str(tmp_path))
+    assert len(reopened) == 3
+    for actual, expected in zip(reopened.get_many(["a", "b", "c"]), vectors):
+        np.testing.assert_array_equal(actual, expected)
+
+
+def test_save_and_open_bundle(tmp_path, fake_embeddings):
+    embedding = fake_embeddings
+    FaissWrapper(text_chunks=CHUNKS, embedding=embedding).save(str(tmp_path / "bundle"))
+    embedded = embedding.embedded
+
+    for mmap in (False, True):
+        wrapper = FaissWrapper.open(str(tmp_path / "bundle"), embedding=embedding, mmap=mmap)
+        assert wrapper.text_chunks == CHUNKS
+        assert wrapper.search_for_chunks(CHUNKS[7], top_k=1) == [CHUNKS[7]]
+    assert embedding.embedded == embedded + 2
+
+
+def test_search_cache_is_bounded(fake_embeddings):
+    wrapper = FaissWrapper(text_chunks=CHUNKS, embedding=fake_embeddings, cache_size=4)
+    for chunk in CHUNKS:
+        wrapper.search_for_chunks(chunk, top_k=2)
+    wrapper.search_for_chunks(CHUNKS[-1], top_k=2)
+
+    assert len(wrapper.cache) == 4
+    assert wrapper.cache_stats.hits == 1
+    assert wrapper.cache_stats.evictions == len(CHUNKS) - 4
+
+
+def test_search_many_embeds_once_and_matches_single_search(fake_embeddings):
+    embedding = fake_embeddings
+    wrapper = FaissWrapper(text_chunks=CHUNKS, embedding=embedding)
+    queries = CHUNKS[:5]
+    expected = [wrapper.search_for_chunks(query, top_k=3) for query in queries]
+    embedded, calls = embedding.embedded, embedding.calls
+
+    assert wrapper.search_many(queries, top_k=3) == expected
+    assert embedding.embedded == embedded + len(queries)
+    assert embedding.calls == calls + 1
+    assert wrapper.search_many([], top_k=3) == []
+
+
+def test_update_chunks_only_embeds_added(fake_embeddings):
+    embedding = fake_embeddings
+    wrapper = FaissWrapper(text_chunks=list(CHUNKS), embedding=embedding)
+    embedded = embedding.embedded
+
+    wrapper.update_chunks(removed_chunks=[CHUNKS[2]], added_chunks=["table_2(id, renamed)"])
+
+    assert embedding.embedded == embedded + 1
+    assert CHUNKS[2] not in wrapper.text_chunks
+    assert wrapper.index.ntotal == len(CHUNKS)
+    assert wrapper.search_for_chunks("table_2(id, renamed)", top_k=1) == ["table_2(id, renamed)"]
+    assert wrapper.search_for_chunks(CHUNKS[5], top_k=1) == [CHUNKS[5]]
+
+
+def test_search_during_update_uses_one_version(fake_embeddings):
+    wrapper = FaissWrapper(text_chunks=list(CHUNKS), embedding=fake_embeddings)
+    cache_set = wrapper.cache.set
+
+    def update_mid_search(key, value):
+        # the index is replaced between the faiss search and the lookup of its chunks
+        wrapper.cache.set = cache_set
+        wrapper.update_chunks(removed_chunks=CHUNKS[1:])
+        cache_set(key, value)
+
+    wrapper.cache.set = update_mid_search
+    assert wrapper.search_for_chunks(CHUNKS[12], top_k=1) == [CHUNKS[12]]
+    assert wrapper.text_chunks == CHUNKS[:1]
+    assert wrapper.search_for_chunks(CHUNKS[12], top_k=1) == [CHUNKS[0]]
+
+
+class KeywordIndex(BaseVectorDB):
+    """A store written against the original interface, without batched search."""
+
+    def __init__(self, text_chunks):
+        self.text_chunks = text_chunks
+
+    def get_chunks_embedding(self, text_chunks):
+        raise AssertionError("not embedded")
+
+    def get_query_embedding(self, query):
+        raise AssertionError("not embedded")
+
+    def search_for_chunks(self, query, top_k=3):
+        return [chunk for chunk in self.text_chunks if query in chunk][:top_k]
+
+    def search_for_scores(self, query, top_k):
+        return []
+
+    def search_for_chunks_with_scores(self, query, top_k):
+        return []
+
+
+def test_subclasses_without_batched_search_still_work():
+    index = KeywordIndex(CHUNKS)
+    assert index.search_many(["table_1(", "table_2("], top_k=1) == [[CHUNKS[1]], [CHUNKS[2]]]
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from py_nl2sql.models.llm import AsyncLLM
+from py_nl2sql.workflow import NL2SQLWorkflow
+
+
+def test_lazy_workflow_runs_only_what_is_read(make_llm, make_instance):
+    llm, instance = make_llm(), make_instance()
+    workflow = NL2SQLWorkflow(instance, "how many rows?", llm, lazy=True)
+    assert llm.calls == []
+
+    assert workflow.final_sql_query == "SELECT COUNT(*) FROM a"
+    assert llm.calls == ["decomposition", "sql", "sql"]
+    assert instance.sql_example_index.searches == 1
+
+    assert workflow.get_response() == "3"
+    assert workflow.get_response() == "3"
+    assert llm.calls == ["decomposition", "sql", "sql", "answer"]
+    assert set(workflow.stage_timings) == set(NL2SQLWorkflow.STAGES)
+
+
+
+def test_reading_a_stage_computed_by_another_thread_waits_for_it(make_llm, make_instance):
+    started, release = threading.Event(), threading.Event()
+    llm = make_llm()
+    get_structured_response = llm.get_structured_response
+
+    def slow_response(query, response_format):
+        started.set()
+        release.wait(5)
+        return get_structured_response(query, response_format)
+
+    llm.get_structured_response = slow_response
+    workflow = NL2SQLWorkflow(make_instance(), "how many rows?", llm, lazy=True, skip_stages=["decomposition"])
+    computing = threading.Thread(target=lambda: workflow.first_sql_query)
+    computing.start()
+    started.wait(5)
+    threading.Timer(0.1, release.set).start()
+
+    assert workflow.first_sql_query == "SELECT COUNT(*) FROM a"
+    computing.join()
+    assert llm.calls == ["sql"]
+
+def test_skipped_and_precomputed_stages_are_not_run(make_llm, make_instance):
+    llm, instance = make_llm(), make_instance()
+    workflow = NL2SQLWorkflow(instance, "how many rows?", llm, skip_stages=["decomposition", "similarity_sql"])
+    assert llm.calls == ["sql"]
+    assert workflow.text_to_sql_query == "how many rows?"
+    assert workflow.final_sql_query == workflow.first_sql_query
+    assert instance.sql_example_index.searches == 0
+
+    llm, instance = make_llm(), make_instance()
+    workflow = NL2SQLWorkflow(instance, "how many rows?", llm, precomputed={"final_sql_query": "SELECT SUM(x) FROM a"})
+    assert llm.calls == []
+    assert workflow.sql_result == "[(6,)]"
+    assert instance.summary_index.searches == 0
+
+
+def test_async_llm_requires_awaiting_the_workflow(make_instance):
+    llm = AsyncLLM(api_key="sk-test")
+    with pytest.raises(ValueError, match="auto_run=False"):
+        NL2SQLWorkflow(make_instance(), "how many rows?", llm)
+    with pytest.raises(ValueError, match="auto_run=False"):
+        NL2SQLWorkflow(make_instance(), "how many rows?", llm, auto_run=False, lazy=True)
+
+    assert NL2SQLWorkflow(make_instance(), "how many rows?", llm, auto_run=False).async_llm is llm